@@ -0,0 +1,40 @@
+"""
+Base class for the async variants of the LLM endpoints.
+
+DRF's APIView cannot run async handlers, so these are plain Django views
+that parse the JSON body themselves and return JsonResponse. While waiting
+on the model they hold no thread, only a coroutine on the event loop; ORM
+work goes through sync_to_async.
+"""
+import json
+import logging
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from .llm import LLMError, LLMUnavailable
+
+logger = logging.getLogger(__name__)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncAPIView(View):
+    """Async JSON endpoint; handlers read the parsed body from request.data"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.content_type == 'application/json':
+            try:
+                request.data = json.loads(request.body or b'{}')
+            except ValueError:
+                return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+        else:
+            request.data = request.POST
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except LLMUnavailable as e:
+            return JsonResponse({'error': str(e)}, status=503)
+        except LLMError as e:
+            return JsonResponse({'error': str(e)}, status=502)
+        except Exception as e:
+            logger.exception("Error in %s", type(self).__name__)
+            return JsonResponse({'error': str(e)}, status=500)
@@ -0,0 +1,44 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide worker pool, creating it on first use"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'BACKGROUND_WORKERS', 2),
+                    thread_name_prefix='background',
+                )
+    return _executor
+
+
+def submit(fn, *args, **kwargs):
+    """
+    Run fn(*args, **kwargs) on the worker pool.
+
+    Each task gets fresh database connections so a long-running worker never
+    reuses a connection that the database has already closed.
+    """
+    def run():
+        close_old_connections()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            logger.exception("Background task %s failed", getattr(fn, '__name__', fn))
+            raise
+        finally:
+            close_old_connections()
+
+    return get_executor().submit(run)
@@ -0,0 +1,40 @@
+"""
+Conditional GET for API views.
+
+A view decorated with conditional(version) answers If-None-Match and
+If-Modified-Since with 304 before it loads or serializes anything.
+version(request, *args, **kwargs) returns (tag, last_modified) for what the
+view would serve, from a cheap query on timestamps, or None when there is
+nothing to serve (the view then answers, with its 404 say). The ETag hashes
+the tag with the host and query string, which the response also depends on
+(absolute file URLs, fields=, cursor=).
+"""
+import hashlib
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+
+def conditional(version, last_modified=True):
+    """
+    Decorator for an APIView method. Pass last_modified=False where the
+    newest timestamp does not cover every change, e.g. a list rows can be
+    deleted from.
+    """
+    def current(request, *args, **kwargs):
+        # Both validators come from one query
+        if not hasattr(request, '_conditional_version'):
+            request._conditional_version = version(request, *args, **kwargs)
+        return request._conditional_version
+
+    def etag(request, *args, **kwargs):
+        found = current(request, *args, **kwargs)
+        if found is None:
+            return None
+        parts = [str(found[0]), request.get_host(), request.META.get('QUERY_STRING', '')]
+        return hashlib.sha256('\x1f'.join(parts).encode()).hexdigest()
+
+    def modified(request, *args, **kwargs):
+        found = current(request, *args, **kwargs)
+        return None if found is None else found[1]
+
+    return method_decorator(condition(etag_func=etag, last_modified_func=modified if last_modified else None))
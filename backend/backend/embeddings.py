@@ -0,0 +1,161 @@
+import logging
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+EMBEDDING_DIMENSION = 384
+
+# 'torch' is the stock SentenceTransformer; the ONNX backends run the same
+# model on ONNX Runtime, 'onnx-int8' with the int8-quantized weights.
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+_models = {}
+_lock = threading.Lock()
+
+
+def _load(backend):
+    # Imported here so that processes which never embed do not pay for torch
+    from sentence_transformers import SentenceTransformer
+
+    if backend == 'torch':
+        return SentenceTransformer(MODEL_NAME)
+    if backend == 'onnx':
+        return SentenceTransformer(MODEL_NAME, backend='onnx')
+    if backend == 'onnx-int8':
+        return SentenceTransformer(
+            MODEL_NAME,
+            backend='onnx',
+            model_kwargs={'file_name': settings.EMBEDDING_ONNX_INT8_FILE},
+        )
+    raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+
+
+def get_embedder(backend=None):
+    """
+    Return the process-wide embedding model, loading it on first use.
+
+    Every module shares this instance, so the model is held in memory once
+    per process. The backend defaults to settings.EMBEDDING_BACKEND.
+    """
+    backend = backend or settings.EMBEDDING_BACKEND
+    model = _models.get(backend)
+    if model is None:
+        with _lock:
+            model = _models.get(backend)
+            if model is None:
+                logger.info("Loading %s embedding model (%s backend)...", MODEL_NAME, backend)
+                model = _load(backend)
+                _models[backend] = model
+                logger.info("Embedding model loaded.")
+    return model
+
+
+def embedding_version(backend=None):
+    """
+    The model, backend and dimension embeddings are made with; stored
+    embeddings only compare with new ones of the same version.
+    """
+    backend = backend or settings.EMBEDDING_BACKEND
+    weights = settings.EMBEDDING_ONNX_INT8_FILE if backend == 'onnx-int8' else ''
+    return ":".join([MODEL_NAME, backend, weights, str(EMBEDDING_DIMENSION)])
+
+
+def normalise_query(text):
+    """Canonical form of a query for caching: case, spacing and trailing punctuation ignored"""
+    return re.sub(r'\s+', ' ', text or '').strip().rstrip('?!.').strip().lower()
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings keyed by normalised text, with an
+    optional SQLite tier that survives restarts.
+    """
+
+    def __init__(self, max_entries, disk_path=None):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS query_embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+            self._db.commit()
+
+    def get(self, key):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+            if self._db is not None:
+                row = self._db.execute("SELECT vector FROM query_embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32).tolist()
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+            self.misses += 1
+            return None
+
+    def put(self, key, vector):
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (key, vector) VALUES (?, ?)",
+                    (key, np.asarray(vector, dtype=np.float32).tobytes()),
+                )
+                self._db.commit()
+
+    def _remember(self, key, vector):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+_query_cache = None
+
+
+def get_query_cache():
+    global _query_cache
+    if _query_cache is None:
+        with _lock:
+            if _query_cache is None:
+                _query_cache = QueryEmbeddingCache(
+                    settings.QUERY_EMBEDDING_CACHE_SIZE,
+                    settings.QUERY_EMBEDDING_CACHE_PATH or None,
+                )
+    return _query_cache
+
+
+def encode_query(text):
+    """Embedding of a search query as a list, served from the query cache when possible"""
+    key = f"{settings.EMBEDDING_BACKEND}:{normalise_query(text)}"
+    cache = get_query_cache()
+    vector = cache.get(key)
+    if vector is None:
+        vector = get_embedder().encode(text).tolist()
+        cache.put(key, vector)
+    return vector
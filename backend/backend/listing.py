@@ -0,0 +1,89 @@
+"""
+Opt-in keyset pagination and sparse fieldsets for list endpoints.
+
+Requests without page_size or cursor get the whole list as before. With
+either, the list is paginated by cursor (next/previous links, no COUNT or
+OFFSET) and leaves out the serializer's heavy fields unless compact=0.
+fields=a,b limits the response to those fields, and the query to the
+columns they need.
+"""
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class ListCursorPagination(CursorPagination):
+    page_size_query_param = 'page_size'
+
+    def __init__(self, ordering):
+        self.ordering = ordering
+        self.page_size = settings.LIST_PAGE_SIZE
+        self.max_page_size = settings.LIST_MAX_PAGE_SIZE
+
+
+class SparseFieldsMixin:
+    """
+    Serializer that takes fields=[...] to keep only those fields.
+
+    heavy_fields are left out of compact listings; field_sources names the
+    model fields a non-model field (a property or method) is computed from.
+    """
+    heavy_fields = ()
+    field_sources = {}
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def model_fields_for(cls, fields):
+        """The model fields to load for these serializer fields"""
+        model = cls.Meta.model
+        concrete = {field.name for field in model._meta.concrete_fields}
+        columns = {model._meta.pk.name}
+        for name in fields:
+            columns.update(source for source in cls.field_sources.get(name, (name,)) if source in concrete)
+        return sorted(columns)
+
+
+def _truthy(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def requested_fields(request, serializer_class, paginated):
+    """The serializer fields the request asks for, or None for all of them"""
+    available = list(serializer_class().fields)
+    fields = request.query_params.get('fields')
+    if fields:
+        fields = [name.strip() for name in fields.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in available]
+        if unknown:
+            raise ValidationError({'error': f"Unknown field(s): {', '.join(unknown)}. "
+                                            f"Available: {', '.join(available)}."})
+        return fields
+    if _truthy(request.query_params.get('compact', paginated)) and serializer_class.heavy_fields:
+        return [name for name in available if name not in serializer_class.heavy_fields]
+    return None
+
+
+def list_response(view, request, queryset, serializer_class, ordering, context=None):
+    """
+    Serialize queryset for a list endpoint, applying fields=, compact= and,
+    when the request asks for it, cursor pagination ordered by ordering.
+    """
+    context = context or {}
+    paginated = 'cursor' in request.query_params or 'page_size' in request.query_params
+    fields = requested_fields(request, serializer_class, paginated)
+    if fields is not None:
+        # The paginator reads the ordering field from each row
+        queryset = queryset.only(*serializer_class.model_fields_for(fields), ordering.lstrip('-'))
+    if not paginated:
+        serializer = serializer_class(queryset.order_by(ordering), many=True, fields=fields, context=context)
+        return Response(serializer.data)
+    paginator = ListCursorPagination(ordering)
+    page = paginator.paginate_queryset(queryset, request, view=view)
+    serializer = serializer_class(page, many=True, fields=fields, context=context)
+    return paginator.get_paginated_response(serializer.data)
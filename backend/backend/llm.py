@@ -0,0 +1,468 @@
+"""
+OpenRouter chat completions shared by the chat, summary and ingestion code.
+
+Every call goes through one pooled keep-alive session, a process-wide cap
+on in-flight requests, jittered exponential-backoff retries on 429/5xx and
+connection errors, and a circuit breaker that fails fast while the provider
+is down. Failures raise LLMError; latency and token usage are recorded per
+model and available from get_stats().
+
+The a-prefixed coroutines are the async equivalents for async views. They
+share the circuit breaker and stats, but use an httpx client and an asyncio
+semaphore (LLM_ASYNC_MAX_CONCURRENCY) per event loop, since waiting
+coroutines do not hold threads.
+"""
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+import requests
+from django.conf import settings
+from .services import get_openrouter_async_client, get_openrouter_session
+
+logger = logging.getLogger(__name__)
+
+MISTRAL_MODEL = "mistralai/mistral-7b-instruct"
+GEMMA_MODEL = "google/gemma-3-27b-it:free"
+SYSTEM_PROMPT = "You are a medical lab assistant. Use markdown with emojis/tables."
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """The completion could not be obtained from the provider"""
+
+
+class LLMUnavailable(LLMError):
+    """The provider is failing or every connection is busy; retry later"""
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects calls for
+    `reset_seconds`, then lets a single trial call through (half-open).
+    """
+
+    def __init__(self, threshold, reset_seconds):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+    def release_trial(self):
+        """End a call that says nothing about the provider's health, such as a cancelled one"""
+        with self._lock:
+            self._trial_running = False
+
+
+_breaker = None
+_semaphore = None
+_stats = {}
+_lock = threading.Lock()
+
+
+def _get_breaker():
+    global _breaker
+    if _breaker is None:
+        with _lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(settings.LLM_CIRCUIT_FAILURE_THRESHOLD, settings.LLM_CIRCUIT_RESET_SECONDS)
+    return _breaker
+
+
+def _get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        with _lock:
+            if _semaphore is None:
+                _semaphore = threading.BoundedSemaphore(settings.LLM_MAX_CONCURRENCY)
+    return _semaphore
+
+
+@contextmanager
+def _slot():
+    """Hold one of the process's LLM_MAX_CONCURRENCY request slots"""
+    semaphore = _get_semaphore()
+    if not semaphore.acquire(timeout=settings.LLM_QUEUE_TIMEOUT_SECONDS):
+        raise LLMUnavailable("Too many language model requests in flight; try again shortly")
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def _record(model, seconds, usage=None, error=False):
+    usage = usage or {}
+    with _lock:
+        stats = _stats.setdefault(model, {
+            'calls': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+            'prompt_tokens': 0, 'completion_tokens': 0,
+        })
+        stats['calls'] += 1
+        stats['errors'] += int(error)
+        stats['total_seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        stats['prompt_tokens'] += usage.get('prompt_tokens') or 0
+        stats['completion_tokens'] += usage.get('completion_tokens') or 0
+    logger.info("LLM call model=%s seconds=%.3f error=%s usage=%s", model, seconds, error, usage or None)
+
+
+def get_stats():
+    """Per-model call counts, errors, latency and token usage for this process"""
+    with _lock:
+        stats = {model: dict(values) for model, values in _stats.items()}
+    for values in stats.values():
+        values['mean_seconds'] = round(values['total_seconds'] / values['calls'], 3) if values['calls'] else 0.0
+        values['total_seconds'] = round(values['total_seconds'], 3)
+        values['max_seconds'] = round(values['max_seconds'], 3)
+    return {'circuit': _get_breaker().state, 'models': stats}
+
+
+def _backoff(attempt, response=None):
+    """Full-jitter exponential backoff, honouring a numeric Retry-After"""
+    if response is not None:
+        try:
+            return min(float(response.headers.get('Retry-After')), settings.LLM_RETRY_MAX_SECONDS)
+        except (TypeError, ValueError):
+            pass
+    cap = min(settings.LLM_RETRY_MAX_SECONDS, settings.LLM_RETRY_BASE_SECONDS * 2 ** attempt)
+    return random.uniform(0, cap)
+
+
+def _post(payload, headers=None, timeout=None, stream=False):
+    """
+    POST to OpenRouter with retries, returning a successful response.
+
+    Must be called while holding a request slot. Raises LLMError for
+    responses that are not worth retrying or once retries are exhausted.
+    """
+    breaker = _get_breaker()
+    if not breaker.allow():
+        raise LLMUnavailable("Language model provider is unavailable; try again shortly")
+    timeout = timeout or settings.LLM_TIMEOUT_SECONDS
+    attempt = 0
+    try:
+        while True:
+            response = None
+            try:
+                response = get_openrouter_session().post(
+                    settings.OPENROUTER_URL, json=payload, headers=headers, timeout=timeout, stream=stream
+                )
+                if response.status_code not in RETRY_STATUSES:
+                    break
+                error = LLMError(f"OpenRouter returned HTTP {response.status_code}")
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = LLMError(f"OpenRouter request failed: {e}")
+            if attempt >= settings.LLM_MAX_RETRIES:
+                raise error
+            delay = _backoff(attempt, response)
+            if response is not None:
+                response.close()
+            logger.warning("%s; retrying in %.2fs (attempt %d)", error, delay, attempt + 1)
+            time.sleep(delay)
+            attempt += 1
+    except Exception:
+        # Whatever ended the attempts, a half-open trial must not stay running
+        breaker.record_failure()
+        raise
+    except BaseException:
+        breaker.release_trial()
+        raise
+
+    # A request the provider rejects (bad key, bad payload) says nothing about
+    # its health, so it does not count against the breaker
+    breaker.record_success()
+    if not response.ok:
+        message = f"OpenRouter returned HTTP {response.status_code}: {response.text[:200]}"
+        response.close()
+        raise LLMError(message)
+    return response
+
+
+def build_payload(model, prompt, max_tokens=1024):
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        "max_tokens": max_tokens,
+    }
+
+
+def chat_completion(payload, headers=None, timeout=None):
+    """Run a chat completion payload and return the message content"""
+    model = payload.get("model")
+    started = time.perf_counter()
+    usage = None
+    try:
+        with _slot():
+            response = _post(payload, headers=headers, timeout=timeout)
+            try:
+                body = response.json()
+                content = body["choices"][0]["message"]["content"]
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                _get_breaker().record_failure()
+                raise LLMError(f"Unexpected response from OpenRouter: {e}")
+            usage = body.get("usage")
+    except LLMError:
+        _record(model, time.perf_counter() - started, error=True)
+        raise
+    _record(model, time.perf_counter() - started, usage)
+    return content
+
+
+def complete(model, prompt, max_tokens=1024):
+    """Answer a prompt with the shared system prompt"""
+    return chat_completion(build_payload(model, prompt, max_tokens))
+
+
+def ask_mistral(prompt: str, max_tokens: int = 1024) -> str:
+    return complete(MISTRAL_MODEL, prompt, max_tokens)
+
+
+def ask_gemma(prompt: str, max_tokens: int = 1024) -> str:
+    return complete(GEMMA_MODEL, prompt, max_tokens)
+
+
+_DONE = object()
+
+
+def _parse_event(line):
+    """The JSON chunk of one SSE line, _DONE at the end of the stream, or None"""
+    # Blank lines separate events; lines starting with ':' are keep-alive comments
+    if not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return _DONE
+    return json.loads(data)
+
+
+def stream_completion(model, prompt, max_tokens=1024):
+    """
+    Stream a completion from OpenRouter.
+
+    Yields ('token', text) for each content delta as it arrives and finally
+    ('done', stats) with time to first token, total time and token usage.
+    A failed request yields ('error', message) before 'done' rather than
+    raising, so that an already-open response can be closed cleanly. The
+    request slot is held until the stream ends.
+    """
+    payload = build_payload(model, prompt, max_tokens)
+    payload["stream"] = True
+    payload["stream_options"] = {"include_usage": True}
+
+    started = time.perf_counter()
+    first_token = None
+    usage = None
+    failed = False
+    try:
+        with _slot():
+            with _post(payload, stream=True) as response:
+                for line in response.iter_lines(chunk_size=None):
+                    chunk = _parse_event(line.decode("utf-8"))
+                    if chunk is None:
+                        continue
+                    if chunk is _DONE:
+                        break
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+                    for choice in chunk.get("choices") or []:
+                        text = (choice.get("delta") or {}).get("content")
+                        if text:
+                            if first_token is None:
+                                first_token = time.perf_counter() - started
+                            yield "token", text
+    except (LLMError, requests.exceptions.RequestException, ValueError) as e:
+        failed = True
+        if not isinstance(e, LLMError):
+            _get_breaker().record_failure()
+        yield "error", str(e)
+
+    total = time.perf_counter() - started
+    _record(model, total, usage, error=failed)
+    yield "done", {
+        "model": model,
+        "ttft_seconds": round(first_token, 3) if first_token is not None else None,
+        "total_seconds": round(total, 3),
+        "usage": usage,
+    }
+
+
+_async_semaphores = weakref.WeakKeyDictionary()
+
+
+@asynccontextmanager
+async def _aslot():
+    """Hold one of the event loop's LLM_ASYNC_MAX_CONCURRENCY request slots"""
+    loop = asyncio.get_running_loop()
+    semaphore = _async_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _async_semaphores[loop] = asyncio.Semaphore(settings.LLM_ASYNC_MAX_CONCURRENCY)
+    try:
+        await asyncio.wait_for(semaphore.acquire(), settings.LLM_QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise LLMUnavailable("Too many language model requests in flight; try again shortly")
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+async def _apost(payload, headers=None, timeout=None, stream=False):
+    """Async _post: returns a successful httpx response, read in full unless stream is set"""
+    import httpx
+
+    breaker = _get_breaker()
+    if not breaker.allow():
+        raise LLMUnavailable("Language model provider is unavailable; try again shortly")
+    client = get_openrouter_async_client()
+    request = client.build_request(
+        "POST", settings.OPENROUTER_URL, json=payload, headers=headers,
+        timeout=timeout or settings.LLM_TIMEOUT_SECONDS,
+    )
+    attempt = 0
+    try:
+        while True:
+            response = None
+            try:
+                response = await client.send(request, stream=stream)
+                if response.status_code not in RETRY_STATUSES:
+                    break
+                error = LLMError(f"OpenRouter returned HTTP {response.status_code}")
+            except httpx.TransportError as e:
+                error = LLMError(f"OpenRouter request failed: {e!r}")
+            if attempt >= settings.LLM_MAX_RETRIES:
+                raise error
+            delay = _backoff(attempt, response)
+            if response is not None:
+                await response.aclose()
+            logger.warning("%s; retrying in %.2fs (attempt %d)", error, delay, attempt + 1)
+            await asyncio.sleep(delay)
+            attempt += 1
+    except Exception:
+        breaker.record_failure()
+        raise
+    except BaseException:
+        # Cancelled, e.g. by a client disconnecting mid-request
+        breaker.release_trial()
+        raise
+
+    breaker.record_success()
+    if response.is_error:
+        body = await response.aread()
+        await response.aclose()
+        raise LLMError(f"OpenRouter returned HTTP {response.status_code}: {body[:200].decode(errors='replace')}")
+    return response
+
+
+async def achat_completion(payload, headers=None, timeout=None):
+    """Async chat_completion"""
+    model = payload.get("model")
+    started = time.perf_counter()
+    usage = None
+    try:
+        async with _aslot():
+            response = await _apost(payload, headers=headers, timeout=timeout)
+            try:
+                body = response.json()
+                content = body["choices"][0]["message"]["content"]
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                _get_breaker().record_failure()
+                raise LLMError(f"Unexpected response from OpenRouter: {e}")
+            usage = body.get("usage")
+    except LLMError:
+        _record(model, time.perf_counter() - started, error=True)
+        raise
+    _record(model, time.perf_counter() - started, usage)
+    return content
+
+
+async def acomplete(model, prompt, max_tokens=1024):
+    return await achat_completion(build_payload(model, prompt, max_tokens))
+
+
+async def astream_completion(model, prompt, max_tokens=1024):
+    """Async stream_completion, yielding the same events"""
+    import httpx
+
+    payload = build_payload(model, prompt, max_tokens)
+    payload["stream"] = True
+    payload["stream_options"] = {"include_usage": True}
+
+    started = time.perf_counter()
+    first_token = None
+    usage = None
+    failed = False
+    try:
+        async with _aslot():
+            response = await _apost(payload, stream=True)
+            try:
+                async for line in response.aiter_lines():
+                    chunk = _parse_event(line)
+                    if chunk is None:
+                        continue
+                    if chunk is _DONE:
+                        break
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+                    for choice in chunk.get("choices") or []:
+                        text = (choice.get("delta") or {}).get("content")
+                        if text:
+                            if first_token is None:
+                                first_token = time.perf_counter() - started
+                            yield "token", text
+            finally:
+                await response.aclose()
+    except (LLMError, httpx.HTTPError, ValueError) as e:
+        failed = True
+        if not isinstance(e, LLMError):
+            _get_breaker().record_failure()
+        yield "error", str(e)
+
+    total = time.perf_counter() - started
+    _record(model, total, usage, error=failed)
+    yield "done", {
+        "model": model,
+        "ttft_seconds": round(first_token, 3) if first_token is not None else None,
+        "total_seconds": round(total, 3),
+        "usage": usage,
+    }
@@ -1,15 +1,9 @@
 import re
-from pinecone import Pinecone, ServerlessSpec
-from sentence_transformers import SentenceTransformer
-import os
-
-PINECONE_API_KEY = os.environ.get('PINECONE_API_KEY')
-pc = Pinecone(api_key=PINECONE_API_KEY)
-
-# Connect to the index
-index_name = "medical"  # Replace with your index
-index = pc.Index(index_name)
-embedder = SentenceTransformer('all-MiniLM-L6-v2')
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from .embeddings import EMBEDDING_DIMENSION, encode_query
+from .services import get_embedder, get_vector_store
+import time
 
 def sanitize_patient_name(patient_name):
     """Sanitize patient name for use in vector IDs"""
@@ -27,7 +21,7 @@ def sanitize_patient_name(patient_name):
     return sanitized.lower()
 
 def get_relevant_chunks(query, user_id, top_k=10):
-    query_vector = embedder.encode(query).tolist()  # Assuming you have `embedder`
+    query_vector = encode_query(query)
 
     # Handle case where user_id is None or empty
     if not user_id:
@@ -36,8 +30,8 @@ def get_relevant_chunks(query, user_id, top_k=10):
     # Build filter based on user_id (adjust key if your metadata uses "patient_name")
     filter_dict = {"user_id": {"$eq": user_id}}
 
-    # Query Pinecone with metadata filter
-    result = index.query(
+    # Query the vector store with metadata filter
+    matches = get_vector_store().query(
         vector=query_vector,
         top_k=top_k,
         include_metadata=True,
@@ -45,7 +39,7 @@ def get_relevant_chunks(query, user_id, top_k=10):
     )
 
     formatted_chunks = []
-    for match in result['matches']:
+    for match in matches:
         metadata = match['metadata']
         text = metadata.get('text', '')
 
@@ -68,19 +62,54 @@ def chunk_text(text, max_tokens=300):
     return chunks
 
 
-def upsert_chunks(user_id, report_id, text):
-    chunks = chunk_text(text)
+def embed_text_chunks(text):
+    """
+    Chunk text and embed all chunks in batched encode calls.
+    Returns (chunks, embeddings) for upsert_chunks.
+    """
+    return embed_chunks(chunk_text(text))
+
+
+def embed_chunks(chunks):
+    """Embed chunks from chunk_text in batched encode calls; returns (chunks, embeddings)"""
+    if not chunks:
+        return chunks, []
+    embeddings = get_embedder().encode(chunks, batch_size=settings.EMBEDDING_BATCH_SIZE)
+    return chunks, embeddings.tolist()
+
+
+def _upsert_batch(batch):
+    started = time.perf_counter()
+    get_vector_store().upsert(batch)
+    return {"count": len(batch), "seconds": round(time.perf_counter() - started, 3)}
+
+
+def upsert_chunks(user_id, report_id, text, embedded=None):
+    """
+    Embed and upsert the chunks of text for a patient's report.
+
+    embedded may carry a (chunks, embeddings) pair from embed_text_chunks
+    computed ahead of time, in which case text is not re-encoded.
+
+    Vectors are sent in requests of at most PINECONE_UPSERT_BATCH_SIZE,
+    several at a time. Returns the vector count and the timing of the
+    embedding and of every upsert call.
+    """
+    stats = {"vectors": 0, "embed_seconds": 0.0, "upserts": []}
+    if embedded is None:
+        started = time.perf_counter()
+        embedded = embed_text_chunks(text)
+        stats["embed_seconds"] = round(time.perf_counter() - started, 3)
+    chunks, embeddings = embedded
     vectors = []
 
     # Sanitize the user_id (patient name) for use in vector IDs
     sanitized_user_id = sanitize_patient_name(user_id)
     
     # Add timestamp to ensure uniqueness even if same patient uploads multiple reports
-    import time
     timestamp = int(time.time())
     
-    for i, chunk in enumerate(chunks):
-        embedding = embedder.encode(chunk).tolist()
+    for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
         # Create unique vector ID with timestamp to prevent overwrites
         vector_id = f"{sanitized_user_id}_{report_id}_{timestamp}_{i}"
         
@@ -96,7 +125,16 @@ def upsert_chunks(user_id, report_id, text):
             }
         })
 
-    index.upsert(vectors=vectors)
+    batch_size = settings.PINECONE_UPSERT_BATCH_SIZE
+    batches = [vectors[i:i + batch_size] for i in range(0, len(vectors), batch_size)]
+    if len(batches) == 1:
+        stats["upserts"].append(_upsert_batch(batches[0]))
+    elif batches:
+        workers = min(settings.PINECONE_UPSERT_CONCURRENCY, len(batches))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pinecone-upsert') as pool:
+            stats["upserts"] = list(pool.map(_upsert_batch, batches))
+    stats["vectors"] = len(vectors)
+    return stats
 
 def delete_patient_chunks(user_id):
     """Delete all chunks for a specific patient"""
@@ -105,7 +143,7 @@ def delete_patient_chunks(user_id):
     
     try:
         # Delete vectors by metadata filter
-        index.delete(filter={"user_id": {"$eq": user_id}})
+        get_vector_store().delete(filter={"user_id": {"$eq": user_id}})
         print(f"Deleted all chunks for patient: {user_id}")
     except Exception as e:
         print(f"Error deleting chunks for patient {user_id}: {e}")
@@ -116,15 +154,15 @@ def get_patient_chunks_count(user_id):
         return 0
     
     try:
-        # Query with a dummy vector to get count
-        dummy_vector = embedder.encode("dummy").tolist()
-        result = index.query(
+        # Query with a dummy vector to get count; only the filter matters
+        dummy_vector = [0.0] * EMBEDDING_DIMENSION
+        matches = get_vector_store().query(
             vector=dummy_vector,
             top_k=1000,  # Large number to get all chunks
-            include_metadata=True,
+            include_metadata=False,
             filter={"user_id": {"$eq": user_id}}
         )
-        return len(result['matches'])
+        return len(matches)
     except Exception as e:
         print(f"Error getting chunk count for patient {user_id}: {e}")
         return 0
@@ -134,14 +172,14 @@ def delete_report_chunks(report_id):
     if not report_id:
         return
     try:
-        index.delete(filter={"report_id": {"$eq": report_id}})
+        get_vector_store().delete(filter={"report_id": {"$eq": report_id}})
         print(f"Deleted all chunks for report: {report_id}")
     except Exception as e:
         print(f"Error deleting chunks for report {report_id}: {e}")
 
 def query_chunks(query: str, k: int = 50) -> list:
     """
-    Get relevant chunks from Pinecone with metadata
+    Get relevant chunks from the vector store with metadata
     
     Args:
         query: The query string to search for
@@ -157,32 +195,25 @@ def query_chunks(query: str, k: int = 50) -> list:
         query = patient_name  # Use just the name for semantic search
     
     # Create query vector
-    query_vector = embedder.encode(query).tolist()
-    
-    # Build query params
-    query_params = {
-        "vector": query_vector,
-        "top_k": k,
-        "include_metadata": True
-    }
+    query_vector = encode_query(query)
     
     # Add filter if patient name is specified
-    if patient_name:
-        query_params["filter"] = {"user_id": {"$eq": patient_name}}
+    filter_dict = {"user_id": {"$eq": patient_name}} if patient_name else None
     
-    # Query Pinecone
-    result = index.query(**query_params)
+    # Query the vector store
+    matches = get_vector_store().query(vector=query_vector, top_k=k, include_metadata=True, filter=filter_dict)
     
     # Format results
     chunks = []
-    for match in result.matches:
+    for match in matches:
+        metadata = match['metadata']
         chunk = {
-            'text': match.metadata.get('text', ''),
+            'text': metadata.get('text', ''),
             'metadata': {
-                'report_type': match.metadata.get('report_type', 'Unknown'),
-                'report_date': match.metadata.get('report_date', ''),
-                'report_id': match.metadata.get('report_id', ''),
-                'chunk_index': match.metadata.get('chunk_index', 0)
+                'report_type': metadata.get('report_type', 'Unknown'),
+                'report_date': metadata.get('report_date', ''),
+                'report_id': metadata.get('report_id', ''),
+                'chunk_index': metadata.get('chunk_index', 0)
             }
         }
         chunks.append(chunk)
@@ -0,0 +1,105 @@
+"""
+Lazily built, process-wide clients for the vector store, Azure, OpenRouter
+and the embedding model (OpenRouter's async client is one per event loop). Nothing here connects or loads anything at import time.
+"""
+import asyncio
+import os
+import threading
+import weakref
+from django.conf import settings
+from .embeddings import get_embedder  # noqa: F401  (re-exported accessor)
+
+_clients = {}
+_lock = threading.Lock()
+# Async clients are bound to the event loop they were created on
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _get_or_create(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = factory()
+                _clients[name] = client
+    return client
+
+
+def get_pinecone_index():
+    """The Pinecone index holding report chunks"""
+    def connect():
+        from pinecone import Pinecone
+        pc = Pinecone(api_key=os.environ.get('PINECONE_API_KEY'))
+        return pc.Index(settings.PINECONE_INDEX_NAME)
+    return _get_or_create('pinecone_index', connect)
+
+
+def get_vector_store():
+    """The configured VectorStore: hosted Pinecone or the local memory-mapped store"""
+    def connect():
+        from .vector_store import LocalVectorStore, PineconeVectorStore
+        if settings.VECTOR_STORE_BACKEND == 'local':
+            return LocalVectorStore(settings.LOCAL_VECTOR_STORE_PATH)
+        if settings.VECTOR_STORE_BACKEND == 'pinecone':
+            return PineconeVectorStore(get_pinecone_index())
+        raise ValueError(f"Unknown VECTOR_STORE_BACKEND {settings.VECTOR_STORE_BACKEND!r}")
+    return _get_or_create('vector_store', connect)
+
+
+def get_azure_client():
+    """Azure Form Recognizer client used for report layout analysis"""
+    def connect():
+        endpoint = os.environ.get('AZURE_ENDPOINT')
+        key = os.environ.get('AZURE_KEY')
+        if not endpoint or not key:
+            raise ValueError("Azure Form Recognizer endpoint or key not configured")
+        from azure.ai.formrecognizer import DocumentAnalysisClient
+        from azure.core.credentials import AzureKeyCredential
+        return DocumentAnalysisClient(
+            endpoint=endpoint,
+            credential=AzureKeyCredential(key),
+            api_version="2023-07-31"
+        )
+    return _get_or_create('azure', connect)
+
+
+def get_openrouter_session():
+    """Pooled keep-alive HTTP session carrying the OpenRouter credentials"""
+    def connect():
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        # Keep-alive pool with a connection per allowed in-flight request;
+        # retries are handled by backend.llm
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.LLM_MAX_CONCURRENCY, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update(_openrouter_headers())
+        return session
+    return _get_or_create('openrouter', connect)
+
+
+def _openrouter_headers():
+    return {
+        "Authorization": f"Bearer {os.environ.get('OPENROUTER_API_KEY')}",
+        "Content-Type": "application/json",
+    }
+
+
+def get_openrouter_async_client():
+    """httpx.AsyncClient for OpenRouter, shared by everything running on the current event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        import httpx
+        client = httpx.AsyncClient(
+            headers=_openrouter_headers(),
+            limits=httpx.Limits(
+                max_connections=settings.LLM_ASYNC_MAX_CONCURRENCY,
+                max_keepalive_connections=settings.LLM_ASYNC_MAX_CONCURRENCY,
+            ),
+            timeout=settings.LLM_TIMEOUT_SECONDS,
+        )
+        _async_clients[loop] = client
+    return client
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 load_dotenv()
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
     'health_summary',
     'dashboard',
     'lab_technician',
+    'benchmarks',
 ]
 
 MIDDLEWARE = [
@@ -167,4 +169,92 @@ CORS_ALLOW_HEADERS = [
 
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# List endpoints paginate by cursor when a request passes page_size or cursor
+LIST_PAGE_SIZE = int(os.environ.get('LIST_PAGE_SIZE', 50))
+LIST_MAX_PAGE_SIZE = int(os.environ.get('LIST_MAX_PAGE_SIZE', 200))
+
+# Caching
+# The default per-process cache is fine for a single process; when ingestion
+# workers run in their own processes point this at a shared backend so cache
+# invalidation reaches every process.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', 'healthcare-patient-app'),
+    }
+}
+PATIENT_CONTEXT_CACHE_SECONDS = int(os.environ.get('PATIENT_CONTEXT_CACHE_SECONDS', 600))
+# Safety net for the cached dashboard summary, which writes also invalidate
+DASHBOARD_CACHE_SECONDS = int(os.environ.get('DASHBOARD_CACHE_SECONDS', 300))
+# Estimated tokens of report context sent with each patient chat question
+PATIENT_CHAT_CONTEXT_TOKENS = int(os.environ.get('PATIENT_CHAT_CONTEXT_TOKENS', 1500))
+# Chat sessions: turns sent verbatim and their token budget; older turns are
+# compacted into a summary of at most CHAT_SUMMARY_MAX_TOKENS
+CHAT_HISTORY_TURNS = int(os.environ.get('CHAT_HISTORY_TURNS', 4))
+CHAT_HISTORY_TOKENS = int(os.environ.get('CHAT_HISTORY_TOKENS', 800))
+CHAT_SUMMARY_MAX_TOKENS = int(os.environ.get('CHAT_SUMMARY_MAX_TOKENS', 300))
+
+
+# Report ingestion
+# Uploads are staged here until a worker picks them up, so keep it on the same
+# filesystem as MEDIA_ROOT.
+REPORT_STAGING_DIR = os.path.join(MEDIA_ROOT, 'staging')
+BACKGROUND_WORKERS = int(os.environ.get('BACKGROUND_WORKERS', 2))
+# Merges into a patient's reports lock the report row; on SQLite, which has no
+# row locks, they take a lock file here instead
+REPORT_MERGE_LOCK_DIR = os.environ.get('REPORT_MERGE_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'healthcare-report-merge'))
+
+
+# Embedding and vector store
+# 'pinecone' for the hosted index, 'local' for the on-disk store (no outbound calls)
+VECTOR_STORE_BACKEND = os.environ.get('VECTOR_STORE_BACKEND', 'pinecone')
+LOCAL_VECTOR_STORE_PATH = os.environ.get('LOCAL_VECTOR_STORE_PATH', os.path.join(BASE_DIR, 'vector_store'))
+PINECONE_INDEX_NAME = os.environ.get('PINECONE_INDEX_NAME', 'medical')
+# One of 'torch', 'onnx' or 'onnx-int8'; the ONNX backends need sentence-transformers[onnx]
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'torch')
+EMBEDDING_ONNX_INT8_FILE = os.environ.get('EMBEDDING_ONNX_INT8_FILE', 'onnx/model_quint8_avx2.onnx')
+# Query embeddings kept in memory; set QUERY_EMBEDDING_CACHE_PATH to also keep them on disk
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get('QUERY_EMBEDDING_CACHE_SIZE', 2048))
+QUERY_EMBEDDING_CACHE_PATH = os.environ.get('QUERY_EMBEDDING_CACHE_PATH', '')
+EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE', 64))
+# Vectors per upsert request; keeps each request under the vector store's size limits
+PINECONE_UPSERT_BATCH_SIZE = int(os.environ.get('PINECONE_UPSERT_BATCH_SIZE', 100))
+PINECONE_UPSERT_CONCURRENCY = int(os.environ.get('PINECONE_UPSERT_CONCURRENCY', 4))
+
+
+# Language model calls (OpenRouter)
+OPENROUTER_URL = os.environ.get('OPENROUTER_URL', 'https://openrouter.ai/api/v1/chat/completions')
+LLM_TIMEOUT_SECONDS = float(os.environ.get('LLM_TIMEOUT_SECONDS', 30))
+# In-flight requests per process; callers wait up to LLM_QUEUE_TIMEOUT_SECONDS for a slot
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 8))
+# Async views wait on the event loop rather than in threads, so they can keep many more open
+LLM_ASYNC_MAX_CONCURRENCY = int(os.environ.get('LLM_ASYNC_MAX_CONCURRENCY', 500))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('LLM_QUEUE_TIMEOUT_SECONDS', 30))
+# Retries on 429/5xx and connection errors, with jittered exponential backoff
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 3))
+LLM_RETRY_BASE_SECONDS = float(os.environ.get('LLM_RETRY_BASE_SECONDS', 0.5))
+LLM_RETRY_MAX_SECONDS = float(os.environ.get('LLM_RETRY_MAX_SECONDS', 8))
+# Consecutive failures before calls fail fast, and how long they do
+LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('LLM_CIRCUIT_FAILURE_THRESHOLD', 5))
+LLM_CIRCUIT_RESET_SECONDS = float(os.environ.get('LLM_CIRCUIT_RESET_SECONDS', 30))
+# Identical concurrent requests share one model call. 'thread' coalesces within
+# a process; 'file' also across processes on one host, through lock files and
+# the cache, which must then be shared.
+SINGLEFLIGHT_BACKEND = os.environ.get('SINGLEFLIGHT_BACKEND', 'thread')
+SINGLEFLIGHT_LOCK_DIR = os.environ.get('SINGLEFLIGHT_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'healthcare-singleflight'))
+SINGLEFLIGHT_WAIT_SECONDS = float(os.environ.get('SINGLEFLIGHT_WAIT_SECONDS', 120))
+# How long waiters in other processes have to pick up a finished call's result
+SINGLEFLIGHT_RESULT_SECONDS = int(os.environ.get('SINGLEFLIGHT_RESULT_SECONDS', 30))
+
+# Semantic cache of general lab answers
+# Cosine similarity above which an earlier answer is reused; 0 entries disables the cache
+LAB_ANSWER_CACHE_THRESHOLD = float(os.environ.get('LAB_ANSWER_CACHE_THRESHOLD', 0.92))
+LAB_ANSWER_CACHE_TTL_SECONDS = int(os.environ.get('LAB_ANSWER_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+LAB_ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('LAB_ANSWER_CACHE_MAX_ENTRIES', 1000))
+
+# Health summaries
+# Summaries are updated from report deltas; after this many updates or days they are rebuilt in full
+HEALTH_SUMMARY_MAX_INCREMENTAL_UPDATES = int(os.environ.get('HEALTH_SUMMARY_MAX_INCREMENTAL_UPDATES', 10))
+HEALTH_SUMMARY_FULL_REBUILD_DAYS = int(os.environ.get('HEALTH_SUMMARY_FULL_REBUILD_DAYS', 30))
@@ -0,0 +1,185 @@
+"""
+Single-flight coalescing of identical in-flight calls.
+
+Concurrent callers with the same key share one execution: the first runs
+the function and the others wait for its result, or its exception. Keys
+are built by flight_key from the endpoint, patient, normalised query and a
+version of the data the answer is built from, so callers that read
+different data never share an answer.
+
+Calls are coalesced across the threads of a process, and do_async across
+the coroutines of an event loop. With SINGLEFLIGHT_BACKEND = 'file' the
+sync calls are also coalesced across processes: the leader holds the
+key's lock file while it runs and leaves its result in the cache under a
+token it wrote into that file, where callers from other processes that
+waited on the lock pick it up. It then removes the lock file, so a caller
+that comes along after the call has finished starts a new one; results
+are only ever shared with callers that waited on the call. That needs a
+cache shared by the processes (see CACHES), and fcntl: where it is missing
+(Windows), 'file' coalesces within each process only.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+import weakref
+from django.conf import settings
+from django.core.cache import cache
+from .embeddings import normalise_query
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'singleflight:{key}:{token}'
+
+_MISSING = object()
+
+_calls = {}
+# Async calls are tasks bound to the event loop they were created on
+_async_calls = weakref.WeakKeyDictionary()
+_stats = {'calls': 0, 'shared': 0}
+_lock = threading.Lock()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def flight_key(endpoint, patient=None, query='', version=''):
+    """
+    Key of a call: the endpoint, the patient, the query (normalised) and a
+    version of the data, which can be any string that changes when the data
+    does, such as the prompt context itself.
+    """
+    parts = [endpoint, '' if patient is None else str(patient), normalise_query(query), version or '']
+    return hashlib.sha256('\x1f'.join(parts).encode()).hexdigest()
+
+
+def _count(shared):
+    with _lock:
+        _stats['calls'] += 1
+        _stats['shared'] += int(shared)
+
+
+def do(key, fn, *args, **kwargs):
+    """Return fn(*args, **kwargs), sharing one execution with concurrent callers of the same key"""
+    with _lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+    _count(shared=not leader)
+    if not leader:
+        logger.debug("Joined in-flight call %s", key[:12])
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        if settings.SINGLEFLIGHT_BACKEND == 'file' and fcntl is not None:
+            call.result = _do_locked(key, fn, args, kwargs)
+        else:
+            call.result = fn(*args, **kwargs)
+        return call.result
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            del _calls[key]
+        call.done.set()
+
+
+def _acquire(lock_file, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+
+def _unlinked(lock_file, path):
+    """Whether lock_file is no longer the one at path, its call having finished"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return True
+    own = os.fstat(lock_file.fileno())
+    return (stat.st_dev, stat.st_ino) != (own.st_dev, own.st_ino)
+
+
+def _do_locked(key, fn, args, kwargs):
+    """Run fn under the key's lock file, or return the result of the call in another process it waited on"""
+    os.makedirs(settings.SINGLEFLIGHT_LOCK_DIR, exist_ok=True)
+    path = os.path.join(settings.SINGLEFLIGHT_LOCK_DIR, f"{key}.lock")
+    deadline = time.monotonic() + settings.SINGLEFLIGHT_WAIT_SECONDS
+    while True:
+        with open(path, 'a+') as lock_file:
+            if not _acquire(lock_file, max(deadline - time.monotonic(), 0)):
+                # Past the wait the call runs anyway rather than failing the request
+                return fn(*args, **kwargs)
+            if _unlinked(lock_file, path):
+                # The call waited on has finished; its token names its result
+                lock_file.seek(0)
+                token = lock_file.read()
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                result = cache.get(CACHE_KEY.format(key=key, token=token), _MISSING) if token else _MISSING
+                if result is not _MISSING:
+                    with _lock:
+                        _stats['shared'] += 1
+                    return result
+                # It failed, so lead the next call
+                continue
+            token = uuid.uuid4().hex
+            lock_file.seek(0)
+            lock_file.truncate()
+            lock_file.write(token)
+            lock_file.flush()
+            try:
+                result = fn(*args, **kwargs)
+                cache.set(CACHE_KEY.format(key=key, token=token), result, settings.SINGLEFLIGHT_RESULT_SECONDS)
+                return result
+            finally:
+                # Callers that open the path from now on start a new call
+                os.unlink(path)
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+async def do_async(key, fn, *args, **kwargs):
+    """
+    Async do: await fn(*args, **kwargs), sharing one execution with the
+    coroutines on this event loop that ask for the same key.
+
+    The call runs as its own task, so it is not cancelled when the caller
+    that started it goes away.
+    """
+    loop = asyncio.get_running_loop()
+    calls = _async_calls.setdefault(loop, {})
+    task = calls.get(key)
+    _count(shared=task is not None)
+    if task is None:
+        task = loop.create_task(fn(*args, **kwargs))
+        calls[key] = task
+        task.add_done_callback(lambda done: calls.pop(key, None) if calls.get(key) is done else None)
+    return await asyncio.shield(task)
+
+
+def get_stats():
+    """Calls made through the single-flight layer in this process and how many shared another's result"""
+    with _lock:
+        return dict(_stats)
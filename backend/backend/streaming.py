@@ -0,0 +1,115 @@
+"""
+Server-Sent Events responses for the chat and summary endpoints.
+
+Clients opt in with "stream": true in the request body or by accepting
+text/event-stream. The stream is a series of 'token' events carrying text
+deltas, then an optional 'error' event and a final 'done' event with timing
+and token usage.
+"""
+import json
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets DRF accept text/event-stream requests; non-streamed replies become a single event"""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        event = 'error' if response is not None and response.status_code >= 400 else 'done'
+        return sse(event, data).encode(self.charset)
+
+
+STREAMING_RENDERER_CLASSES = [*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer]
+
+
+def wants_stream(request):
+    """For DRF requests and the async views' plain requests (which carry request.data)"""
+    stream = request.data.get('stream')
+    if isinstance(stream, str):
+        stream = stream.lower() in ('1', 'true', 'yes')
+    if hasattr(request, 'accepted_renderer'):
+        return bool(stream) or getattr(request.accepted_renderer, 'format', None) == 'sse'
+    return bool(stream) or 'text/event-stream' in request.headers.get('Accept', '')
+
+
+def _encode(kind, payload, extra):
+    if kind == 'token':
+        return sse('token', {'text': payload})
+    if kind == 'error':
+        return sse('error', {'error': payload})
+    return sse('done', {**payload, **extra})
+
+
+def _next_event(events, default):
+    # Steps run on whichever executor thread is free, and some write to the
+    # database (recording the turn, caching the answer), so each step leaves
+    # no connection behind on its thread
+    close_old_connections()
+    try:
+        return next(events, default)
+    finally:
+        close_old_connections()
+
+
+async def _relay_async(events, extra):
+    # Each step of the blocking HTTP stream runs in a worker thread so the
+    # event loop is free between tokens; not the shared sync thread, which
+    # would stall every other sync view for the length of the stream
+    step = sync_to_async(_next_event, thread_sensitive=False)
+    finished = object()
+    while True:
+        item = await step(events, finished)
+        if item is finished:
+            break
+        yield _encode(*item, extra)
+
+
+def _relay(events, extra):
+    for kind, payload in events:
+        yield _encode(kind, payload, extra)
+
+
+def event_stream_response(request, events, extra=None):
+    """
+    Relay (kind, payload) events from backend.llm.stream_completion as SSE.
+
+    Under ASGI the events are relayed through an async iterator, otherwise
+    through a plain one; Django buffers whichever kind its handler does not
+    natively support, which would defeat streaming.
+    """
+    extra = extra or {}
+    django_request = getattr(request, '_request', request)
+    if isinstance(django_request, ASGIRequest):
+        content = _relay_async(events, extra)
+    else:
+        content = _relay(events, extra)
+    response = StreamingHttpResponse(content, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx and similar proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def _relay_events(events, extra):
+    async for kind, payload in events:
+        yield _encode(kind, payload, extra)
+
+
+def async_event_stream_response(events, extra=None):
+    """Relay events from an async generator such as backend.llm.astream_completion as SSE"""
+    response = StreamingHttpResponse(_relay_events(events, extra or {}), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,240 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+import requests
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, override_settings
+from . import llm, singleflight
+from .streaming import _relay_async
+from .vector_store import LocalVectorStore, matches_filter
+
+
+def vector(vector_id, values, **metadata):
+    return {'id': vector_id, 'values': values, 'metadata': metadata}
+
+
+class LocalVectorStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path, ignore_errors=True)
+        self.store = LocalVectorStore(self.path, dimension=3)
+        self.store.upsert([
+            vector('a', [1, 0, 0], user_id='Asha', report_id='r1'),
+            vector('b', [0.9, 0.1, 0], user_id='Asha', report_id='r2'),
+            vector('c', [0, 1, 0], user_id='Ravi', report_id='r3'),
+        ])
+
+    def ids(self, matches):
+        return [match['id'] for match in matches]
+
+    def test_query_ranks_by_cosine_similarity(self):
+        matches = self.store.query([2, 0, 0], top_k=2)
+        self.assertEqual(self.ids(matches), ['a', 'b'])
+        self.assertAlmostEqual(matches[0]['score'], 1.0, places=5)
+        self.assertEqual(matches[0]['metadata'], {'user_id': 'Asha', 'report_id': 'r1'})
+
+    def test_query_applies_the_filter(self):
+        self.assertEqual(self.ids(self.store.query([1, 0, 0], filter={'user_id': {'$eq': 'Ravi'}})), ['c'])
+        self.assertEqual(
+            self.ids(self.store.query([1, 0, 0], filter={'user_id': 'Asha', 'report_id': {'$ne': 'r1'}})), ['b'],
+        )
+
+    def test_upsert_replaces_a_vector_with_the_same_id(self):
+        self.store.upsert([vector('a', [0, 1, 0], user_id='Asha', report_id='r9')])
+        matches = self.store.query([0, 1, 0], top_k=3, filter={'report_id': 'r9'})
+        self.assertEqual(self.ids(matches), ['a'])
+        self.assertAlmostEqual(matches[0]['score'], 1.0, places=5)
+
+    def test_delete_by_filter_and_ids(self):
+        self.store.delete(filter={'report_id': {'$eq': 'r1'}})
+        self.store.delete(ids=['c'])
+        self.assertEqual(self.ids(self.store.query([1, 0, 0], top_k=10)), ['b'])
+
+    def test_writes_are_seen_by_another_instance_on_the_same_path(self):
+        other = LocalVectorStore(self.path, dimension=3)
+        self.assertEqual(self.ids(other.query([0, 1, 0], top_k=1)), ['c'])
+        self.store.delete(filter={'user_id': 'Ravi'})
+        self.assertEqual(self.ids(other.query([0, 1, 0], top_k=3)), ['b', 'a'])
+
+    def test_writes_within_one_timestamp_tick_are_picked_up(self):
+        other = LocalVectorStore(self.path, dimension=3)
+        mtime = os.stat(os.path.join(self.path, LocalVectorStore.METADATA_FILE)).st_mtime_ns
+        self.store.delete(ids=['a'])
+        # As on a filesystem whose timestamps did not move between the writes
+        os.utime(os.path.join(self.path, LocalVectorStore.METADATA_FILE), ns=(mtime, mtime))
+        self.assertEqual(self.ids(other.query([1, 0, 0], top_k=3)), ['b', 'c'])
+
+    def test_reader_between_the_writes_of_a_delete_sees_matching_rows(self):
+        seen, write_sidecar = [], self.store._write_sidecar
+
+        def read_then_write_sidecar():
+            # Another process opening the store after the vectors are written
+            matches = LocalVectorStore(self.path, dimension=3).query([1, 0, 0], top_k=3)
+            seen.append([(match['id'], match['metadata']['report_id']) for match in matches])
+            write_sidecar()
+
+        with mock.patch.object(self.store, '_write_sidecar', side_effect=read_then_write_sidecar):
+            self.store.delete(ids=['a'])
+
+        self.assertEqual(seen, [[('a', 'r1'), ('b', 'r2'), ('c', 'r3')]])
+        self.assertEqual(self.ids(LocalVectorStore(self.path, dimension=3).query([1, 0, 0], top_k=3)), ['b', 'c'])
+
+    def test_vectors_of_another_dimension_are_rejected(self):
+        with self.assertRaisesMessage(ValueError, '6 dimensions do not fit a store of 3'):
+            self.store.upsert([vector('d', [1, 0, 0, 0, 1, 0], user_id='Asha')])
+        with self.assertRaisesMessage(ValueError, '2 dimensions do not fit a store of 3'):
+            self.store.query([1, 0])
+        self.assertEqual(self.ids(self.store.query([1, 0, 0], top_k=10)), ['a', 'b', 'c'])
+
+    def test_writes_without_fcntl(self):
+        with mock.patch('backend.vector_store.fcntl', None):
+            self.store.upsert([vector('d', [0, 0, 1], user_id='Ravi', report_id='r4')])
+            self.store.delete(ids=['c'])
+        self.assertEqual(self.ids(self.store.query([0, 1, 1], top_k=10, filter={'user_id': 'Ravi'})), ['d'])
+
+    def test_matches_filter_operators(self):
+        metadata = {'user_id': 'Asha', 'timestamp': 5}
+        self.assertTrue(matches_filter(metadata, {'$or': [{'user_id': 'Ravi'}, {'timestamp': {'$gte': 5}}]}))
+        self.assertFalse(matches_filter(metadata, {'user_id': {'$in': ['Ravi']}}))
+        self.assertFalse(matches_filter(metadata, {'$and': [{'user_id': 'Asha'}, {'timestamp': {'$lt': 5}}]}))
+
+
+class RelayAsyncTests(SimpleTestCase):
+    def test_each_step_closes_the_connections_of_its_thread(self):
+        step_threads, closed = [], []
+
+        def events():
+            # Stands in for a stream that records the turn in the database
+            for token in ('Hel', 'lo'):
+                step_threads.append(threading.get_ident())
+                yield 'token', token
+            step_threads.append(threading.get_ident())
+            yield 'done', {}
+
+        async def relay():
+            return [chunk async for chunk in _relay_async(events(), {})]
+
+        with mock.patch('backend.streaming.close_old_connections',
+                        side_effect=lambda: closed.append(threading.get_ident())):
+            chunks = async_to_sync(relay)()
+
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(chunks[-1].startswith('event: done'))
+        # Before and after each of the four steps, the last one finding the stream exhausted
+        self.assertEqual(len(closed), 8)
+        self.assertLessEqual(set(step_threads), set(closed))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        # Opens on the first failure and is half-open again straight away
+        self.breaker = llm.CircuitBreaker(threshold=1, reset_seconds=0)
+        self.breaker.record_failure()
+        patcher = mock.patch.object(llm, '_breaker', self.breaker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_half_open_lets_one_trial_through(self):
+        self.assertEqual(self.breaker.state, 'half-open')
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, 'closed')
+
+    def test_trial_ended_by_an_unexpected_error_is_released(self):
+        session = mock.Mock()
+        session.post.side_effect = requests.exceptions.InvalidURL('bad url')
+        with mock.patch.object(llm, 'get_openrouter_session', return_value=session):
+            with self.assertRaises(requests.exceptions.InvalidURL):
+                llm._post({'model': 'test'})
+        self.assertTrue(self.breaker.allow())
+
+    def test_cancelled_async_trial_is_released(self):
+        client = mock.Mock()
+        client.send = mock.AsyncMock(side_effect=asyncio.CancelledError)
+        with mock.patch.object(llm, 'get_openrouter_async_client', return_value=client):
+            with self.assertRaises(asyncio.CancelledError):
+                asyncio.run(llm._apost({'model': 'test'}))
+        self.assertTrue(self.breaker.allow())
+
+
+class SingleflightTests(SimpleTestCase):
+    def setUp(self):
+        lock_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, lock_dir, ignore_errors=True)
+        settings_override = override_settings(SINGLEFLIGHT_LOCK_DIR=lock_dir, SINGLEFLIGHT_WAIT_SECONDS=5)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def start_blocked_call(self, run, key):
+        """Start run(key, fn) in a thread, with fn blocked until the returned event is set"""
+        started, release, results = threading.Event(), threading.Event(), []
+
+        def fn():
+            started.set()
+            release.wait(5)
+            return 'first'
+
+        thread = threading.Thread(target=lambda: results.append(run(key, fn)))
+        thread.start()
+        started.wait(5)
+        return thread, release, results
+
+    def run_in_thread(self, run, key, fn):
+        results = []
+        thread = threading.Thread(target=lambda: results.append(run(key, fn)))
+        thread.start()
+        return thread, results
+
+    def test_concurrent_callers_share_the_call_and_later_ones_make_their_own(self):
+        thread, release, results = self.start_blocked_call(singleflight.do, 'k')
+        waiter, waiter_results = self.run_in_thread(singleflight.do, 'k', lambda: 'second')
+        release.set()
+        thread.join()
+        waiter.join()
+
+        self.assertEqual(results + waiter_results, ['first', 'first'])
+        self.assertEqual(singleflight.do('k', lambda: 'later'), 'later')
+
+    @override_settings(SINGLEFLIGHT_BACKEND='file')
+    def test_file_lock_shares_a_result_only_with_callers_that_waited(self):
+        locked = lambda key, fn: singleflight._do_locked(key, fn, (), {})
+        thread, release, results = self.start_blocked_call(locked, 'a' * 64)
+        waiting, acquire = threading.Event(), singleflight._acquire
+
+        def wait_for_lock(lock_file, timeout):
+            waiting.set()
+            return acquire(lock_file, timeout)
+
+        with mock.patch.object(singleflight, '_acquire', side_effect=wait_for_lock):
+            waiter, waiter_results = self.run_in_thread(locked, 'a' * 64, lambda: 'second')
+            waiting.wait(5)
+            release.set()
+            waiter.join()
+        thread.join()
+        thread.join()
+        waiter.join()
+
+        self.assertEqual(results + waiter_results, ['first', 'first'])
+        self.assertEqual(locked('a' * 64, lambda: 'later'), 'later')
+
+    @override_settings(SINGLEFLIGHT_BACKEND='file')
+    def test_file_backend_runs_the_call_where_fcntl_is_missing(self):
+        with mock.patch.object(singleflight, 'fcntl', None):
+            self.assertEqual(singleflight.do('k', lambda: 'answer'), 'answer')
+
+    @override_settings(SINGLEFLIGHT_BACKEND='file')
+    def test_file_lock_does_not_hold_up_other_keys(self):
+        locked = lambda key, fn: singleflight._do_locked(key, fn, (), {})
+        # Keys that shared a lock file when keys were striped over 256 of them
+        thread, release, _ = self.start_blocked_call(locked, '00000000' + 'a' * 56)
+        try:
+            other, results = self.run_in_thread(locked, '00000100' + 'b' * 56, lambda: 'other')
+            other.join(2)
+            self.assertEqual(results, ['other'])
+        finally:
+            release.set()
+            thread.join()
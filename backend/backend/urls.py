@@ -16,7 +16,7 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from patients.urls import report_detail_patterns
+from patients.urls import report_detail_patterns, job_patterns
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -24,6 +24,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/patients/', include('patients.urls')),
     path('api/reports/', include(report_detail_patterns)),
+    path('api/jobs/', include(job_patterns)),
     path('api/lab_technician/', include('lab_technician.urls')),
     path('api/health_summary/', include('health_summary.urls')),
     path('api/dashboard/', include('dashboard.urls')),
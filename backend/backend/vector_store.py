@@ -0,0 +1,317 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class VectorStore:
+    """
+    Storage for report chunk embeddings.
+
+    Vectors are dicts of id, values and metadata, as Pinecone takes them.
+    Filters use Pinecone's metadata filter syntax. Queries return a list of
+    matches, each a dict with id, score and metadata.
+    """
+
+    def upsert(self, vectors):
+        raise NotImplementedError
+
+    def query(self, vector, top_k=10, filter=None, include_metadata=True):
+        raise NotImplementedError
+
+    def delete(self, filter=None, ids=None):
+        raise NotImplementedError
+
+
+class PineconeVectorStore(VectorStore):
+    """The hosted Pinecone index"""
+
+    def __init__(self, index):
+        self.index = index
+
+    def upsert(self, vectors):
+        self.index.upsert(vectors=vectors)
+
+    def query(self, vector, top_k=10, filter=None, include_metadata=True):
+        params = {"vector": vector, "top_k": top_k, "include_metadata": include_metadata}
+        if filter:
+            params["filter"] = filter
+        result = self.index.query(**params)
+        return [
+            {"id": match["id"], "score": match["score"], "metadata": match.get("metadata") or {}}
+            for match in result["matches"]
+        ]
+
+    def delete(self, filter=None, ids=None):
+        if ids is not None:
+            self.index.delete(ids=list(ids))
+        if filter is not None:
+            self.index.delete(filter=filter)
+
+
+def _matches_condition(value, condition):
+    if not isinstance(condition, dict):
+        return value == condition
+    for op, operand in condition.items():
+        if op == "$eq" and value != operand:
+            return False
+        if op == "$ne" and value == operand:
+            return False
+        if op == "$in" and value not in operand:
+            return False
+        if op == "$nin" and value in operand:
+            return False
+        if op in ("$gt", "$gte", "$lt", "$lte"):
+            if value is None:
+                return False
+            if op == "$gt" and not value > operand:
+                return False
+            if op == "$gte" and not value >= operand:
+                return False
+            if op == "$lt" and not value < operand:
+                return False
+            if op == "$lte" and not value <= operand:
+                return False
+    return True
+
+
+def matches_filter(metadata, filter):
+    """Evaluate a Pinecone-style metadata filter against one metadata dict"""
+    if not filter:
+        return True
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif not _matches_condition(metadata.get(key), condition):
+            return False
+    return True
+
+
+class LocalVectorStore(VectorStore):
+    """
+    On-disk store for deployments that cannot call out to a hosted vector DB.
+
+    Unit-normalised float32 vectors live in a memory-mapped file with a JSON
+    sidecar holding ids and metadata. Search is exact cosine top-k over the
+    rows that pass the filter. Writes take an exclusive file lock and other
+    processes pick them up on their next query. Without fcntl (Windows) the
+    lock only covers the threads of this process, so only one process may
+    write to the store there.
+
+    Upserts write the vectors file in place, appending new rows after the
+    ones a reader's sidecar knows about. A delete writes the kept rows to a
+    new vectors file that the sidecar then names, so the sidecar and the
+    file it maps always change together.
+    """
+
+    VECTORS_FILE = "vectors.f32"
+    METADATA_FILE = "metadata.json"
+
+    def __init__(self, path, dimension=384):
+        self.path = path
+        self.dimension = dimension
+        self._vectors_path = os.path.join(path, self.VECTORS_FILE)
+        self._generation = 0
+        self._metadata_path = os.path.join(path, self.METADATA_FILE)
+        self._lock = threading.RLock()
+        self._loaded_version = None
+        self._ids = []
+        self._metadata = []
+        self._rows = {}
+        self._postings = {}
+        self._vectors = np.empty((0, dimension), dtype=np.float32)
+        os.makedirs(path, exist_ok=True)
+        self._refresh()
+
+    @contextmanager
+    def _write_lock(self):
+        if fcntl is None:
+            with self._lock:
+                self._refresh()
+                yield
+            return
+        with self._lock, open(os.path.join(self.path, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Reload the sidecar and remap the vectors if another process has written"""
+        try:
+            stat = os.stat(self._metadata_path)
+        except FileNotFoundError:
+            return
+        # Every write replaces the sidecar, so a new inode or size gives it away
+        # where timestamps are too coarse to tell two writes apart
+        version = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if version == self._loaded_version:
+            return
+        with self._lock:
+            with open(self._metadata_path) as f:
+                sidecar = json.load(f)
+            vectors_path = os.path.join(self.path, sidecar.get("vectors_file", self.VECTORS_FILE))
+            try:
+                vectors = np.memmap(vectors_path, dtype=np.float32, mode="r",
+                                    shape=(len(sidecar["ids"]), self.dimension)) if sidecar["ids"] else None
+            except FileNotFoundError:
+                # Removed by a delete since the sidecar was read; the new sidecar names its file
+                return self._refresh()
+            self._ids = sidecar["ids"]
+            self._metadata = sidecar["metadata"]
+            self._rows = {vector_id: row for row, vector_id in enumerate(self._ids)}
+            self._postings = {}
+            self._vectors = vectors if vectors is not None else np.empty((0, self.dimension), dtype=np.float32)
+            self._vectors_path = vectors_path
+            self._generation = sidecar.get("generation", 0)
+            self._loaded_version = version
+
+    def _write_sidecar(self):
+        tmp_path = self._metadata_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"dimension": self.dimension, "generation": self._generation,
+                       "vectors_file": os.path.basename(self._vectors_path),
+                       "ids": self._ids, "metadata": self._metadata}, f)
+        os.replace(tmp_path, self._metadata_path)
+        self._loaded_version = None
+        self._refresh()
+
+    def _normalise(self, values):
+        array = np.atleast_2d(np.asarray(values, dtype=np.float32))
+        if array.ndim != 2 or array.shape[1] != self.dimension:
+            raise ValueError(f"Vectors of {array.shape[-1]} dimensions do not fit a store of {self.dimension}")
+        norms = np.linalg.norm(array, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return array / norms
+
+    def upsert(self, vectors):
+        if not vectors:
+            return
+        with self._write_lock():
+            values = self._normalise([vector["values"] for vector in vectors])
+            updates, appended = [], []
+            for vector, row_values in zip(vectors, values):
+                row = self._rows.get(vector["id"])
+                if row is not None and row >= len(self._ids):
+                    # Repeated within this batch; the last copy wins
+                    appended[row - len(self._ids)] = (vector, row_values)
+                elif row is None:
+                    self._rows[vector["id"]] = len(self._ids) + len(appended)
+                    appended.append((vector, row_values))
+                else:
+                    updates.append((row, row_values))
+                    self._metadata[row] = vector.get("metadata") or {}
+            if updates:
+                writable = np.memmap(self._vectors_path, dtype=np.float32, mode="r+",
+                                     shape=(len(self._ids), self.dimension))
+                for row, row_values in updates:
+                    writable[row] = row_values
+                writable.flush()
+                del writable
+            if appended:
+                with open(self._vectors_path, "ab") as f:
+                    f.write(np.stack([row_values for _, row_values in appended]).tobytes())
+                self._ids.extend(vector["id"] for vector, _ in appended)
+                self._metadata.extend(vector.get("metadata") or {} for vector, _ in appended)
+            self._write_sidecar()
+
+    def query(self, vector, top_k=10, filter=None, include_metadata=True):
+        self._refresh()
+        with self._lock:
+            ids, metadata, vectors = self._ids, self._metadata, self._vectors
+        if filter:
+            candidates = self._candidate_rows(filter)
+            if candidates is None:
+                candidates = range(len(ids))
+            rows = np.fromiter((row for row in candidates if matches_filter(metadata[row], filter)), dtype=np.int64)
+        else:
+            rows = np.arange(len(ids))
+        if not len(rows) or top_k <= 0:
+            return []
+        scores = np.asarray(vectors[rows]) @ self._normalise(vector)[0]
+        if len(rows) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            best = np.arange(len(rows))
+        best = best[np.argsort(-scores[best])]
+        return [
+            {
+                "id": ids[rows[i]],
+                "score": float(scores[i]),
+                "metadata": metadata[rows[i]] if include_metadata else {},
+            }
+            for i in best
+        ]
+
+    def _candidate_rows(self, filter):
+        """
+        Narrow a filter down to candidate rows through per-field postings of
+        its top-level equality conditions; None if it has none.
+        """
+        candidates = None
+        for key, condition in filter.items():
+            if key.startswith("$"):
+                continue
+            if isinstance(condition, dict):
+                if "$eq" not in condition:
+                    continue
+                condition = condition["$eq"]
+            try:
+                rows = self._postings_for(key).get(condition, ())
+            except TypeError:  # unhashable value
+                continue
+            candidates = set(rows) if candidates is None else candidates & set(rows)
+        return None if candidates is None else sorted(candidates)
+
+    def _postings_for(self, field):
+        with self._lock:
+            postings = self._postings.get(field)
+            if postings is None:
+                postings = {}
+                for row, meta in enumerate(self._metadata):
+                    value = meta.get(field)
+                    try:
+                        postings.setdefault(value, []).append(row)
+                    except TypeError:
+                        pass
+                self._postings[field] = postings
+            return postings
+
+    def delete(self, filter=None, ids=None):
+        with self._write_lock():
+            doomed = set(ids or [])
+            keep = [
+                row for row, (vector_id, meta) in enumerate(zip(self._ids, self._metadata))
+                if vector_id not in doomed and not (filter is not None and matches_filter(meta, filter))
+            ]
+            if len(keep) == len(self._ids):
+                return
+            kept_vectors = np.asarray(self._vectors[keep]) if keep else np.empty((0, self.dimension), np.float32)
+            # Readers keep using the old file until the sidecar names the new one
+            old_path = self._vectors_path
+            self._generation += 1
+            self._vectors_path = os.path.join(self.path, f"vectors.{self._generation}.f32")
+            with open(self._vectors_path, "wb") as f:
+                f.write(kept_vectors.astype(np.float32).tobytes())
+            self._vectors = np.empty((0, self.dimension), dtype=np.float32)
+            self._ids = [self._ids[row] for row in keep]
+            self._metadata = [self._metadata[row] for row in keep]
+            self._rows = {vector_id: row for row, vector_id in enumerate(self._ids)}
+            self._write_sidecar()
+            try:
+                os.remove(old_path)
+            except OSError:
+                # Still mapped by a reader where that prevents removal (Windows)
+                pass
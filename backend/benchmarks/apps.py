@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+
+class BenchmarksConfig(AppConfig):
+    """Management commands that measure the other apps and the shared services"""
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'benchmarks'
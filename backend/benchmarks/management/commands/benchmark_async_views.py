@@ -0,0 +1,196 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.asgi import get_asgi_application
+
+ENDPOINTS = {
+    'sync': '/api/lab_technician/general_query/',
+    'async': '/api/lab_technician/general_query/async/',
+}
+
+
+class MockLLMServer:
+    """
+    OpenRouter stand-in that answers every completion after a fixed delay.
+
+    It runs its own event loop on a background thread so that it can hold
+    as many concurrent requests as the endpoints under test send it.
+    """
+
+    RESPONSE = json.dumps({
+        'choices': [{'message': {'content': 'A lipid panel measures cholesterol and triglycerides.'}}],
+        'usage': {'prompt_tokens': 250, 'completion_tokens': 12},
+    }).encode()
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.port = None
+        self._loop = asyncio.new_event_loop()
+        self._server = None
+        self._writers = set()
+        self._started = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return f"http://127.0.0.1:{self.port}/"
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _shutdown(self):
+        # Closing the idle keep-alive connections lets their handlers return
+        self._server.close()
+        for writer in list(self._writers):
+            writer.transport.abort()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _serve(self):
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle, '127.0.0.1', 0, backlog=4096)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._started.set()
+        self._loop.run_forever()
+
+    async def _handle(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = 0
+                for line in head.split(b'\r\n'):
+                    name, _, value = line.partition(b':')
+                    if name.strip().lower() == b'content-length':
+                        length = int(value)
+                await reader.readexactly(length)
+                await asyncio.sleep(self.latency)
+                writer.write(
+                    b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                    + f'Content-Length: {len(self.RESPONSE)}\r\n\r\n'.encode()
+                    + self.RESPONSE
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+
+async def post_json(app, path, data):
+    """POST data to the ASGI app as a server would; returns the response status"""
+    body = json.dumps(data).encode()
+    host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost'
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [
+            (b'host', host.encode()),
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ],
+        'client': ('127.0.0.1', 0), 'server': (host, 80),
+    }
+    request_sent = False
+    status = None
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        # The client never disconnects
+        await asyncio.Future()
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await app(scope, receive, send)
+    return status
+
+
+class Command(BaseCommand):
+    help = ('Compare throughput of the sync and async general lab query endpoints under concurrent load, '
+            'served through the ASGI handler against a mock LLM.')
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint.')
+        parser.add_argument('--concurrency', type=int, default=100, help='Requests in flight at once.')
+        parser.add_argument('--latency', type=float, default=1.0, help='Seconds the mock LLM takes per completion.')
+        parser.add_argument('--url', help='Completions URL of an already running mock instead of the built-in one.')
+        parser.add_argument('--only', choices=sorted(ENDPOINTS), help='Benchmark one endpoint only.')
+
+    def handle(self, *args, **options):
+        server = None
+        if options['url']:
+            settings.OPENROUTER_URL = options['url']
+        else:
+            server = MockLLMServer(options['latency'])
+            settings.OPENROUTER_URL = server.start()
+        # Every request must reach the model
+        settings.LAB_ANSWER_CACHE_MAX_ENTRIES = 0
+
+        self.stdout.write(
+            f"{options['requests']} requests, {options['concurrency']} concurrent, "
+            f"LLM_MAX_CONCURRENCY={settings.LLM_MAX_CONCURRENCY}, "
+            f"LLM_ASYNC_MAX_CONCURRENCY={settings.LLM_ASYNC_MAX_CONCURRENCY}"
+        )
+        self.stdout.write(f"{'endpoint':<8} {'req/s':>8} {'p50 s':>7} {'p95 s':>7} {'errors':>7} {'peak threads':>13}")
+        try:
+            for name, path in ENDPOINTS.items():
+                if options['only'] and name != options['only']:
+                    continue
+                result = asyncio.run(self.run_load(path, options['requests'], options['concurrency']))
+                self.stdout.write(
+                    f"{name:<8} {result['throughput']:>8.1f} {result['p50']:>7.2f} {result['p95']:>7.2f} "
+                    f"{result['errors']:>7} {result['peak_threads']:>13}"
+                )
+        finally:
+            if server is not None:
+                server.stop()
+
+    async def run_load(self, path, total, concurrency):
+        # The real ASGI application rather than the test client, which runs
+        # every sync view on one shared thread
+        app = get_asgi_application()
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+        errors = 0
+        peak_threads = threading.active_count()
+
+        async def one(i):
+            nonlocal errors, peak_threads
+            async with semaphore:
+                started = time.perf_counter()
+                status = await post_json(app, path, {'query': f'What is a lipid panel? ({i})'})
+                latencies.append(time.perf_counter() - started)
+                if status != 200:
+                    errors += 1
+                peak_threads = max(peak_threads, threading.active_count())
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        return {
+            'throughput': total / elapsed,
+            'p50': statistics.median(latencies),
+            'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            'errors': errors,
+            'peak_threads': peak_threads,
+        }
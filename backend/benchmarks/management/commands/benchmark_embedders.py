@@ -0,0 +1,128 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from backend.embeddings import BACKENDS, EMBEDDING_DIMENSION, get_embedder
+
+SAMPLE_SENTENCES = [
+    "Hemoglobin 8.7 g/dL, below the reference range of 13.0 - 17.0.",
+    "Total leucocyte count is 13400 cells/cumm.",
+    "Microcytic hypochromic red cells with few pencil and target cells seen.",
+    "Advise serum ferritin and iron studies.",
+    "Fasting blood glucose 126 mg/dL, above the normal range.",
+    "LDL cholesterol 162 mg/dL; consider lifestyle modification.",
+    "What is my latest hemoglobin value?",
+    "Platelet count within normal limits.",
+]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where the resource module is missing (Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB, or None where it cannot be read"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def format_mb(value, width):
+    return f"{'-':>{width}}" if value is None else f"{value:>{width}.1f}"
+
+
+class Command(BaseCommand):
+    help = 'Compare encode throughput, memory and vector agreement of the embedding backends.'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', default='torch,onnx-int8',
+                            help=f"Comma-separated backends to compare ({', '.join(BACKENDS)}); the first is the reference.")
+        parser.add_argument('--sentences', type=int, default=1024, help='Number of sentences to encode.')
+        parser.add_argument('--batch-size', type=int, default=settings.EMBEDDING_BATCH_SIZE)
+        parser.add_argument('--tolerance', type=float, default=0.99,
+                            help='Minimum cosine similarity to the reference vectors.')
+        # Internal: measure one backend in a fresh process so memory figures are not mixed
+        parser.add_argument('--child', help='Backend to measure in this process.')
+        parser.add_argument('--output', help='Where the child writes its vectors.')
+
+    def handle(self, *args, **options):
+        sentences = [SAMPLE_SENTENCES[i % len(SAMPLE_SENTENCES)] + f" (sample {i})"
+                     for i in range(options['sentences'])]
+        if options['child']:
+            return self.measure(options['child'], sentences, options)
+
+        backends = [b.strip() for b in options['backends'].split(',') if b.strip()]
+        unknown = set(backends) - set(BACKENDS)
+        if unknown:
+            raise CommandError(f"Unknown backend(s): {', '.join(sorted(unknown))}")
+
+        results = []
+        with tempfile.TemporaryDirectory() as tmp:
+            for backend in backends:
+                output = os.path.join(tmp, f'{backend}.npy')
+                proc = subprocess.run(
+                    [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'benchmark_embedders',
+                     '--child', backend, '--output', output,
+                     '--sentences', str(options['sentences']), '--batch-size', str(options['batch_size'])],
+                    capture_output=True, text=True,
+                )
+                if proc.returncode != 0:
+                    self.stderr.write(f"{backend}: failed\n{proc.stderr.strip()}")
+                    continue
+                result = json.loads(proc.stdout.strip().splitlines()[-1])
+                result['vectors'] = np.load(output)
+                results.append(result)
+
+        if not results:
+            raise CommandError('No backend could be measured.')
+        reference = results[0]['vectors']
+        self.stdout.write(f"{'backend':<10} {'load s':>7} {'sent/s':>9} {'model MB':>9} {'peak MB':>8} {'min cos':>8} {'mean cos':>9}")
+        for result in results:
+            cosine = (result['vectors'] * reference).sum(axis=1)
+            ok = cosine.min() >= options['tolerance']
+            self.stdout.write(
+                f"{result['backend']:<10} {result['load_seconds']:>7.2f} {result['sentences_per_second']:>9.1f} "
+                f"{format_mb(result['model_mb'], 9)} {format_mb(result['peak_mb'], 8)} "
+                f"{cosine.min():>8.4f} {cosine.mean():>9.4f}"
+                + ('' if ok else '  (outside tolerance)')
+            )
+
+    def measure(self, backend, sentences, options):
+        baseline_mb = current_rss_mb()
+        started = time.perf_counter()
+        model = get_embedder(backend)
+        load_seconds = time.perf_counter() - started
+        loaded_mb = current_rss_mb()
+
+        model.encode(sentences[:options['batch_size']], batch_size=options['batch_size'])  # warm-up
+        started = time.perf_counter()
+        vectors = model.encode(sentences, batch_size=options['batch_size'], normalize_embeddings=True)
+        encode_seconds = time.perf_counter() - started
+        if vectors.shape[1] != EMBEDDING_DIMENSION:
+            raise CommandError(f"{backend} produced {vectors.shape[1]}-d vectors, expected {EMBEDDING_DIMENSION}")
+
+        np.save(options['output'], vectors.astype(np.float32))
+        self.stdout.write(json.dumps({
+            'backend': backend,
+            'load_seconds': load_seconds,
+            'sentences_per_second': len(sentences) / encode_seconds,
+            'model_mb': None if loaded_mb is None or baseline_mb is None else loaded_mb - baseline_mb,
+            'peak_mb': peak_rss_mb(),
+        }))
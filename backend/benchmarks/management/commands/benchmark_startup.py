@@ -0,0 +1,52 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Run in a fresh interpreter so every measurement starts from a cold import cache
+PROBE = """
+import json, os, sys, time
+sys.path.insert(0, {base_dir!r})
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+started = time.perf_counter()
+import django
+django.setup()
+setup_seconds = time.perf_counter() - started
+started = time.perf_counter()
+__import__({module!r})
+print(json.dumps({{'setup': setup_seconds, 'import': time.perf_counter() - started}}))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Measure cold import time of each project app, as paid at URL loading and worker boot.'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per module; the median is reported.')
+
+    def handle(self, *args, **options):
+        apps = [app for app in settings.INSTALLED_APPS
+                if os.path.isfile(os.path.join(settings.BASE_DIR, app, 'urls.py'))]
+        modules = [f'{app}.urls' for app in apps] + [settings.ROOT_URLCONF]
+
+        self.stdout.write(f"{'module':<24} {'django.setup s':>15} {'import s':>9}")
+        for module in modules:
+            runs = []
+            for _ in range(options['repeat']):
+                proc = subprocess.run(
+                    [sys.executable, '-c', PROBE.format(base_dir=str(settings.BASE_DIR), module=module)],
+                    capture_output=True, text=True,
+                )
+                if proc.returncode != 0:
+                    error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'unknown error'
+                    self.stdout.write(f"{module:<24} failed: {error}")
+                    break
+                runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+            else:
+                setup = statistics.median(run['setup'] for run in runs)
+                imported = statistics.median(run['import'] for run in runs)
+                self.stdout.write(f"{module:<24} {setup:>15.3f} {imported:>9.3f}")
@@ -1,3 +1,12 @@
 from django.contrib import admin
+from .models import DashboardAggregate
 
 # Register your models here.
+
+@admin.register(DashboardAggregate)
+class DashboardAggregateAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'key', 'value', 'updated_at')
+    list_filter = ('kind',)
+    ordering = ('kind', 'key')
+    search_fields = ('key',)
+    readonly_fields = ('kind', 'key', 'value', 'updated_at')
@@ -0,0 +1,103 @@
+"""
+Upkeep of the DashboardAggregate counters.
+
+Counters move by deltas in the transaction that changes the reports: a
+created report counts towards the totals and its month, observation syncs
+(uploads and merges) move the abnormal counters, and a deleted report takes
+back its counts. rebuild() recomputes everything from the tables.
+"""
+from collections import Counter
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from patients.models import MedicalReport, ParameterObservation
+from .models import DashboardAggregate
+
+ABNORMAL_EXCLUDED_STATUSES = ['', 'normal']
+
+
+def month_key(moment):
+    return timezone.localtime(moment).strftime('%Y-%m')
+
+
+def bump(kind, key, delta):
+    """Add delta to a counter, creating it if needed"""
+    if not delta:
+        return
+    counters = DashboardAggregate.objects.filter(kind=kind, key=key)
+    if counters.update(value=F('value') + delta):
+        return
+    try:
+        with transaction.atomic():
+            DashboardAggregate.objects.create(kind=kind, key=key, value=delta)
+    except IntegrityError:
+        # Created concurrently
+        counters.update(value=F('value') + delta)
+
+
+def apply_abnormal(changes):
+    """Apply {parameter name: change in abnormal readings}"""
+    with transaction.atomic():
+        for name, change in changes.items():
+            bump(DashboardAggregate.KIND_ABNORMAL, name, change)
+        bump(DashboardAggregate.KIND_TOTAL, DashboardAggregate.TOTAL_ABNORMAL, sum(changes.values()))
+
+
+def report_created(report):
+    with transaction.atomic():
+        bump(DashboardAggregate.KIND_TOTAL, DashboardAggregate.TOTAL_REPORTS, 1)
+        bump(DashboardAggregate.KIND_MONTH, month_key(report.created_at), 1)
+
+
+def abnormal_counts(report):
+    """The report's abnormal readings per parameter name, from its stored observations"""
+    return Counter(dict(
+        ParameterObservation.objects.filter(report=report)
+        .exclude(status__in=ABNORMAL_EXCLUDED_STATUSES)
+        .values_list('name').annotate(count=Count('id'))
+    ))
+
+
+def report_deleted(report, abnormal):
+    """Take back a deleted report's counts; abnormal is its abnormal_counts from before the delete"""
+    with transaction.atomic():
+        bump(DashboardAggregate.KIND_TOTAL, DashboardAggregate.TOTAL_REPORTS, -1)
+        bump(DashboardAggregate.KIND_MONTH, month_key(report.created_at), -1)
+        apply_abnormal({name: -count for name, count in abnormal.items()})
+
+
+def compute(reports, observations):
+    """Every counter's value from report and observation querysets, as {(kind, key): value}"""
+    counts = {(DashboardAggregate.KIND_TOTAL, DashboardAggregate.TOTAL_REPORTS): reports.count()}
+    for row in reports.annotate(month=TruncMonth('created_at')).values('month').annotate(count=Count('id')):
+        counts[(DashboardAggregate.KIND_MONTH, row['month'].strftime('%Y-%m'))] = row['count']
+    abnormal = observations.exclude(status__in=ABNORMAL_EXCLUDED_STATUSES)
+    for row in abnormal.values('name').annotate(count=Count('id')):
+        counts[(DashboardAggregate.KIND_ABNORMAL, row['name'])] = row['count']
+    counts[(DashboardAggregate.KIND_TOTAL, DashboardAggregate.TOTAL_ABNORMAL)] = abnormal.count()
+    return counts
+
+
+def rebuild():
+    """Recompute every counter from the reports and observations; returns how many counters were written"""
+    with transaction.atomic():
+        counts = compute(MedicalReport.objects.all(), ParameterObservation.objects.all())
+        DashboardAggregate.objects.all().delete()
+        DashboardAggregate.objects.bulk_create([
+            DashboardAggregate(kind=kind, key=key, value=value) for (kind, key), value in counts.items()
+        ])
+    return len(counts)
+
+
+def get_counters(top=5):
+    """Totals, reports per month and the top abnormal parameters, read from the counters"""
+    totals, months, abnormal = {}, {}, []
+    rows = DashboardAggregate.objects.filter(value__gt=0).exclude(kind=DashboardAggregate.KIND_ABNORMAL)
+    for kind, key, value in rows.values_list('kind', 'key', 'value'):
+        (totals if kind == DashboardAggregate.KIND_TOTAL else months)[key] = value
+    abnormal = list(
+        DashboardAggregate.objects.filter(kind=DashboardAggregate.KIND_ABNORMAL, value__gt=0)
+        .order_by('-value', 'key').values_list('key', 'value')[:top]
+    )
+    return {'totals': totals, 'months': months, 'top_abnormal': abnormal}
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from dashboard import aggregates
+
+
+class Command(BaseCommand):
+    help = 'Recompute the dashboard counters from the reports and observations, e.g. after a failed write or a bulk import.'
+
+    def handle(self, *args, **options):
+        count = aggregates.rebuild()
+        self.stdout.write(f"Rebuilt {count} dashboard counter(s).")
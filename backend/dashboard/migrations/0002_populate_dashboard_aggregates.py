@@ -0,0 +1,42 @@
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+
+
+def compute(reports, observations):
+    """Every counter's value, as {(kind, key): value}; copied from dashboard.aggregates when this was written"""
+    counts = {('total', 'reports'): reports.count()}
+    for row in reports.annotate(month=TruncMonth('created_at')).values('month').annotate(count=Count('id')):
+        counts[('month', row['month'].strftime('%Y-%m'))] = row['count']
+    abnormal = observations.exclude(status__in=['', 'normal'])
+    for row in abnormal.values('name').annotate(count=Count('id')):
+        counts[('abnormal', row['name'])] = row['count']
+    counts[('total', 'abnormal_readings')] = abnormal.count()
+    return counts
+
+
+def populate(apps, schema_editor):
+    DashboardAggregate = apps.get_model('dashboard', 'DashboardAggregate')
+    counts = compute(
+        apps.get_model('patients', 'MedicalReport').objects.all(),
+        apps.get_model('patients', 'ParameterObservation').objects.all(),
+    )
+    DashboardAggregate.objects.bulk_create([
+        DashboardAggregate(kind=kind, key=key, value=value) for (kind, key), value in counts.items()
+    ])
+
+
+def clear(apps, schema_editor):
+    apps.get_model('dashboard', 'DashboardAggregate').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_initial'),
+        ('patients', '0015_backfill_parameter_observations'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate, clear),
+    ]
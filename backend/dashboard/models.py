@@ -1,3 +1,32 @@
 from django.db import models
 
 # Create your models here.
+
+class DashboardAggregate(models.Model):
+    """
+    A dashboard counter, kept up to date as reports are created, merged and
+    deleted: totals, reports created per month (key 'YYYY-MM') and abnormal
+    readings per parameter name.
+    """
+    KIND_TOTAL = 'total'
+    KIND_MONTH = 'month'
+    KIND_ABNORMAL = 'abnormal'
+    KIND_CHOICES = [
+        (KIND_TOTAL, 'Total'),
+        (KIND_MONTH, 'Reports per month'),
+        (KIND_ABNORMAL, 'Abnormal readings per parameter'),
+    ]
+    # Keys of the total counters
+    TOTAL_REPORTS = 'reports'
+    TOTAL_ABNORMAL = 'abnormal_readings'
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    key = models.CharField(max_length=200)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('kind', 'key')]
+
+    def __str__(self):
+        return f"{self.kind} {self.key}: {self.value}"
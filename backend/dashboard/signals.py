@@ -0,0 +1,43 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from patients.models import ChatSession, MedicalReport, Patient
+from patients.signals import observations_changed
+from . import aggregates
+from .summary import invalidate_summary
+
+
+@receiver(post_save, sender=MedicalReport)
+def report_saved(sender, instance, created, **kwargs):
+    if created:
+        aggregates.report_created(instance)
+
+
+@receiver(observations_changed)
+def report_observations_changed(sender, report, abnormal, **kwargs):
+    """A report was uploaded or merged into"""
+    aggregates.apply_abnormal(abnormal)
+
+
+@receiver(pre_delete, sender=MedicalReport)
+def report_deleting(sender, instance, **kwargs):
+    # The observations are deleted along with the report, so count them first
+    instance._dashboard_abnormal = aggregates.abnormal_counts(instance)
+
+
+@receiver(post_delete, sender=MedicalReport)
+def report_deleted(sender, instance, **kwargs):
+    aggregates.report_deleted(instance, getattr(instance, '_dashboard_abnormal', {}))
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+@receiver(post_save, sender=MedicalReport)
+@receiver(post_delete, sender=MedicalReport)
+@receiver(post_save, sender=ChatSession)
+@receiver(post_delete, sender=ChatSession)
+@receiver(observations_changed)
+def dashboard_data_changed(sender, **kwargs):
+    invalidate_summary()
+    # Again after commit, in case a concurrent request cached the old data meanwhile
+    transaction.on_commit(invalidate_summary)
@@ -0,0 +1,78 @@
+"""
+The dashboard summary payload, cached until the data behind it changes.
+
+The payload is kept in the cache with an ETag (a hash of its JSON) and the
+month it was built in, so polling clients can be answered 304 Not Modified
+and a new month always rebuilds the reports-per-month window. Signals drop
+the cached copy when patients, reports or chats change.
+"""
+import hashlib
+from datetime import date
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from patients.models import ChatMessage, ChatSession, MedicalReport, Patient
+from . import aggregates
+from .models import DashboardAggregate
+
+CACHE_KEY = 'dashboard_summary'
+MONTHS = 6
+
+
+def last_months(count, today):
+    """First days of the `count` calendar months up to and including today's, oldest first"""
+    year, month = today.year, today.month
+    months = []
+    for _ in range(count):
+        months.append(date(year, month, 1))
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    return months[::-1]
+
+
+def build_summary(today=None):
+    today = today or timezone.localdate()
+    counters = aggregates.get_counters()
+    # Recent chats, with each conversation's latest question
+    last_question = ChatMessage.objects.filter(
+        session=OuterRef('pk'), role=ChatMessage.ROLE_USER).order_by('-id').values('content')[:1]
+    recent_chats = list(ChatSession.objects.order_by('-updated_at')[:5].annotate(
+        last_question=Subquery(last_question)).values(
+        'session_id', 'source', 'patient_id', 'patient__name', 'last_question', 'updated_at'))
+    recent_reports = list(MedicalReport.objects.order_by('-created_at')[:5].values(
+        'id', 'report_type', 'report_date', 'patient__name', 'created_at'))
+    return {
+        'total_patients': Patient.objects.count(),
+        'total_reports': counters['totals'].get(DashboardAggregate.TOTAL_REPORTS, 0),
+        'recent_chats': recent_chats,
+        'recent_reports': recent_reports,
+        'abnormal_count': counters['totals'].get(DashboardAggregate.TOTAL_ABNORMAL, 0),
+        'top_abnormal': counters['top_abnormal'],
+        'reports_per_month': {
+            month.strftime('%b %Y'): counters['months'].get(month.strftime('%Y-%m'), 0)
+            for month in last_months(MONTHS, today)
+        },
+    }
+
+
+def get_summary():
+    """(payload, etag) for the dashboard, from the cache when it is current"""
+    month = timezone.localdate().strftime('%Y-%m')
+    cached = cache.get(CACHE_KEY)
+    if cached is None or cached['month'] != month:
+        payload = build_summary()
+        etag = hashlib.sha256(JSONRenderer().render(payload)).hexdigest()[:32]
+        cached = {'month': month, 'payload': payload, 'etag': etag}
+        cache.set(CACHE_KEY, cached, settings.DASHBOARD_CACHE_SECONDS)
+    return cached['payload'], cached['etag']
+
+
+def get_etag(request, *args, **kwargs):
+    return get_summary()[1]
+
+
+def invalidate_summary():
+    cache.delete(CACHE_KEY)
@@ -1,3 +1,103 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import date
+from unittest import mock
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from patients.merge import merge_reports
+from patients.models import MedicalReport, ParameterObservation, Patient
+from . import aggregates
+from .models import DashboardAggregate
+from .summary import build_summary, last_months
 
-# Create your tests here.
+
+def upload(report_type, readings, report_date='2025-01-01'):
+    """An extracted upload with a reading (value, status) per parameter name"""
+    report_data = {
+        'report_type': report_type,
+        'report_date': report_date,
+        'parameters': [{'name': name, 'value': value, 'status': status} for name, (value, status) in readings.items()],
+    }
+    return report_data, ContentFile(b'%PDF-1.4', name='report.pdf')
+
+
+# The summary refresh that report saves schedule would call the model
+@mock.patch('health_summary.signals.schedule_regeneration')
+class CountersTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media, REPORT_MERGE_LOCK_DIR=media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.patient = Patient.objects.create(name='Asha Rao', age=52, sex='F', mobile='5550101')
+
+    def assertCountersMatchTables(self):
+        counters = {(kind, key): value for kind, key, value
+                    in DashboardAggregate.objects.exclude(value=0).values_list('kind', 'key', 'value')}
+        computed = aggregates.compute(MedicalReport.objects.all(), ParameterObservation.objects.all())
+        self.assertEqual(counters, {counter: value for counter, value in computed.items() if value})
+
+    def test_counters_follow_uploads_merges_and_deletes(self, _):
+        (lipid, _), (glucose, _) = merge_reports(self.patient, [
+            upload('Lipid Profile', {'Cholesterol': ('250', 'high'), 'HDL': ('50', 'normal')}),
+            upload('Glucose', {'Glucose': ('140', 'high')}),
+        ])
+        self.assertCountersMatchTables()
+        self.assertEqual(aggregates.get_counters()['top_abnormal'], [('Cholesterol', 1), ('Glucose', 1)])
+
+        merge_reports(self.patient, [upload('Lipid Profile', {'Cholesterol': ('240', 'High'), 'HDL': ('30', 'low')},
+                                            report_date='2025-02-01')])
+        self.assertCountersMatchTables()
+        self.assertEqual(aggregates.get_counters()['totals'], {'reports': 2, 'abnormal_readings': 4})
+
+        glucose.delete()
+        self.assertCountersMatchTables()
+        lipid.delete()
+        self.assertCountersMatchTables()
+        self.assertFalse(DashboardAggregate.objects.exclude(value=0).exists())
+
+    def test_rebuild_recomputes_the_counters(self, _):
+        merge_reports(self.patient, [upload('Glucose', {'Glucose': ('140', 'high')})])
+        DashboardAggregate.objects.update(value=99)
+        aggregates.rebuild()
+        self.assertCountersMatchTables()
+
+
+class LastMonthsTests(SimpleTestCase):
+    def test_calendar_months_across_a_year_end(self):
+        # Stepping back 30 days from 31 March lands in March again and skips February
+        self.assertEqual(last_months(6, date(2025, 3, 31)), [
+            date(2024, 10, 1), date(2024, 11, 1), date(2024, 12, 1),
+            date(2025, 1, 1), date(2025, 2, 1), date(2025, 3, 1),
+        ])
+
+
+class DashboardSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.url = reverse('dashboard-summary')
+
+    def test_reports_per_month_has_a_bucket_per_calendar_month(self):
+        months = build_summary(today=date(2025, 3, 31))['reports_per_month']
+        self.assertEqual(list(months), ['Oct 2024', 'Nov 2024', 'Dec 2024', 'Jan 2025', 'Feb 2025', 'Mar 2025'])
+
+    def test_unchanged_summary_is_answered_not_modified(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertEqual(response.json()['total_patients'], 0)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_a_change_drops_the_cached_summary(self):
+        etag = self.client.get(self.url)['ETag']
+        Patient.objects.create(name='Asha Rao', age=52, sex='F', mobile='5550101')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['total_patients'], 1)
@@ -1,3 +1,11 @@
 from django.contrib import admin
+from .models import HealthSummary
 
 # Register your models here.
+
+@admin.register(HealthSummary)
+class HealthSummaryAdmin(admin.ModelAdmin):
+    list_display = ('patient', 'generated_at', 'generation_seconds', 'version')
+    list_select_related = ('patient',)
+    search_fields = ('patient__name',)
+    readonly_fields = ('version', 'generated_at', 'generation_seconds', 'error')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from health_summary import summaries
+from health_summary.models import HealthSummary
+
+
+class Command(BaseCommand):
+    help = 'Regenerate stored health summaries, in full by default.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patient', type=int, action='append', help='Patient id; repeat for several. Defaults to every stored summary.')
+        parser.add_argument('--incremental', action='store_true', help='Only apply report changes since each summary was generated.')
+
+    def handle(self, *args, **options):
+        patient_ids = options['patient'] or list(HealthSummary.objects.values_list('patient_id', flat=True))
+        for patient_id in patient_ids:
+            try:
+                summary = summaries.regenerate_summary(patient_id, full=not options['incremental'])
+            except Exception as e:
+                self.stderr.write(f"Patient {patient_id}: failed: {e}")
+                continue
+            if summary is None:
+                self.stdout.write(f"Patient {patient_id}: no reports, summary removed")
+            else:
+                self.stdout.write(f"Patient {patient_id}: regenerated in {summary.generation_seconds:.1f}s")
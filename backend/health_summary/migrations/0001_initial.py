@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('patients', '0012_reportfingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HealthSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('summary', models.TextField()),
+                ('version', models.CharField(max_length=64)),
+                ('generated_at', models.DateTimeField()),
+                ('generation_seconds', models.FloatField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='health_summary', to='patients.patient')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_summary', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='healthsummary',
+            name='full_generated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='healthsummary',
+            name='incremental_updates',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='healthsummary',
+            name='report_state',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -1,3 +1,23 @@
 from django.db import models
+from patients.models import Patient
 
 # Create your models here.
+
+class HealthSummary(models.Model):
+    """The latest generated health summary of a patient"""
+    patient = models.OneToOneField(Patient, on_delete=models.CASCADE, related_name='health_summary')
+    summary = models.TextField()
+    # Hash of the report context the summary was generated from
+    version = models.CharField(max_length=64)
+    # Per report, the dates, value counts and observation and advice hashes the summary covers
+    report_state = models.JSONField(default=dict, blank=True)
+    generated_at = models.DateTimeField()
+    # When the summary was last rebuilt from the full history, and updates since
+    full_generated_at = models.DateTimeField(blank=True, null=True)
+    incremental_updates = models.PositiveIntegerField(default=0)
+    generation_seconds = models.FloatField(default=0)
+    # Error of the last failed regeneration, cleared on success
+    error = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return f"Summary of {self.patient} ({self.version[:8]})"
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from patients.models import MedicalReport
+from .summaries import schedule_regeneration
+
+
+@receiver(post_save, sender=MedicalReport)
+@receiver(post_delete, sender=MedicalReport)
+def report_changed(sender, instance, **kwargs):
+    """A report was uploaded, merged into or deleted; refresh the patient's summary"""
+    schedule_regeneration(instance.patient_id)
@@ -0,0 +1,356 @@
+"""
+Stored health summaries, regenerated in the background when reports change.
+
+A summary records a hash of the report context it was generated from, so
+a summary whose hash no longer matches the patient's current context is
+stale. Reads return the stored summary straight away with a stale flag
+while a regeneration is pending.
+
+Regeneration is incremental: the model gets the previous summary and only
+the report data changed since, recorded as a report_state snapshot. A full
+rebuild from the whole history happens on demand, when the change is not
+purely additive, and after HEALTH_SUMMARY_MAX_INCREMENTAL_UPDATES updates or
+HEALTH_SUMMARY_FULL_REBUILD_DAYS days.
+
+Concurrent generations for the same patient and report data, whether from
+requests or the background worker, share one model call.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from backend import singleflight
+from backend.background import submit
+from backend.llm import MISTRAL_MODEL, acomplete, astream_completion
+from patients.context import (
+    as_list, build_context_chunks, get_context_reports, get_patient_context, render_context, render_parameter,
+)
+from .models import HealthSummary
+from .summary_utils import get_patient_summary, patient_summary_prompt, stream_patient_summary, update_patient_summary
+
+logger = logging.getLogger(__name__)
+
+_scheduled = set()
+# Patients whose next scheduled regeneration must be a full rebuild
+_full = set()
+_lock = threading.Lock()
+
+
+def context_version(report_text):
+    return hashlib.sha256(report_text.encode()).hexdigest()
+
+
+def content_hash(items):
+    return hashlib.sha256(json.dumps(items, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def report_state(reports):
+    """
+    Snapshot of what a summary covers: per report, its dates, how many values
+    it had per parameter, and hashes of its observations and advice, which a
+    merge replaces rather than extends
+    """
+    return {
+        str(report.pk): {
+            'report_type': report.report_type,
+            'dates': [str(date) for date in (report.report_dates or [report.report_date])],
+            'values': {
+                param['name']: len(as_list(param.get('value')))
+                for param in report.parameters if isinstance(param, dict) and param.get('name')
+            },
+            'observations_hash': content_hash(report.observations),
+            'advise_hash': content_hash(report.advise),
+        }
+        for report in reports
+    }
+
+
+def _replaced(report_type, label, items):
+    if not items:
+        return [f"{report_type} {label}: none any more (the earlier ones no longer apply)"]
+    return [f"{report_type} {label}, replacing the earlier ones:"] + [f"- {item}" for item in items]
+
+
+def describe_changes(reports, previous_state):
+    """
+    The report data changed since previous_state was taken, as prompt text:
+    new reports, dates and values, and the current observations and advice
+    of reports whose observations or advice were replaced.
+
+    Returns None when the change cannot be described that way (a report was
+    deleted, earlier values were rewritten, or the snapshot predates the
+    observation and advice hashes), in which case the summary has to be
+    rebuilt in full.
+    """
+    if set(previous_state) - {str(report.pk) for report in reports}:
+        return None
+    lines = []
+    for report in reports:
+        before = previous_state.get(str(report.pk))
+        dates = [str(date) for date in (report.report_dates or [report.report_date])]
+        if before is None:
+            lines.append(f"New report: {report.report_type} (dates: {', '.join(dates)})")
+            lines.extend(render_parameter(report.report_type, param) for param in report.parameters
+                         if isinstance(param, dict) and param.get('name'))
+            lines.extend(f"{report.report_type} observation: {observation}" for observation in report.observations)
+            lines.extend(f"{report.report_type} advice: {advice}" for advice in report.advise)
+            continue
+        if 'observations_hash' not in before or 'advise_hash' not in before:
+            return None
+        new_dates = [date for date in dates if date not in before['dates']]
+        if new_dates:
+            lines.append(f"New {report.report_type} results dated {', '.join(new_dates)}")
+        for param in report.parameters:
+            if not isinstance(param, dict) or not param.get('name'):
+                continue
+            seen = before['values'].get(param['name'], 0)
+            count = len(as_list(param.get('value')))
+            if count < seen:
+                return None
+            if count > seen:
+                lines.append(render_parameter(report.report_type, param, start=seen))
+        if content_hash(report.observations) != before['observations_hash']:
+            lines.extend(_replaced(report.report_type, 'observations', report.observations))
+        if content_hash(report.advise) != before['advise_hash']:
+            lines.extend(_replaced(report.report_type, 'advice', report.advise))
+    return "\n".join(lines)
+
+
+def full_rebuild_due(summary):
+    """Whether enough incremental updates or time have passed to rebuild from the full history"""
+    if not summary.report_state or summary.full_generated_at is None:
+        return True
+    if summary.incremental_updates >= settings.HEALTH_SUMMARY_MAX_INCREMENTAL_UPDATES:
+        return True
+    return timezone.now() - summary.full_generated_at >= timedelta(days=settings.HEALTH_SUMMARY_FULL_REBUILD_DAYS)
+
+
+def _store(patient_id, summary, version, reports, started, previous=None):
+    now = timezone.now()
+    defaults = {
+        'summary': summary,
+        'version': version,
+        'report_state': report_state(reports),
+        'generated_at': now,
+        'generation_seconds': round(time.perf_counter() - started, 3),
+        'error': '',
+    }
+    if previous is None:
+        defaults.update(full_generated_at=now, incremental_updates=0)
+    else:
+        defaults['incremental_updates'] = previous.incremental_updates + 1
+    HealthSummary.objects.update_or_create(patient_id=patient_id, defaults=defaults)
+    return HealthSummary.objects.get(patient_id=patient_id)
+
+
+def _load_context(patient_id):
+    reports = get_context_reports(patient_id)
+    return reports, render_context(build_context_chunks(patient_id, reports))
+
+
+def regenerate_summary(patient_id, full=False):
+    """
+    Generate and store the patient's summary unless it is already current.
+
+    An existing summary is updated from only the report data added since it
+    was generated, unless full is set, the change is not purely additive or
+    a periodic full rebuild is due. Returns the HealthSummary, or None if the
+    patient has no reports.
+    """
+    # The context and the report_state snapshot come from the same rows
+    reports, report_text = _load_context(patient_id)
+    if not report_text:
+        HealthSummary.objects.filter(patient_id=patient_id).delete()
+        return None
+    version = context_version(report_text)
+    existing = HealthSummary.objects.filter(patient_id=patient_id).first()
+    if existing is not None and existing.version == version and not full:
+        return existing
+
+    changes = None
+    if existing is not None and not full and not full_rebuild_due(existing):
+        changes = describe_changes(reports, existing.report_state)
+
+    started = time.perf_counter()
+    try:
+        if changes:
+            logger.info("Updating summary of patient %s from %d characters of new data", patient_id, len(changes))
+            summary = update_patient_summary(existing.summary, changes)
+        else:
+            summary = get_patient_summary(report_text)
+    except Exception as e:
+        HealthSummary.objects.filter(patient_id=patient_id).update(error=str(e))
+        raise
+    return _store(patient_id, summary, version, reports, started, previous=existing if changes else None)
+
+
+def _flight_key(patient_id, full=False):
+    version = context_version(get_patient_context(patient_id))
+    return singleflight.flight_key('health_summary', patient_id, version=f"{version}:{int(full)}")
+
+
+def regenerate_summary_once(patient_id, full=False):
+    """regenerate_summary, shared with concurrent calls for the same patient and report data"""
+    return singleflight.do(_flight_key(patient_id, full), regenerate_summary, patient_id, full=full)
+
+
+def _regenerate_scheduled(patient_id):
+    with _lock:
+        full = patient_id in _full
+        _full.discard(patient_id)
+    try:
+        regenerate_summary_once(patient_id, full=full)
+    finally:
+        with _lock:
+            _scheduled.discard(patient_id)
+            again = patient_id in _full
+    # Reports may have changed, or a rebuild been requested, while the model was running
+    if again or is_stale(patient_id):
+        schedule_regeneration(patient_id)
+
+
+def schedule_regeneration(patient_id, full=False):
+    """Regenerate the patient's summary in the background once the current transaction commits"""
+    def enqueue():
+        with _lock:
+            if full:
+                _full.add(patient_id)
+            if patient_id in _scheduled:
+                return
+            _scheduled.add(patient_id)
+        try:
+            submit(_regenerate_scheduled, patient_id)
+        except Exception:
+            with _lock:
+                _scheduled.discard(patient_id)
+            logger.exception("Could not schedule summary regeneration for patient %s", patient_id)
+
+    transaction.on_commit(enqueue)
+
+
+def is_regenerating(patient_id):
+    with _lock:
+        return patient_id in _scheduled
+
+
+def is_stale(patient_id):
+    summary = HealthSummary.objects.filter(patient_id=patient_id).only('version').first()
+    report_text = get_patient_context(patient_id)
+    if summary is None:
+        return bool(report_text)
+    return summary.version != context_version(report_text)
+
+
+def get_summary_or_none(patient_id):
+    """
+    Return (summary, stale) from the database alone; summary is None if the
+    patient has never had one.
+
+    A stale summary is returned as it is and a regeneration is scheduled if
+    one is not already running.
+    """
+    summary = HealthSummary.objects.filter(patient_id=patient_id).first()
+    if summary is None:
+        return None, False
+    report_text = get_patient_context(patient_id)
+    stale = summary.version != context_version(report_text)
+    if stale and not is_regenerating(patient_id):
+        schedule_regeneration(patient_id)
+    return summary, stale
+
+
+def get_summary(patient_id):
+    """
+    Return (summary, stale) for the patient, or (None, False) if they have
+    no reports. Only a patient who has never had a summary waits for the model.
+    """
+    summary, stale = get_summary_or_none(patient_id)
+    if summary is None:
+        summary = regenerate_summary_once(patient_id)
+    return summary, stale
+
+
+# What the stream of a patient with no reports ends with, as the views answer them
+NO_REPORTS_EVENT = {'summary': 'No reports found for this patient.', 'stored': False, 'stale': False}
+
+
+def stream_summary(patient_id):
+    """
+    (kind, payload) events for the streaming endpoint.
+
+    A stored summary is replayed as one token event; a patient without one
+    gets a live generation, which is stored once it completes. A patient
+    with no reports gets only a done event saying so.
+    """
+    summary, stale = get_summary_or_none(patient_id)
+    if summary is not None:
+        yield 'token', summary.summary
+        yield 'done', {'stored': True, 'stale': stale, 'generated_at': summary.generated_at.isoformat()}
+        return
+
+    reports, report_text = _load_context(patient_id)
+    if not report_text:
+        yield 'done', dict(NO_REPORTS_EVENT)
+        return
+    started = time.perf_counter()
+    parts = []
+    failed = False
+    for kind, payload in stream_patient_summary(report_text):
+        if kind == 'token':
+            parts.append(payload)
+        elif kind == 'error':
+            failed = True
+        elif not failed:
+            _store(patient_id, ''.join(parts), context_version(report_text), reports, started)
+            payload = {**payload, 'stored': False, 'stale': False}
+        yield kind, payload
+
+
+async def aget_summary(patient_id):
+    """Async get_summary; a first summary is generated on the event loop rather than in a thread"""
+    summary, stale = await sync_to_async(get_summary_or_none)(patient_id)
+    if summary is not None:
+        return summary, stale
+    key = await sync_to_async(_flight_key)(patient_id)
+    return await singleflight.do_async(key, _agenerate_summary, patient_id), False
+
+
+async def _agenerate_summary(patient_id):
+    reports, report_text = await sync_to_async(_load_context)(patient_id)
+    if not report_text:
+        return None
+    started = time.perf_counter()
+    text = await acomplete(MISTRAL_MODEL, patient_summary_prompt(report_text))
+    return await sync_to_async(_store)(patient_id, text, context_version(report_text), reports, started)
+
+
+async def astream_summary(patient_id):
+    """Async stream_summary"""
+    summary, stale = await sync_to_async(get_summary_or_none)(patient_id)
+    if summary is not None:
+        yield 'token', summary.summary
+        yield 'done', {'stored': True, 'stale': stale, 'generated_at': summary.generated_at.isoformat()}
+        return
+
+    reports, report_text = await sync_to_async(_load_context)(patient_id)
+    if not report_text:
+        yield 'done', dict(NO_REPORTS_EVENT)
+        return
+    started = time.perf_counter()
+    parts = []
+    failed = False
+    async for kind, payload in astream_completion(MISTRAL_MODEL, patient_summary_prompt(report_text)):
+        if kind == 'token':
+            parts.append(payload)
+        elif kind == 'error':
+            failed = True
+        elif not failed:
+            await sync_to_async(_store)(patient_id, ''.join(parts), context_version(report_text), reports, started)
+            payload = {**payload, 'stored': False, 'stale': False}
+        yield kind, payload
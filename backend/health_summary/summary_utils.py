@@ -1,63 +1,9 @@
-from backend.pinecone_client import Pinecone, index
-import requests
-from openai import OpenAI
-import os
+from backend.llm import MISTRAL_MODEL, ask_mistral, stream_completion
 
-OPENROUTER_API_KEY = os.environ.get('OPENROUTER_API_KEY')
 
-
-def ask_mistral(prompt: str, max_tokens: int = 1024) -> str:
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
-        "model": "mistralai/mistral-7b-instruct",
-        "messages": [
-            {
-                "role": "system",
-                "content": "You are a medical lab assistant. Use markdown with emojis/tables."
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        "max_tokens": max_tokens
-    }
+def patient_summary_prompt(report_text):
     
-    try:
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=10
-        )
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
-    except requests.exceptions.RequestException as e:
-        return f"⚠️ API Error: {str(e)}"
-
-
-def get_patient_reports(user_id):
-    
-    # Query Pinecone for all vectors with this user_id as metadata
-    results = index.query(
-        vector=[0]*384,  # Dummy vector for metadata-only search
-        filter={"user_id": {"$eq": user_id}},
-        top_k=1000,
-        include_metadata=True
-    )
-    
-    # Extract and concatenate all report chunks
-    reports = [match.metadata['text'] for match in results.matches]
-    return "\n\n".join(reports)
-
-
-def get_patient_summary(report_text):
-    
-    prompt = f"""
+    return f"""
     Analyze the following patient medical reports and generate a structured health summary 
     in markdown format similar to this example:
     
@@ -81,8 +27,39 @@ def get_patient_summary(report_text):
     Here are the patient reports to analyze:
     {report_text}
     """
+
+
+def get_patient_summary(report_text):
     
-    response = ask_mistral(prompt)
+    response = ask_mistral(patient_summary_prompt(report_text))
     
     return response
 
+
+def stream_patient_summary(report_text):
+    return stream_completion(MISTRAL_MODEL, patient_summary_prompt(report_text))
+
+
+
+def incremental_summary_prompt(previous_summary, changes):
+    
+    return f"""
+    Below is an existing structured health summary of a patient, followed by the
+    report data received since it was written. Update the summary to take the new
+    data into account: add new findings, update values and trends, and revise the
+    recommended tests if needed. Keep the same markdown structure and keep every
+    earlier finding that the new data does not change. Return only the updated summary.
+    
+    Existing summary:
+    {previous_summary}
+    
+    New report data:
+    {changes}
+    """
+
+
+def update_patient_summary(previous_summary, changes):
+    
+    response = ask_mistral(incremental_summary_prompt(previous_summary, changes))
+    
+    return response
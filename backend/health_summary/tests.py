@@ -1,3 +1,80 @@
-from django.test import TestCase
+import datetime
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, TestCase
+from patients.models import MedicalReport, Patient
+from .models import HealthSummary
+from .summaries import astream_summary, describe_changes, report_state, stream_summary
 
-# Create your tests here.
+
+def lipid_report(values, observations, advise, dates=('2025-01-01',)):
+    return MedicalReport(
+        pk=1, report_type='Lipid Profile', report_date=datetime.date(2025, 1, 1), report_dates=list(dates),
+        parameters=[{'name': 'Cholesterol', 'value': list(values), 'status': ['high'] * len(values), 'unit': 'mg/dL'}],
+        observations=list(observations), advise=list(advise),
+    )
+
+
+class DescribeChangesTests(SimpleTestCase):
+    def setUp(self):
+        self.state = report_state([lipid_report(['250'], ['Cholesterol is high'], ['Cut saturated fat'])])
+
+    def test_nothing_changed(self):
+        report = lipid_report(['250'], ['Cholesterol is high'], ['Cut saturated fat'])
+        self.assertEqual(describe_changes([report], self.state), '')
+
+    def test_merge_sends_new_readings_and_the_replaced_observations_and_advice(self):
+        # A merge appends readings but replaces observations and advice with the upload's
+        merged = lipid_report(['250', '190'], ['Cholesterol is now normal'], [],
+                              dates=('2025-01-01', '2025-03-01'))
+        changes = describe_changes([merged], self.state).splitlines()
+
+        self.assertEqual(changes[:2], [
+            'New Lipid Profile results dated 2025-03-01',
+            'Lipid Profile - Cholesterol: 190 (high) mg/dL',
+        ])
+        self.assertIn('- Cholesterol is now normal', changes)
+        self.assertNotIn('Cholesterol is high', '\n'.join(changes))
+        self.assertTrue(any(line.startswith('Lipid Profile advice: none') for line in changes))
+
+    def test_observations_replaced_by_as_many_new_ones_are_sent(self):
+        merged = lipid_report(['250'], ['LDL is borderline'], ['Cut saturated fat'])
+        self.assertEqual(describe_changes([merged], self.state).splitlines(), [
+            'Lipid Profile observations, replacing the earlier ones:',
+            '- LDL is borderline',
+        ])
+
+    def test_rewritten_values_or_a_deleted_report_need_a_full_rebuild(self):
+        rewritten = lipid_report([], ['Cholesterol is high'], ['Cut saturated fat'])
+        self.assertIsNone(describe_changes([rewritten], self.state))
+        self.assertIsNone(describe_changes([], self.state))
+
+    def test_snapshot_with_counts_only_needs_a_full_rebuild(self):
+        report = lipid_report(['250'], ['Cholesterol is high'], ['Cut saturated fat'])
+        old_state = {'1': {'report_type': 'Lipid Profile', 'dates': ['2025-01-01'],
+                           'values': {'Cholesterol': 1}, 'observations': 1, 'advise': 1}}
+        self.assertIsNone(describe_changes([report], old_state))
+
+
+class StreamSummaryTests(TestCase):
+    def setUp(self):
+        self.patient = Patient.objects.create(name='Asha Rao', age=52, sex='F', mobile='5550101')
+
+    @mock.patch('health_summary.summaries.stream_patient_summary')
+    def test_patient_without_reports_gets_no_generated_summary(self, stream_patient_summary):
+        events = list(stream_summary(self.patient.pk))
+
+        self.assertEqual(events, [('done', {'summary': 'No reports found for this patient.',
+                                            'stored': False, 'stale': False})])
+        stream_patient_summary.assert_not_called()
+        self.assertFalse(HealthSummary.objects.exists())
+
+    @mock.patch('health_summary.summaries.astream_completion')
+    def test_patient_without_reports_gets_no_generated_summary_async(self, astream_completion):
+        async def collect():
+            return [event async for event in astream_summary(self.patient.pk)]
+
+        self.assertEqual(async_to_sync(collect)(), [('done', {'summary': 'No reports found for this patient.',
+                                                              'stored': False, 'stale': False})])
+        astream_completion.assert_not_called()
+        self.assertFalse(HealthSummary.objects.exists())
@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import PatientNameListView, PatientSummaryView
+from .views import PatientNameListView, PatientSummaryView, AsyncPatientSummaryView
  
 urlpatterns = [
     path('patient_names/', PatientNameListView.as_view(), name='patient-names'),
     path('patient_summary/', PatientSummaryView.as_view(), name='patient-summary'),
+    path('patient_summary/async/', AsyncPatientSummaryView.as_view(), name='patient-summary-async'),
 ] 
\ No newline at end of file
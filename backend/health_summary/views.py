@@ -3,7 +3,12 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from patients.models import Patient
 from rest_framework import status
-from . import summary_utils
+from . import summaries
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from backend.async_views import AsyncAPIView
+from backend.llm import LLMError, LLMUnavailable
+from backend.streaming import STREAMING_RENDERER_CLASSES, async_event_stream_response, event_stream_response, wants_stream
 import traceback
 
 # Create your views here.
@@ -14,15 +19,62 @@ class PatientNameListView(APIView):
         return Response({'names': names})
 
 class PatientSummaryView(APIView):
+    renderer_classes = STREAMING_RENDERER_CLASSES
+
     def post(self, request):
+        patient_id = request.data.get('patient_id')
         patient_name = request.data.get('patient_name')
-        if not patient_name:
+        if not patient_id and not patient_name:
             return Response({'error': 'Patient name is required.'}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            # Fetch and process summary using summary_utils
-            text = summary_utils.get_patient_reports(patient_name)
-            summary = summary_utils.get_patient_summary(text)
-            return Response({'summary': summary})
+            if patient_id:
+                patient = Patient.objects.filter(pk=patient_id).first()
+            else:
+                # Names are not unique; the earliest patient with the name is summarised
+                patient = Patient.objects.filter(name=patient_name).order_by('id').first()
+            if patient is None:
+                return Response({'error': 'Patient not found.'}, status=status.HTTP_404_NOT_FOUND)
+            if wants_stream(request):
+                return event_stream_response(request, summaries.stream_summary(patient.pk))
+            if str(request.data.get('rebuild', '')).lower() in ('1', 'true', 'yes'):
+                summaries.schedule_regeneration(patient.pk, full=True)
+            summary, stale = summaries.get_summary(patient.pk)
+            if summary is None:
+                return Response({'summary': 'No reports found for this patient.', 'stale': False})
+            return Response({
+                'summary': summary.summary,
+                'stale': stale,
+                'generated_at': summary.generated_at,
+            })
+        except LLMUnavailable as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except LLMError as e:
+            return Response({'error': str(e)}, status=status.HTTP_502_BAD_GATEWAY)
         except Exception as e:
             traceback.print_exc()
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class AsyncPatientSummaryView(AsyncAPIView):
+    async def post(self, request):
+        patient_id = request.data.get('patient_id')
+        patient_name = request.data.get('patient_name')
+        if not patient_id and not patient_name:
+            return JsonResponse({'error': 'Patient name is required.'}, status=400)
+        if patient_id:
+            patient = await Patient.objects.filter(pk=patient_id).afirst()
+        else:
+            patient = await Patient.objects.filter(name=patient_name).order_by('id').afirst()
+        if patient is None:
+            return JsonResponse({'error': 'Patient not found.'}, status=404)
+        if wants_stream(request):
+            return async_event_stream_response(summaries.astream_summary(patient.pk))
+        if str(request.data.get('rebuild', '')).lower() in ('1', 'true', 'yes'):
+            await sync_to_async(summaries.schedule_regeneration)(patient.pk, full=True)
+        summary, stale = await summaries.aget_summary(patient.pk)
+        if summary is None:
+            return JsonResponse({'summary': 'No reports found for this patient.', 'stale': False})
+        return JsonResponse({
+            'summary': summary.summary,
+            'stale': stale,
+            'generated_at': summary.generated_at,
+        })
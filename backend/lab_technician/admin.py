@@ -1,3 +1,13 @@
 from django.contrib import admin
+from .models import CachedLabAnswer
 
 # Register your models here.
+
+@admin.register(CachedLabAnswer)
+class CachedLabAnswerAdmin(admin.ModelAdmin):
+    list_display = ('query', 'hit_count', 'generation_seconds', 'template_version', 'created_at', 'last_hit_at', 'expires_at')
+    ordering = ('-hit_count',)
+    search_fields = ('query',)
+    exclude = ('embedding',)
+    readonly_fields = ('query', 'normalised_query', 'template_version', 'generation_seconds',
+                       'hit_count', 'created_at', 'last_hit_at')
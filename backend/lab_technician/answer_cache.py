@@ -0,0 +1,122 @@
+"""
+Semantic cache of general lab answers.
+
+General lab questions do not depend on any patient, so an answer can be
+reused for any later question whose embedding is close enough. Entries are
+tagged with the prompt template version and only entries of the current
+version are served, so changing the prompt or the embedding model
+invalidates them.
+"""
+import threading
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Max, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from backend.embeddings import encode_query, normalise_query
+from .models import CachedLabAnswer
+
+_index = {'key': None, 'ids': [], 'matrix': None, 'expires': None}
+_lock = threading.Lock()
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _get_index(template_version, dimension):
+    """
+    Embedding matrix of this version's entries of the given dimension,
+    reloaded whenever rows are added or removed
+    """
+    entries = CachedLabAnswer.objects.filter(template_version=template_version)
+    state = entries.aggregate(count=Count('id'), latest=Max('id'))
+    key = (template_version, dimension, state['count'], state['latest'])
+    with _lock:
+        if _index['key'] != key:
+            # Entries embedded by another model cannot be scored against this one's vectors
+            rows = [row for row in entries.values_list('id', 'embedding', 'expires_at')
+                    if len(row[1]) == dimension * 4]
+            _index['ids'] = [row[0] for row in rows]
+            _index['matrix'] = (
+                np.stack([np.frombuffer(bytes(row[1]), dtype=np.float32) for row in rows]) if rows else None
+            )
+            _index['expires'] = [row[2] for row in rows]
+            _index['key'] = key
+        return _index['ids'], _index['matrix'], _index['expires']
+
+
+def lookup(query, template_version):
+    """The cached answer for this question or a close paraphrase of it, or None"""
+    if settings.LAB_ANSWER_CACHE_MAX_ENTRIES <= 0:
+        return None
+    now = timezone.now()
+    live = CachedLabAnswer.objects.filter(template_version=template_version, expires_at__gt=now)
+    entry = live.filter(normalised_query=normalise_query(query)[:500]).first()
+    if entry is None:
+        vector = _unit(encode_query(query))
+        ids, matrix, expires = _get_index(template_version, len(vector))
+        if not ids:
+            return None
+        scores = matrix @ vector
+        for i in np.argsort(-scores):
+            if scores[i] < settings.LAB_ANSWER_CACHE_THRESHOLD:
+                return None
+            if expires[i] > now:
+                entry = live.filter(pk=ids[i]).first()
+                break
+        if entry is None:
+            return None
+    CachedLabAnswer.objects.filter(pk=entry.pk).update(hit_count=F('hit_count') + 1, last_hit_at=now)
+    return entry
+
+
+def store(query, answer, generation_seconds, template_version):
+    if settings.LAB_ANSWER_CACHE_MAX_ENTRIES <= 0 or not answer:
+        return None
+    now = timezone.now()
+    entry = CachedLabAnswer.objects.create(
+        query=query,
+        normalised_query=normalise_query(query)[:500],
+        embedding=_unit(encode_query(query)).tobytes(),
+        answer=answer,
+        template_version=template_version,
+        generation_seconds=round(generation_seconds, 3),
+        expires_at=now + timedelta(seconds=settings.LAB_ANSWER_CACHE_TTL_SECONDS),
+    )
+    evict(template_version)
+    return entry
+
+
+def evict(template_version):
+    """Drop expired and outdated entries, then the least recently used beyond the size limit"""
+    now = timezone.now()
+    CachedLabAnswer.objects.filter(expires_at__lte=now).delete()
+    CachedLabAnswer.objects.exclude(template_version=template_version).delete()
+    surplus = list(
+        CachedLabAnswer.objects.order_by(Coalesce('last_hit_at', 'created_at').desc(), '-id')
+        .values_list('id', flat=True)[settings.LAB_ANSWER_CACHE_MAX_ENTRIES:]
+    )
+    if surplus:
+        CachedLabAnswer.objects.filter(pk__in=surplus).delete()
+
+
+def get_stats():
+    """Hit counts and LLM time saved; every stored answer is one miss"""
+    totals = CachedLabAnswer.objects.aggregate(
+        entries=Count('id'),
+        hits=Sum('hit_count'),
+        saved=Sum(ExpressionWrapper(F('hit_count') * F('generation_seconds'), output_field=FloatField())),
+    )
+    hits = totals['hits'] or 0
+    lookups = hits + totals['entries']
+    return {
+        'entries': totals['entries'],
+        'hits': hits,
+        'misses': totals['entries'],
+        'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+        'seconds_saved': round(totals['saved'] or 0.0, 1),
+    }
@@ -1,58 +1,25 @@
-import requests
-import os
+import hashlib
 import json
+import time
 from datetime import datetime
-from backend.pinecone_client import get_relevant_chunks, embedder, index, query_chunks
+from backend.pinecone_client import get_relevant_chunks, query_chunks
+from asgiref.sync import sync_to_async
+from backend.llm import (
+    GEMMA_MODEL, MISTRAL_MODEL, SYSTEM_PROMPT, acomplete, ask_gemma, ask_mistral, astream_completion, stream_completion,
+)
+from backend import singleflight
+from backend.embeddings import embedding_version
+from patients.chat_utils import history_section
+from . import answer_cache
 import logging
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Pinecone instance
 
-
-OPENROUTER_API_KEY = os.environ.get('OPENROUTER_API_KEY')
-
-
-def ask_gemma(prompt: str, max_tokens: int = 1024) -> str:
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
-        "model": "google/gemma-3-27b-it:free",
-        "messages": [
-            {
-                "role": "system",
-                "content": "You are a medical lab assistant. Use markdown with emojis/tables."
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        "max_tokens": max_tokens
-    }
-    
-    try:
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=10
-        )
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
-    except requests.exceptions.RequestException as e:
-        return f"⚠️ API Error: {str(e)}"
-
-def general_lab_query(query):
-    if not query:
-        return "Query parameter required"
-
-    prompt = f"""You are an expert medical assistant system helping a lab technician understand various medical lab tests and procedures performed on patients.
+def general_lab_prompt(query):
+    return f"""You are an expert medical assistant system helping a lab technician understand various medical lab tests and procedures performed on patients.
 
 The lab technician may ask questions about lab tests, procedures, abnormalities, or result interpretations. Always assume they are referring to a **patient** (not themselves), and answer in a third-party perspective.
 
@@ -70,66 +37,99 @@ Include: emoji, tables, and markdown formatting to enhance readability.(where ap
 
 **Lab Technician's Query:** "{query}"
 """
-    
-    response = ask_gemma(prompt)
-    return response
 
+# Cached answers are only served while the prompt and model that produced them, and
+# the embeddings they are matched by, are unchanged
+GENERAL_LAB_TEMPLATE_VERSION = hashlib.sha256(
+    "\n".join([GEMMA_MODEL, SYSTEM_PROMPT, general_lab_prompt("{query}"), embedding_version()]).encode()
+).hexdigest()[:16]
 
-def ask_mistral(prompt: str, max_tokens: int = 1024) -> str:
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
-        "model": "mistralai/mistral-7b-instruct",
-        "messages": [
-            {
-                "role": "system",
-                "content": "You are a medical lab assistant. Use markdown with emojis/tables."
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        "max_tokens": max_tokens
-    }
-    
-    try:
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=10
-        )
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
-    except requests.exceptions.RequestException as e:
-        return f"⚠️ API Error: {str(e)}"
-
-def get_patient_reports(user_id):
-    
-    # Query Pinecone for all vectors with this user_id as metadata
-    results = index.query(
-        vector=[0]*384,  # Dummy vector for metadata-only search
-        filter={"user_id": {"$eq": user_id}},
-        top_k=1000,
-        include_metadata=True
-    )
-    
-    # Extract and concatenate all report chunks
-    reports = [match.metadata['text'] for match in results.matches]
-    return "\n\n".join(reports)
+def general_lab_query(query):
+    if not query:
+        return "Query parameter required"
+
+    cached = answer_cache.lookup(query, GENERAL_LAB_TEMPLATE_VERSION)
+    if cached is not None:
+        logger.info(f"General lab answer served from cache (saved {cached.generation_seconds:.1f}s)")
+        return cached.answer
+
+    # Concurrent misses for the same question share one model call
+    key = singleflight.flight_key('general_lab', query=query, version=GENERAL_LAB_TEMPLATE_VERSION)
+    return singleflight.do(key, _generate_general_lab_answer, query)
 
-def patient_specific_query(report_text, query):
+def _generate_general_lab_answer(query):
+    started = time.perf_counter()
+    response = ask_gemma(general_lab_prompt(query))
+    answer_cache.store(query, response, time.perf_counter() - started, GENERAL_LAB_TEMPLATE_VERSION)
+    return response
+
+def stream_general_lab_query(query):
+    cached = answer_cache.lookup(query, GENERAL_LAB_TEMPLATE_VERSION)
+    if cached is not None:
+        yield "token", cached.answer
+        yield "done", {"model": GEMMA_MODEL, "cached": True, "ttft_seconds": 0.0, "total_seconds": 0.0,
+                       "usage": None, "saved_seconds": cached.generation_seconds}
+        return
+
+    started = time.perf_counter()
+    parts = []
+    failed = False
+    for kind, payload in stream_completion(GEMMA_MODEL, general_lab_prompt(query)):
+        if kind == "token":
+            parts.append(payload)
+        elif kind == "error":
+            failed = True
+        elif not failed:
+            answer_cache.store(query, "".join(parts), time.perf_counter() - started, GENERAL_LAB_TEMPLATE_VERSION)
+            payload = {**payload, "cached": False}
+        yield kind, payload
+
+async def ageneral_lab_query(query):
+    cached = await sync_to_async(answer_cache.lookup)(query, GENERAL_LAB_TEMPLATE_VERSION)
+    if cached is not None:
+        return cached.answer
+
+    key = singleflight.flight_key('general_lab', query=query, version=GENERAL_LAB_TEMPLATE_VERSION)
+    return await singleflight.do_async(key, _agenerate_general_lab_answer, query)
+
+async def _agenerate_general_lab_answer(query):
+    started = time.perf_counter()
+    response = await acomplete(GEMMA_MODEL, general_lab_prompt(query))
+    await sync_to_async(answer_cache.store)(query, response, time.perf_counter() - started, GENERAL_LAB_TEMPLATE_VERSION)
+    return response
+
+async def astream_general_lab_query(query):
+    cached = await sync_to_async(answer_cache.lookup)(query, GENERAL_LAB_TEMPLATE_VERSION)
+    if cached is not None:
+        yield "token", cached.answer
+        yield "done", {"model": GEMMA_MODEL, "cached": True, "ttft_seconds": 0.0, "total_seconds": 0.0,
+                       "usage": None, "saved_seconds": cached.generation_seconds}
+        return
+
+    started = time.perf_counter()
+    parts = []
+    failed = False
+    async for kind, payload in astream_completion(GEMMA_MODEL, general_lab_prompt(query)):
+        if kind == "token":
+            parts.append(payload)
+        elif kind == "error":
+            failed = True
+        elif not failed:
+            await sync_to_async(answer_cache.store)(
+                query, "".join(parts), time.perf_counter() - started, GENERAL_LAB_TEMPLATE_VERSION
+            )
+            payload = {**payload, "cached": False}
+        yield kind, payload
+
+
+def patient_specific_prompt(report_text, query, history=''):
     
-    prompt = f"""**Context:**  
+    return f"""**Context:**  
     You are a medical chatbot assistant designed to help lab technicians interpret patient reports. You're having a conversation with a lab technician about a specific patient whose lab report data is provided below.
 
     **Patient Report Data :{report_text}**  
 
-    **Current User Query:**  
+    {history_section(history)}**Current User Query:**  
     {query}
 
     **Response Requirements:**  
@@ -164,7 +164,12 @@ def patient_specific_query(report_text, query):
     - Tables for comparative data
     - Horizontal rules between different test groups
         """
+
+def patient_specific_query(report_text, query, history=''):
     
-    response = ask_mistral(prompt)
+    response = ask_mistral(patient_specific_prompt(report_text, query, history))
 
     return response
+
+def stream_patient_specific_query(report_text, query, history=''):
+    return stream_completion(MISTRAL_MODEL, patient_specific_prompt(report_text, query, history))
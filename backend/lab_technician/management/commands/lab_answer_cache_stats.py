@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from lab_technician import answer_cache
+from lab_technician.chat_utils import GENERAL_LAB_TEMPLATE_VERSION
+from lab_technician.models import CachedLabAnswer
+
+
+class Command(BaseCommand):
+    help = 'Show hit rate and LLM time saved by the general lab answer cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help='Number of most-hit answers to list.')
+        parser.add_argument('--evict', action='store_true', help='Drop expired, outdated and surplus entries first.')
+        parser.add_argument('--clear', action='store_true', help='Delete every cached answer.')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted, _ = CachedLabAnswer.objects.all().delete()
+            self.stdout.write(f"Deleted {deleted} cached answers.")
+            return
+        if options['evict']:
+            answer_cache.evict(GENERAL_LAB_TEMPLATE_VERSION)
+
+        stats = answer_cache.get_stats()
+        self.stdout.write(
+            f"Answers: {stats['entries']}  hits: {stats['hits']}  misses: {stats['misses']}  "
+            f"hit rate: {stats['hit_rate']:.1%}  LLM time saved: {stats['seconds_saved']}s"
+        )
+        self.stdout.write(f"Current template version: {GENERAL_LAB_TEMPLATE_VERSION}")
+        top = CachedLabAnswer.objects.filter(hit_count__gt=0).order_by('-hit_count')[:options['top']]
+        for entry in top:
+            self.stdout.write(f"  {entry.hit_count:>5} hits  {entry.generation_seconds:>6.1f}s  {entry.query[:70]}")
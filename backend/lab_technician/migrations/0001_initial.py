@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedLabAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query', models.TextField()),
+                ('normalised_query', models.CharField(db_index=True, max_length=500)),
+                ('embedding', models.BinaryField()),
+                ('answer', models.TextField()),
+                ('template_version', models.CharField(db_index=True, max_length=16)),
+                ('generation_seconds', models.FloatField(default=0)),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
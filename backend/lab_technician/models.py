@@ -1,3 +1,21 @@
 from django.db import models
 
 # Create your models here.
+
+class CachedLabAnswer(models.Model):
+    """A general lab question, its embedding and the answer the LLM gave"""
+    query = models.TextField()
+    normalised_query = models.CharField(max_length=500, db_index=True)
+    # Unit-normalised float32 query embedding
+    embedding = models.BinaryField()
+    answer = models.TextField()
+    # Hash of the prompt template and model that produced the answer
+    template_version = models.CharField(max_length=16, db_index=True)
+    generation_seconds = models.FloatField(default=0)
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(blank=True, null=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.query[:60]} ({self.hit_count} hits)"
@@ -1,3 +1,47 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
+import numpy as np
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from backend.embeddings import embedding_version
+from . import answer_cache
+from .models import CachedLabAnswer
 
-# Create your tests here.
+
+def cached_answer(query, embedding, answer, template_version='v1'):
+    return CachedLabAnswer.objects.create(
+        query=query, normalised_query=query.lower(), embedding=np.asarray(embedding, dtype=np.float32).tobytes(),
+        answer=answer, template_version=template_version, expires_at=timezone.now() + timedelta(hours=1),
+    )
+
+
+@mock.patch('lab_technician.answer_cache.encode_query', return_value=[1.0, 0.0, 0.0])
+class AnswerCacheTests(TestCase):
+    def setUp(self):
+        # Rolled back test rows reuse ids, which the loaded index is keyed by
+        patcher = mock.patch.dict(answer_cache._index, {'key': None})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_paraphrase_is_served_the_close_answer(self, _):
+        cached_answer('what is a lipid panel', [1, 0, 0], 'Cholesterol and triglycerides.')
+        cached_answer('what is a cbc', [0, 1, 0], 'Blood cell counts.')
+        self.assertEqual(answer_cache.lookup('explain lipid panels', 'v1').answer, 'Cholesterol and triglycerides.')
+
+    def test_entries_embedded_with_another_dimension_are_skipped(self, _):
+        cached_answer('what is a cbc', [1, 0, 0, 0], 'From a 4-d model.')
+        self.assertIsNone(answer_cache.lookup('explain lipid panels', 'v1'))
+
+        cached_answer('what is a lipid panel', [1, 0, 0], 'Cholesterol and triglycerides.')
+        self.assertEqual(answer_cache.lookup('explain lipid panels', 'v1').answer, 'Cholesterol and triglycerides.')
+
+
+class EmbeddingVersionTests(SimpleTestCase):
+    def test_changes_with_the_backend_and_quantized_weights(self):
+        with override_settings(EMBEDDING_BACKEND='torch'):
+            torch = embedding_version()
+        with override_settings(EMBEDDING_BACKEND='onnx-int8', EMBEDDING_ONNX_INT8_FILE='onnx/a.onnx'):
+            int8 = embedding_version()
+        with override_settings(EMBEDDING_BACKEND='onnx-int8', EMBEDDING_ONNX_INT8_FILE='onnx/b.onnx'):
+            other_weights = embedding_version()
+        self.assertEqual(len({torch, int8, other_weights}), 3)
@@ -1,8 +1,10 @@
 from django.urls import path
-from .views import GeneralLabQueryView, PatientSpecificQueryView
+from .views import GeneralLabQueryView, PatientSpecificQueryView, AsyncGeneralLabQueryView, AsyncPatientSpecificQueryView
 
 urlpatterns = [
     path('general_query/', GeneralLabQueryView.as_view(), name='general-lab-query'),
     path('patient_query/', PatientSpecificQueryView.as_view(), name='patient-specific-query'),
+    path('general_query/async/', AsyncGeneralLabQueryView.as_view(), name='general-lab-query-async'),
+    path('patient_query/async/', AsyncPatientSpecificQueryView.as_view(), name='patient-specific-query-async'),
     # path('patient_names/', ...)  # Removed from here
 ] 
\ No newline at end of file
@@ -2,8 +2,18 @@ from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .chat_utils import general_lab_query, get_patient_reports, patient_specific_query
-from patients.models import Patient
+from .chat_utils import (
+    ageneral_lab_query, astream_general_lab_query, general_lab_query, patient_specific_prompt, patient_specific_query,
+    stream_general_lab_query, stream_patient_specific_query,
+)
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from backend.async_views import AsyncAPIView
+from backend.llm import LLMError, LLMUnavailable, MISTRAL_MODEL, acomplete, astream_completion
+from backend.streaming import STREAMING_RENDERER_CLASSES, async_event_stream_response, event_stream_response, wants_stream
+from patients import chat_memory
+from patients.context import get_patient_context_by_name
+from patients.models import ChatSession, Patient
 from datetime import datetime
 import json
 import traceback
@@ -16,25 +26,94 @@ logger = logging.getLogger(__name__)
 # Create your views here.
 
 class GeneralLabQueryView(APIView):
+    renderer_classes = STREAMING_RENDERER_CLASSES
+
     def post(self, request):
         query = request.data.get('query')
         if not query:
             return Response({'error': 'Query is required.'}, status=status.HTTP_400_BAD_REQUEST)
-        answer = general_lab_query(query)
+        if wants_stream(request):
+            return event_stream_response(request, stream_general_lab_query(query))
+        try:
+            answer = general_lab_query(query)
+        except LLMUnavailable as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except LLMError as e:
+            return Response({'error': str(e)}, status=status.HTTP_502_BAD_GATEWAY)
         return Response({'answer': answer})
 
 class PatientSpecificQueryView(APIView):
+    renderer_classes = STREAMING_RENDERER_CLASSES
+
     def post(self, request):
         patient_name = request.data.get('patient_name')
         query = request.data.get('query')
+        session_id = request.data.get('session_id')
         if not patient_name or not query:
             return Response({'error': 'Both patient_name and query are required.'}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            report_text = get_patient_reports(patient_name)
+            report_text = get_patient_context_by_name(patient_name)
             if not report_text.strip():
                 return Response({'answer': 'No reports found for this patient.'})
-            answer = patient_specific_query(report_text, query)
-            return Response({'answer': answer})
+            # The conversation is kept against the earliest patient with the name
+            patient_id = Patient.objects.filter(name=patient_name).order_by('id').values_list('id', flat=True).first()
+            session = chat_memory.get_session(patient_id, session_id) if session_id else None
+            history = chat_memory.get_history(session)
+            if wants_stream(request):
+                return event_stream_response(request, chat_memory.record_stream(
+                    patient_id, session, query, stream_patient_specific_query(report_text, query, history),
+                    source=ChatSession.SOURCE_LAB,
+                ))
+            answer, session = chat_memory.ask(
+                'lab_patient_chat', patient_id, session, query, history, report_text,
+                lambda: patient_specific_query(report_text, query, history), source=ChatSession.SOURCE_LAB,
+            )
+            return Response({'answer': answer, 'session_id': session.session_id})
+        except ChatSession.DoesNotExist:
+            return Response({'error': 'Chat session not found.'}, status=status.HTTP_404_NOT_FOUND)
+        except LLMUnavailable as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except LLMError as e:
+            return Response({'error': str(e)}, status=status.HTTP_502_BAD_GATEWAY)
         except Exception as e:
             logger.error(f"Error in patient-specific query: {e}")
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class AsyncGeneralLabQueryView(AsyncAPIView):
+    async def post(self, request):
+        query = request.data.get('query')
+        if not query:
+            return JsonResponse({'error': 'Query is required.'}, status=400)
+        if wants_stream(request):
+            return async_event_stream_response(astream_general_lab_query(query))
+        answer = await ageneral_lab_query(query)
+        return JsonResponse({'answer': answer})
+
+class AsyncPatientSpecificQueryView(AsyncAPIView):
+    async def post(self, request):
+        patient_name = request.data.get('patient_name')
+        query = request.data.get('query')
+        session_id = request.data.get('session_id')
+        if not patient_name or not query:
+            return JsonResponse({'error': 'Both patient_name and query are required.'}, status=400)
+        report_text = await sync_to_async(get_patient_context_by_name)(patient_name)
+        if not report_text.strip():
+            return JsonResponse({'answer': 'No reports found for this patient.'})
+        patient_id = await Patient.objects.filter(name=patient_name).order_by('id').values_list('id', flat=True).afirst()
+        session = None
+        if session_id:
+            try:
+                session = await sync_to_async(chat_memory.get_session)(patient_id, session_id)
+            except ChatSession.DoesNotExist:
+                return JsonResponse({'error': 'Chat session not found.'}, status=404)
+        history = await sync_to_async(chat_memory.get_history)(session)
+        prompt = patient_specific_prompt(report_text, query, history)
+        if wants_stream(request):
+            return async_event_stream_response(chat_memory.arecord_stream(
+                patient_id, session, query, astream_completion(MISTRAL_MODEL, prompt), source=ChatSession.SOURCE_LAB,
+            ))
+        answer, session = await chat_memory.aask(
+            'lab_patient_chat', patient_id, session, query, history, report_text,
+            lambda: acomplete(MISTRAL_MODEL, prompt), source=ChatSession.SOURCE_LAB,
+        )
+        return JsonResponse({'answer': answer, 'session_id': str(session.session_id)})
@@ -1,3 +1,29 @@
 from django.contrib import admin
+from .models import ChatMessage, ChatSession, ReportFingerprint
 
 # Register your models here.
+
+@admin.register(ReportFingerprint)
+class ReportFingerprintAdmin(admin.ModelAdmin):
+    list_display = ('sha256', 'report', 'hit_count', 'created_at', 'last_hit_at')
+    list_select_related = ('report__patient',)
+    ordering = ('-hit_count',)
+    search_fields = ('sha256',)
+    readonly_fields = ('sha256', 'extraction', 'report', 'hit_count', 'created_at', 'last_hit_at')
+
+
+class ChatMessageInline(admin.TabularInline):
+    model = ChatMessage
+    extra = 0
+    readonly_fields = ('role', 'content', 'tokens', 'compacted', 'created_at')
+
+
+@admin.register(ChatSession)
+class ChatSessionAdmin(admin.ModelAdmin):
+    list_display = ('session_id', 'patient', 'source', 'compactions', 'created_at', 'updated_at')
+    list_filter = ('source',)
+    list_select_related = ('patient',)
+    ordering = ('-updated_at',)
+    search_fields = ('session_id', 'patient__name')
+    readonly_fields = ('session_id', 'patient', 'source', 'summary', 'compactions', 'created_at', 'updated_at')
+    inlines = [ChatMessageInline]
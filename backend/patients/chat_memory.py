@@ -0,0 +1,193 @@
+"""
+Server-side memory for the patient chats.
+
+Each conversation is a ChatSession with its messages. The prompt carries
+the session's rolling summary and the last CHAT_HISTORY_TURNS turns, trimmed
+to CHAT_HISTORY_TOKENS. Once the uncompacted turns outgrow that, the older
+ones are folded into the summary in the background, so the prompt stays
+the same size however long the conversation runs.
+"""
+import logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from backend import singleflight
+from backend.background import submit
+from backend.llm import MISTRAL_MODEL, complete
+from .context import estimate_tokens
+from .models import ChatMessage, ChatSession
+
+logger = logging.getLogger(__name__)
+
+
+def get_session(patient_id, session_id):
+    """
+    The patient's session with this id. Raises ChatSession.DoesNotExist for
+    an unknown or malformed id, or one belonging to another patient.
+    """
+    try:
+        return ChatSession.objects.get(session_id=session_id, patient_id=patient_id)
+    except ValidationError:
+        raise ChatSession.DoesNotExist(f"Invalid chat session id {session_id!r}")
+
+
+def split_history(session):
+    """
+    The session's uncompacted messages as (older, recent): recent is the
+    newest CHAT_HISTORY_TURNS turns that fit CHAT_HISTORY_TOKENS, older the
+    rest, which is due to be compacted.
+    """
+    messages = list(ChatMessage.objects.filter(session=session, compacted=False).order_by('id'))
+    start, used = len(messages), 0
+    while start > 0 and len(messages) - start < 2 * settings.CHAT_HISTORY_TURNS:
+        tokens = messages[start - 1].tokens
+        # The latest message is always kept, whatever its size
+        if start < len(messages) and used + tokens > settings.CHAT_HISTORY_TOKENS:
+            break
+        used += tokens
+        start -= 1
+    return messages[:start], messages[start:]
+
+
+def render_message(message):
+    return f"{'User' if message.role == ChatMessage.ROLE_USER else 'Assistant'}: {message.content}"
+
+
+def get_history(session):
+    """The conversation so far as prompt text; empty for a new session (None)"""
+    if session is None:
+        return ''
+    parts = []
+    if session.summary:
+        parts.append(f"Summary of the earlier conversation: {session.summary}")
+    parts.extend(render_message(message) for message in split_history(session)[1])
+    return "\n".join(parts)
+
+
+def record_turn(patient_id, session, question, answer, source=ChatSession.SOURCE_PATIENT):
+    """
+    Store a question and its answer in the session, or in a new one if
+    session is None, and compact the session if it has grown past the
+    budget. Returns the session.
+    """
+    with transaction.atomic():
+        if session is None:
+            session = ChatSession.objects.create(patient_id=patient_id, source=source)
+        ChatMessage.objects.bulk_create([
+            ChatMessage(session=session, role=ChatMessage.ROLE_USER, content=question,
+                        tokens=estimate_tokens(question)),
+            ChatMessage(session=session, role=ChatMessage.ROLE_ASSISTANT, content=answer,
+                        tokens=estimate_tokens(answer)),
+        ])
+        # Bumps updated_at for the recent chats listing
+        session.save(update_fields=['updated_at'])
+    older, _ = split_history(session)
+    if older:
+        transaction.on_commit(lambda: submit(compact_session, session.pk))
+    return session
+
+
+def _flight_key(endpoint, patient_id, session, query, history, context):
+    return singleflight.flight_key(endpoint, patient_id, query, "\n".join([str(session.session_id), history, context]))
+
+
+def ask(endpoint, patient_id, session, query, history, context, generate, source=ChatSession.SOURCE_PATIENT):
+    """
+    Answer with generate() and record the turn; returns (answer, session).
+
+    Identical concurrent questions (same session, history and context) share
+    one model call and one recorded turn, so a double-submitted question
+    neither pays twice nor appears twice in the history. Questions that start
+    a session are never shared, as each starts a conversation of its own.
+    """
+    def answer():
+        text = generate()
+        return text, record_turn(patient_id, session, query, text, source)
+    if session is None:
+        return answer()
+    return singleflight.do(_flight_key(endpoint, patient_id, session, query, history, context), answer)
+
+
+async def aask(endpoint, patient_id, session, query, history, context, agenerate, source=ChatSession.SOURCE_PATIENT):
+    """Async ask; agenerate is a coroutine function"""
+    async def answer():
+        text = await agenerate()
+        return text, await sync_to_async(record_turn)(patient_id, session, query, text, source)
+    if session is None:
+        return await answer()
+    return await singleflight.do_async(_flight_key(endpoint, patient_id, session, query, history, context), answer)
+
+
+def compaction_prompt(summary, turns):
+    return f"""Summarise this conversation between a user and a medical chatbot about a patient's lab reports.
+Keep the patient's values, concerns and any conclusions or advice given; leave out greetings and formatting.
+Write at most one short paragraph.
+
+Summary so far: {summary or 'None'}
+
+Newer turns:
+{turns}
+"""
+
+
+def compact_session(session_pk):
+    """
+    Fold the messages that no longer fit the history budget into the
+    session summary.
+
+    The summary is only written if no other compaction has updated it in
+    the meantime; a compaction that loses the race is discarded.
+    """
+    session = ChatSession.objects.get(pk=session_pk)
+    older, _ = split_history(session)
+    if not older:
+        return False
+    summary = complete(
+        MISTRAL_MODEL,
+        compaction_prompt(session.summary, "\n".join(render_message(message) for message in older)),
+        max_tokens=settings.CHAT_SUMMARY_MAX_TOKENS,
+    )
+    with transaction.atomic():
+        updated = ChatSession.objects.filter(pk=session.pk, compactions=session.compactions).update(
+            summary=summary.strip(), compactions=F('compactions') + 1,
+        )
+        if not updated:
+            return False
+        ChatMessage.objects.filter(pk__in=[message.pk for message in older]).update(compacted=True)
+    logger.info("Compacted %d messages of chat session %s", len(older), session.session_id)
+    return True
+
+
+def record_stream(patient_id, session, question, events, source=ChatSession.SOURCE_PATIENT):
+    """
+    Pass (kind, payload) completion events through, recording the turn once
+    the answer is complete; the done event gets the session_id.
+    """
+    parts = []
+    failed = False
+    for kind, payload in events:
+        if kind == 'token':
+            parts.append(payload)
+        elif kind == 'error':
+            failed = True
+        elif not failed:
+            session = record_turn(patient_id, session, question, ''.join(parts), source)
+            payload = {**payload, 'session_id': str(session.session_id)}
+        yield kind, payload
+
+
+async def arecord_stream(patient_id, session, question, events, source=ChatSession.SOURCE_PATIENT):
+    """Async record_stream"""
+    parts = []
+    failed = False
+    async for kind, payload in events:
+        if kind == 'token':
+            parts.append(payload)
+        elif kind == 'error':
+            failed = True
+        elif not failed:
+            session = await sync_to_async(record_turn)(patient_id, session, question, ''.join(parts), source)
+            payload = {**payload, 'session_id': str(session.session_id)}
+        yield kind, payload
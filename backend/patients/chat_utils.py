@@ -1,65 +1,11 @@
-from pinecone import Pinecone, ServerlessSpec
-import requests
-from openai import OpenAI
-import os
+from backend.llm import MISTRAL_MODEL, ask_mistral, stream_completion
 
-OPENROUTER_API_KEY = os.environ.get('OPENROUTER_API_KEY')
-PINECONE_API_KEY = os.environ.get('PINECONE_API_KEY')
+def history_section(history):
+    return f"Conversation so far:\n{history}\n\n    " if history else ""
 
-pc = Pinecone(api_key=PINECONE_API_KEY)
-index_name = "medical"  # Replace with your index
-index = pc.Index(index_name)
-
-def ask_mistral(prompt: str, max_tokens: int = 1024) -> str:
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
-        "model": "mistralai/mistral-7b-instruct",
-        "messages": [
-            {
-                "role": "system",
-                "content": "You are a medical lab assistant. Use markdown with emojis/tables."
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        "max_tokens": max_tokens
-    }
-    
-    try:
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=10
-        )
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
-    except requests.exceptions.RequestException as e:
-        return f"⚠️ API Error: {str(e)}"
-
-def get_patient_reports(user_id):
-    
-    # Query Pinecone for all vectors with this user_id as metadata
-    results = index.query(
-        vector=[0]*384,  # Dummy vector for metadata-only search
-        filter={"user_id": {"$eq": user_id}},
-        top_k=1000,
-        include_metadata=True
-    )
+def patient_specific_prompt(report_text, query, history=''):
     
-    # Extract and concatenate all report chunks
-    reports = [match.metadata['text'] for match in results.matches]
-    return "\n\n".join(reports)
-
-def patient_specific_query(report_text, query):
-    
-    prompt = f"""You are MediBot 🤖, a friendly but professional medical chatbot designed to help patients access their own health data (reports, vitals, appointments) and answer basic queries.
+    return f"""You are MediBot 🤖, a friendly but professional medical chatbot designed to help patients access their own health data (reports, vitals, appointments) and answer basic queries.
 
     Rules:
 
@@ -78,9 +24,14 @@ def patient_specific_query(report_text, query):
     Data Privacy: Never disclose hypothetical/other patients' info.
 
     Patient Data Context : {report_text}
-    Current User Query: {query}
+    {history_section(history)}Current User Query: {query}
         """
+
+def patient_specific_query(report_text, query, history=''):
     
-    response = ask_mistral(prompt)
+    response = ask_mistral(patient_specific_prompt(report_text, query, history))
     
     return response
+
+def stream_patient_specific_query(report_text, query, history=''):
+    return stream_completion(MISTRAL_MODEL, patient_specific_prompt(report_text, query, history))
@@ -0,0 +1,192 @@
+import re
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from backend.embeddings import encode_query, get_embedder, normalise_query
+from .models import Patient, MedicalReport
+
+CACHE_KEY = 'patient_context:{patient_id}'
+EMBEDDINGS_CACHE_KEY = 'patient_context_embeddings:{patient_id}'
+
+
+def as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def render_parameter(report_type, param, start=0):
+    """
+    One line per parameter with its value history, oldest first; start skips
+    the readings before that index.
+    """
+    values = as_list(param.get('value'))
+    statuses = as_list(param.get('status'))
+    readings = []
+    for i, value in enumerate(values):
+        if i < start:
+            continue
+        status = statuses[i] if i < len(statuses) else None
+        readings.append(f"{value} ({status})" if status else f"{value}")
+    line = f"{report_type} - {param.get('name')}: {', '.join(readings)}"
+    if param.get('unit'):
+        line += f" {param['unit']}"
+    if param.get('normal_range'):
+        line += f" [reference range: {param['normal_range']}]"
+    return line
+
+
+def get_context_reports(patient_id):
+    """The patient's reports in the order the context lists them"""
+    return list(MedicalReport.objects.filter(patient_id=patient_id).order_by('report_date', 'id'))
+
+
+def build_context_chunks(patient_id, reports=None):
+    """
+    Build the patient's report context from the database, or from reports
+    already loaded with get_context_reports.
+
+    Returns a list of chunks (dicts with text, kind, report_type and, for
+    parameters, the parameter name), or an empty list if the patient has no
+    reports.
+    """
+    if reports is None:
+        reports = get_context_reports(patient_id)
+    if not reports:
+        return []
+    patient = Patient.objects.only('name', 'age', 'sex').get(pk=patient_id)
+    chunks = [{
+        'kind': 'patient',
+        'report_type': None,
+        'text': f"Patient: {patient.name}, age {patient.age}, {patient.sex}",
+    }]
+    for report in reports:
+        dates = report.report_dates or [str(report.report_date)]
+        chunks.append({
+            'kind': 'report',
+            'report_type': report.report_type,
+            'text': f"Report: {report.report_type} (dates: {', '.join(str(d) for d in dates)})",
+        })
+        for param in report.parameters:
+            if isinstance(param, dict) and param.get('name'):
+                chunks.append({
+                    'kind': 'parameter',
+                    'report_type': report.report_type,
+                    'parameter': param['name'],
+                    'text': render_parameter(report.report_type, param),
+                })
+        for observation in report.observations:
+            chunks.append({'kind': 'observation', 'report_type': report.report_type,
+                           'text': f"{report.report_type} observation: {observation}"})
+        for advice in report.advise:
+            chunks.append({'kind': 'advice', 'report_type': report.report_type,
+                           'text': f"{report.report_type} advice: {advice}"})
+    return chunks
+
+
+def get_patient_context_chunks(patient_id):
+    """Context chunks for a patient, cached until one of their reports changes"""
+    key = CACHE_KEY.format(patient_id=patient_id)
+    chunks = cache.get(key)
+    if chunks is None:
+        chunks = build_context_chunks(patient_id)
+        cache.set(key, chunks, settings.PATIENT_CONTEXT_CACHE_SECONDS)
+    return chunks
+
+
+def render_context(chunks):
+    return "\n".join(chunk['text'] for chunk in chunks)
+
+
+def get_patient_context(patient_id):
+    """The patient's reports rendered as prompt context; empty if they have none"""
+    return render_context(get_patient_context_chunks(patient_id))
+
+
+def get_patient_context_by_name(patient_name):
+    """Context for every patient with this name, as the name-based endpoints expect"""
+    patient_ids = Patient.objects.filter(name=patient_name).order_by('id').values_list('id', flat=True)
+    contexts = [get_patient_context(patient_id) for patient_id in patient_ids]
+    return "\n\n".join(context for context in contexts if context)
+
+
+def invalidate_patient_context(patient_id):
+    cache.delete_many([CACHE_KEY.format(patient_id=patient_id), EMBEDDINGS_CACHE_KEY.format(patient_id=patient_id)])
+
+
+def estimate_tokens(text):
+    """Rough token count for budgeting (about four characters per token)"""
+    return max(1, (len(text) + 3) // 4)
+
+
+def _parameter_aliases(name):
+    """'Hemoglobin (Hb)' -> {'hemoglobin (hb)', 'hemoglobin', 'hb'}"""
+    name = name.lower().strip()
+    aliases = {name, re.sub(r'\s*\(.*?\)', '', name).strip()}
+    aliases.update(alias.strip() for alias in re.findall(r'\((.*?)\)', name))
+    return {alias for alias in aliases if len(alias) >= 2}
+
+
+def mentioned_parameters(query, chunks):
+    """Names of the patient's parameters that the query refers to"""
+    query = normalise_query(query)
+    mentioned = set()
+    for chunk in chunks:
+        if chunk['kind'] != 'parameter':
+            continue
+        for alias in _parameter_aliases(chunk['parameter']):
+            if re.search(r'\b' + re.escape(alias) + r'\b', query):
+                mentioned.add(chunk['parameter'])
+                break
+    return mentioned
+
+
+def _get_chunk_embeddings(patient_id, chunks):
+    """Normalised embeddings of the patient's chunks, cached alongside the chunks"""
+    key = EMBEDDINGS_CACHE_KEY.format(patient_id=patient_id)
+    embeddings = cache.get(key)
+    if embeddings is None or len(embeddings) != len(chunks):
+        embeddings = get_embedder().encode(
+            [chunk['text'] for chunk in chunks],
+            batch_size=settings.EMBEDDING_BATCH_SIZE,
+            normalize_embeddings=True,
+        ).astype(np.float32)
+        cache.set(key, embeddings, settings.PATIENT_CONTEXT_CACHE_SECONDS)
+    return embeddings
+
+
+def build_query_context(patient_id, query, token_budget=None):
+    """
+    Pack the chunks most relevant to the query into a token budget.
+
+    The patient line and the chunks for any parameter the query names are
+    always kept; the rest are ranked by similarity to the query and added
+    greedily while they fit. Kept chunks are returned in their original order.
+    """
+    token_budget = token_budget or settings.PATIENT_CHAT_CONTEXT_TOKENS
+    chunks = get_patient_context_chunks(patient_id)
+    if not chunks:
+        return {'text': '', 'kept_tokens': 0, 'dropped_tokens': 0, 'kept_chunks': 0, 'dropped_chunks': 0}
+
+    tokens = [estimate_tokens(chunk['text']) for chunk in chunks]
+    mentioned = mentioned_parameters(query, chunks)
+    pinned = [
+        i for i, chunk in enumerate(chunks)
+        if chunk['kind'] == 'patient' or chunk.get('parameter') in mentioned
+    ]
+    kept = set(pinned)
+    used = sum(tokens[i] for i in pinned)
+
+    scores = _get_chunk_embeddings(patient_id, chunks) @ np.asarray(encode_query(query), dtype=np.float32)
+    for i in np.argsort(-scores):
+        i = int(i)
+        if i not in kept and used + tokens[i] <= token_budget:
+            kept.add(i)
+            used += tokens[i]
+
+    ordered = sorted(kept)
+    return {
+        'text': "\n".join(chunks[i]['text'] for i in ordered),
+        'kept_tokens': used,
+        'dropped_tokens': sum(tokens) - used,
+        'kept_chunks': len(ordered),
+        'dropped_chunks': len(chunks) - len(ordered),
+    }
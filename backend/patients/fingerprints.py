@@ -0,0 +1,63 @@
+from django.db import IntegrityError
+from django.db.models import F, Sum
+from django.utils import timezone
+from .models import ReportFingerprint
+
+
+def find_fingerprint(sha256):
+    if not sha256:
+        return None
+    return ReportFingerprint.objects.select_related('report__patient').filter(sha256=sha256).first()
+
+
+def find_duplicate_report(sha256, patient=None, mobile=''):
+    """
+    Return the fingerprint of an identical upload whose report still exists,
+    or None. With a patient, only that patient's reports count as duplicates;
+    with a mobile instead (a new-patient upload), only reports of patients
+    registered with that mobile.
+    """
+    fingerprint = find_fingerprint(sha256)
+    if fingerprint is None or fingerprint.report is None:
+        return None
+    if patient is not None and fingerprint.report.patient_id != patient.pk:
+        return None
+    if patient is None and mobile and fingerprint.report.patient.mobile != mobile:
+        return None
+    return fingerprint
+
+
+def record_hit(fingerprint):
+    ReportFingerprint.objects.filter(pk=fingerprint.pk).update(
+        hit_count=F('hit_count') + 1, last_hit_at=timezone.now()
+    )
+
+
+def remember_extraction(sha256, extraction, chunks=()):
+    """Store the extraction and text chunks for a newly seen upload; returns the fingerprint"""
+    try:
+        fingerprint, _ = ReportFingerprint.objects.get_or_create(
+            sha256=sha256, defaults={'extraction': extraction, 'chunks': list(chunks)}
+        )
+    except IntegrityError:
+        # An identical upload finished first
+        fingerprint = ReportFingerprint.objects.get(sha256=sha256)
+    return fingerprint
+
+
+def link_report(fingerprint, report):
+    """Point a fingerprint at the report its upload was stored in, unless it already has one"""
+    ReportFingerprint.objects.filter(pk=fingerprint.pk, report__isnull=True).update(report=report)
+
+
+def get_stats():
+    """Hit/miss counts for the fingerprint index; every stored fingerprint is one miss"""
+    misses = ReportFingerprint.objects.count()
+    hits = ReportFingerprint.objects.aggregate(total=Sum('hit_count'))['total'] or 0
+    lookups = hits + misses
+    return {
+        'fingerprints': misses,
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+    }
@@ -0,0 +1,130 @@
+import logging
+from django.core.files import File
+from backend.pinecone_client import embed_chunks
+from .models import Patient
+from .report_utils import index_report, process_pdf_report
+from . import fingerprints
+from .merge import merge_reports
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionError(Exception):
+    """Raised when an uploaded report cannot be turned into a patient record"""
+
+
+class StagedFile(File):
+    """
+    A staged upload on its way into storage.
+
+    Like Django's TemporaryUploadedFile it exposes temporary_file_path(), so
+    FileSystemStorage moves the staged file into place instead of copying it.
+    """
+    def __init__(self, file, name, path):
+        super().__init__(file, name=name)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def create_patient_from_report(mobile, report_data):
+    """Create a patient from the demographics extracted out of their first report"""
+    name = report_data.get('patient_name')
+    age = report_data.get('age')
+    sex = report_data.get('sex')
+    if not name or not age or not sex:
+        raise IngestionError('Could not extract all required fields from the report.')
+    return Patient.objects.create(
+        mobile=mobile,
+        name=name,
+        age=int(age[0]) if isinstance(age, list) else int(age),
+        sex=sex,
+    )
+
+
+def save_extracted_report(patient, report_data, report_path, report_name):
+    """
+    Store an extracted report for the patient, merged into their report of
+    the same type if they have one (see merge.merge_reports). The staged
+    file at report_path is moved into storage. Returns (report, merged).
+    """
+    with open(report_path, 'rb') as f:
+        return merge_reports(patient, [(report_data, StagedFile(f, report_name, report_path))])[0]
+
+
+def ingest_report(job, on_stage=None, timings=None):
+    """
+    Run the full ingestion for a queued upload: extraction, patient creation
+    for new-patient uploads, storing/merging the report, and indexing its
+    text in the vector store under the stored report's report_id. An upload
+    already stored for the patient returns its report, unmerged.
+    Per-stage pipeline timings are recorded into timings if given.
+    Returns (report, merged).
+    """
+    def stage(name):
+        if on_stage:
+            on_stage(name)
+
+    def stored_duplicate():
+        # An identical upload for the same patient (or new-patient mobile) that
+        # is already stored, e.g. a retry queued while the first was in flight
+        duplicate = fingerprints.find_duplicate_report(job.sha256, patient=job.patient, mobile=job.mobile)
+        if duplicate is not None:
+            stage('deduplicated')
+            fingerprints.record_hit(duplicate)
+            job.patient = duplicate.report.patient
+        return duplicate
+
+    duplicate = stored_duplicate()
+    if duplicate is not None:
+        return duplicate.report, False
+
+    # An identical file seen before reuses its extraction instead of paying
+    # for Azure and the LLM again; only its stored chunks are embedded anew
+    embedded = None
+    reused_chunks = []
+    fingerprint = fingerprints.find_fingerprint(job.sha256)
+    if fingerprint is not None and fingerprint.extraction:
+        stage('deduplicated')
+        fingerprints.record_hit(fingerprint)
+        report_data = fingerprint.extraction
+        reused_chunks = fingerprint.chunks or []
+    else:
+        stage('extracting')
+        report_data, embedded = process_pdf_report(job.upload_path, timings=timings)
+        if not report_data:
+            raise IngestionError('Could not extract data from the report.')
+        if job.sha256:
+            fingerprint = fingerprints.remember_extraction(job.sha256, report_data, embedded[0] if embedded else ())
+        # The identical upload may have been stored while this one was extracted
+        duplicate = stored_duplicate()
+        if duplicate is not None:
+            return duplicate.report, False
+
+    stage('saving')
+    patient = job.patient
+    new_patient = patient is None
+    if new_patient:
+        patient = create_patient_from_report(job.mobile, report_data)
+    try:
+        report, merged = save_extracted_report(patient, report_data, job.upload_path, job.original_name)
+    except Exception:
+        # A new patient only exists along with their first report
+        if new_patient:
+            patient.delete()
+        raise
+    job.patient = patient
+    if fingerprint is not None:
+        fingerprints.link_report(fingerprint, report)
+
+    if embedded is not None or reused_chunks:
+        stage('indexing')
+        try:
+            if embedded is None:
+                embedded = embed_chunks(reused_chunks)
+            index_report(patient.name, report, embedded, timings)
+        except Exception:
+            # The report is stored either way, and chat context is built from the database
+            logger.exception("Could not index the text of report %s", report.report_id)
+    return report, merged
@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import os
+import time
+import uuid
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from backend import background
+from .models import ReportIngestionJob
+from . import fingerprints
+from .ingestion import ingest_report
+
+logger = logging.getLogger(__name__)
+
+
+def stage_upload(upload):
+    """
+    Put an uploaded file into the staging directory.
+    Returns (path, sha256) with the content hash computed on the same pass.
+
+    Uploads Django has already spooled to disk are renamed into place;
+    in-memory uploads are written once. A partial file is never left behind.
+    """
+    os.makedirs(settings.REPORT_STAGING_DIR, exist_ok=True)
+    safe_name = get_valid_filename(os.path.basename(upload.name)) or 'report.pdf'
+    path = os.path.join(settings.REPORT_STAGING_DIR, f"{uuid.uuid4().hex}_{safe_name}")
+    digest = hashlib.sha256()
+    try:
+        if hasattr(upload, 'temporary_file_path'):
+            for chunk in upload.chunks():
+                digest.update(chunk)
+            file_move_safe(upload.temporary_file_path(), path)
+        else:
+            with open(path, 'wb') as destination:
+                for chunk in upload.chunks():
+                    digest.update(chunk)
+                    destination.write(chunk)
+    except Exception:
+        discard_staged_file(path)
+        raise
+    return path, digest.hexdigest()
+
+
+def discard_staged_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def find_in_flight_job(sha256, patient=None, mobile=''):
+    """The queued or running job for an identical upload for the same patient (or new-patient mobile), if any"""
+    if not sha256:
+        return None
+    jobs = ReportIngestionJob.objects.filter(
+        sha256=sha256, status__in=[ReportIngestionJob.STATUS_QUEUED, ReportIngestionJob.STATUS_RUNNING],
+    )
+    if patient is not None:
+        jobs = jobs.filter(patient=patient)
+    else:
+        jobs = jobs.filter(patient__isnull=True, mobile=mobile or '')
+    return jobs.order_by('created_at').first()
+
+
+def enqueue_report_upload(upload, patient=None, mobile=''):
+    """
+    Stage the upload and queue it for processing.
+
+    Returns (job, duplicate). An upload whose content matches one already
+    stored (for this patient, or for a patient with this mobile) is not
+    queued: duplicate is its ReportFingerprint and job is None. One matching
+    an upload still queued or running, such as a retry or a double-click,
+    is not queued either: job is that upload's job.
+
+    The job row is the durable record of the work; it is handed to the worker
+    pool once the surrounding transaction commits. Jobs left queued by a
+    restart are picked up by `manage.py process_report_jobs`.
+    """
+    path, sha256 = stage_upload(upload)
+    try:
+        duplicate = fingerprints.find_duplicate_report(sha256, patient=patient, mobile=mobile)
+        if duplicate is not None:
+            fingerprints.record_hit(duplicate)
+            discard_staged_file(path)
+            return None, duplicate
+        in_flight = find_in_flight_job(sha256, patient=patient, mobile=mobile)
+        if in_flight is not None:
+            discard_staged_file(path)
+            return in_flight, None
+        job = ReportIngestionJob.objects.create(
+            patient=patient,
+            mobile=mobile or '',
+            upload_path=path,
+            original_name=os.path.basename(upload.name),
+            sha256=sha256,
+        )
+    except Exception:
+        discard_staged_file(path)
+        raise
+    transaction.on_commit(lambda: dispatch(job.pk))
+    return job, None
+
+
+def dispatch(job_pk):
+    """Hand a queued job to the background worker pool"""
+    return background.submit(run_job, job_pk)
+
+
+def claim_job(job_pk):
+    """Atomically move a job from queued to running; False if another worker has it"""
+    claimed = ReportIngestionJob.objects.filter(
+        pk=job_pk, status=ReportIngestionJob.STATUS_QUEUED
+    ).update(
+        status=ReportIngestionJob.STATUS_RUNNING,
+        stage='starting',
+        started_at=timezone.now(),
+        attempts=F('attempts') + 1,
+    )
+    return claimed == 1
+
+
+def run_job(job_pk):
+    """Process one queued job, recording stage, timings and the outcome"""
+    if not claim_job(job_pk):
+        return None
+    job = ReportIngestionJob.objects.select_related('patient').get(pk=job_pk)
+    timings = {'queued_seconds': round((job.started_at - job.created_at).total_seconds(), 3)}
+    started = time.perf_counter()
+    stage_started = [started]
+
+    def on_stage(name):
+        now = time.perf_counter()
+        if job.stage != 'starting':
+            timings[f'{job.stage}_seconds'] = round(now - stage_started[0], 3)
+        stage_started[0] = now
+        job.stage = name
+        ReportIngestionJob.objects.filter(pk=job.pk).update(stage=name, timings=timings)
+
+    try:
+        report, merged = ingest_report(job, on_stage=on_stage, timings=timings.setdefault('pipeline', {}))
+    except Exception as e:
+        logger.exception("Report ingestion job %s failed", job.job_id)
+        on_stage('failed')
+        job.status = ReportIngestionJob.STATUS_FAILED
+        job.error = str(e)
+    else:
+        on_stage('done')
+        job.status = ReportIngestionJob.STATUS_SUCCEEDED
+        job.report = report
+        job.merged = merged
+    finally:
+        # Stored reports have had the staged file moved into storage already
+        discard_staged_file(job.upload_path)
+
+    timings['total_seconds'] = round(time.perf_counter() - started, 3)
+    job.timings = timings
+    job.finished_at = timezone.now()
+    job.save(update_fields=['patient', 'status', 'stage', 'timings', 'report', 'merged', 'error', 'finished_at'])
+    return job
+
+
+def requeue_interrupted_jobs():
+    """Put jobs that were running when their worker died back on the queue"""
+    return ReportIngestionJob.objects.filter(
+        status=ReportIngestionJob.STATUS_RUNNING
+    ).update(status=ReportIngestionJob.STATUS_QUEUED, stage='queued')
+
+
+def pending_job_ids():
+    return list(
+        ReportIngestionJob.objects.filter(status=ReportIngestionJob.STATUS_QUEUED)
+        .order_by('created_at')
+        .values_list('pk', flat=True)
+    )
+
+
+def purge_orphaned_staged_files():
+    """Remove staged uploads that no queued or running job refers to"""
+    if not os.path.isdir(settings.REPORT_STAGING_DIR):
+        return 0
+    active = set(
+        ReportIngestionJob.objects.filter(
+            status__in=[ReportIngestionJob.STATUS_QUEUED, ReportIngestionJob.STATUS_RUNNING]
+        ).values_list('upload_path', flat=True)
+    )
+    removed = 0
+    for entry in os.scandir(settings.REPORT_STAGING_DIR):
+        if entry.is_file() and entry.path not in active:
+            discard_staged_file(entry.path)
+            removed += 1
+    return removed
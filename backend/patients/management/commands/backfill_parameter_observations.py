@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from patients import observations
+from patients.models import MedicalReport
+
+
+class Command(BaseCommand):
+    help = "Rebuild ParameterObservation rows from the reports' parameters JSON, keeping the dates of existing rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patient', type=int, action='append', help='Patient id; repeat for several. Defaults to every patient.')
+
+    def handle(self, *args, **options):
+        reports = MedicalReport.objects.order_by('id')
+        if options['patient']:
+            reports = reports.filter(patient_id__in=options['patient'])
+        total = count = 0
+        for report in reports.iterator(chunk_size=200):
+            total += observations.sync_report(report)
+            count += 1
+        self.stdout.write(f"Wrote {total} observation(s) for {count} report(s).")
@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand
+from patients import jobs
+
+
+class Command(BaseCommand):
+    help = 'Process queued report ingestion jobs, e.g. after a restart or as a dedicated worker.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requeue-running', action='store_true',
+                            help='Requeue jobs left running by a worker that died.')
+        parser.add_argument('--purge-orphans', action='store_true',
+                            help='Delete staged uploads that no queued or running job refers to.')
+        parser.add_argument('--watch', action='store_true',
+                            help='Keep polling the queue instead of exiting once it is empty.')
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Seconds between polls in --watch mode.')
+
+    def handle(self, *args, **options):
+        if options['requeue_running']:
+            count = jobs.requeue_interrupted_jobs()
+            self.stdout.write(f"Requeued {count} interrupted job(s).")
+        if options['purge_orphans']:
+            count = jobs.purge_orphaned_staged_files()
+            self.stdout.write(f"Removed {count} orphaned staged upload(s).")
+        while True:
+            for job_pk in jobs.pending_job_ids():
+                job = jobs.run_job(job_pk)
+                if job is not None:
+                    self.stdout.write(f"{job.job_id}: {job.status} ({job.timings.get('total_seconds')}s)")
+            if not options['watch']:
+                break
+            time.sleep(options['interval'])
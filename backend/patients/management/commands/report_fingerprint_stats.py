@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from patients import fingerprints
+from patients.models import ReportFingerprint
+
+
+class Command(BaseCommand):
+    help = 'Show hit rates of the uploaded-report deduplication index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help='Number of most-hit fingerprints to list.')
+
+    def handle(self, *args, **options):
+        stats = fingerprints.get_stats()
+        self.stdout.write(
+            f"Fingerprints: {stats['fingerprints']}  hits: {stats['hits']}  "
+            f"misses: {stats['misses']}  hit rate: {stats['hit_rate']:.1%}"
+        )
+        top = ReportFingerprint.objects.select_related('report__patient').filter(hit_count__gt=0).order_by('-hit_count')[:options['top']]
+        for fingerprint in top:
+            self.stdout.write(f"  {fingerprint.sha256[:12]}  {fingerprint.hit_count:>5} hits  {fingerprint.report or '(report deleted)'}")
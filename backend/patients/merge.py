@@ -0,0 +1,146 @@
+"""
+Storing extracted reports, merged by type.
+
+A patient has one MedicalReport per report type (unique on patient and
+report_type). An upload of a type the patient already has is merged into
+it: each parameter's new value and status are appended to its readings,
+the upload's date to report_dates, and its observations, advice and file
+replace the stored ones.
+
+Merges run in a transaction holding a row lock on the patient
+(select_for_update), so concurrent uploads for a patient queue up instead
+of overwriting each other's readings or both creating a report of a new
+type. SQLite has no row locks; there a merge holds a lock file for the
+patient until it has committed, or a lock within the process where there
+is no fcntl (Windows).
+"""
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.dateparse import parse_date
+from .models import MedicalReport, Patient
+from .observations import as_list, sync_report as sync_observations
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Patients share this many lock files on SQLite
+LOCK_STRIPES = 256
+_process_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+def report_type_of(report_data):
+    return report_data.get('report_type') or 'Unknown'
+
+
+def merge_parameters(parameters, new_parameters):
+    """
+    parameters with the readings of new_parameters appended, by name. Values
+    and statuses may be single readings (an upload) or lists (a stored report).
+    """
+    merged = {param['name']: dict(param) for param in parameters or []}
+    for param in new_parameters or []:
+        current = merged.get(param['name'])
+        if current is None:
+            merged[param['name']] = {**param, 'value': as_list(param.get('value')),
+                                     'status': as_list(param.get('status'))}
+        else:
+            current['value'] = as_list(current.get('value')) + as_list(param.get('value'))
+            current['status'] = as_list(current.get('status')) + as_list(param.get('status'))
+    return list(merged.values())
+
+
+def merge_dates(report_dates, new_dates):
+    return list(report_dates) + [date for date in new_dates if date not in report_dates]
+
+
+def _upload_date(report_data):
+    """The upload's report date, or None if it has none or it is not a date"""
+    try:
+        return parse_date(str(report_data.get('report_date') or ''))
+    except ValueError:
+        return None
+
+
+@contextmanager
+def _lock_file(patient_id):
+    """Hold the patient's lock file where the database has no row locks"""
+    if connection.features.has_select_for_update:
+        yield
+        return
+    stripe = int(hashlib.sha256(str(patient_id).encode()).hexdigest()[:8], 16) % LOCK_STRIPES
+    if fcntl is None:
+        with _process_locks[stripe]:
+            yield
+        return
+    os.makedirs(settings.REPORT_MERGE_LOCK_DIR, exist_ok=True)
+    with open(os.path.join(settings.REPORT_MERGE_LOCK_DIR, f"{stripe:03d}.lock"), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _create_report(patient, report_type, report_data, file):
+    report_date = report_data.get('report_date')
+    return MedicalReport.objects.create(
+        patient=patient,
+        report_file=file,
+        report_type=report_type,
+        report_date=_upload_date(report_data) or datetime.now().date(),
+        report_dates=[str(report_date)] if report_date else [],
+        parameters=merge_parameters([], report_data.get('parameters', [])),
+        observations=report_data.get('observations', []),
+        advise=report_data.get('advise', []),
+    )
+
+
+def _merge_into(report, report_data, file):
+    report_date = report_data.get('report_date')
+    report.report_dates = merge_dates(report.report_dates or [str(report.report_date)],
+                                      [str(report_date)] if report_date else [])
+    report.parameters = merge_parameters(report.parameters, report_data.get('parameters', []))
+    report.observations = report_data.get('observations', [])
+    report.advise = report_data.get('advise', [])
+    # The upload becomes the stored file
+    report.report_file.save(file.name, file, save=False)
+    report.save()
+
+
+def merge_reports(patient, uploads):
+    """
+    Store extracted reports for the patient in one transaction.
+
+    uploads is a list of (report_data, file) with file a django File whose
+    name is used for storage; uploads of the same type are merged in the
+    order given. The ParameterObservation rows are brought up to date after
+    each upload, its new readings dated with its report date. Returns a
+    (report, merged) per upload, in order. Call it outside a transaction,
+    so the locks last until the changes are committed.
+    """
+    results = [None] * len(uploads)
+    by_type = {}
+    for index, (report_data, _) in enumerate(uploads):
+        by_type.setdefault(report_type_of(report_data), []).append(index)
+    # The lock file is released after the commit, the row lock by it
+    with _lock_file(patient.pk), transaction.atomic():
+        Patient.objects.select_for_update().get(pk=patient.pk)
+        for report_type, indexes in by_type.items():
+            report = MedicalReport.objects.filter(patient=patient, report_type=report_type).first()
+            for index in indexes:
+                report_data, file = uploads[index]
+                merged = report is not None
+                if merged:
+                    _merge_into(report, report_data, file)
+                else:
+                    report = _create_report(patient, report_type, report_data, file)
+                sync_observations(report, _upload_date(report_data))
+                results[index] = (report, merged)
+    return results
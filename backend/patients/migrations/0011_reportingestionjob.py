@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0010_patient_address_patient_blood_type_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportIngestionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('mobile', models.CharField(blank=True, max_length=15)),
+                ('upload_path', models.CharField(max_length=500)),
+                ('original_name', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('stage', models.CharField(default='queued', max_length=50)),
+                ('timings', models.JSONField(blank=True, default=dict)),
+                ('merged', models.BooleanField(default=False)),
+                ('error', models.TextField(blank=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('patient', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ingestion_jobs', to='patients.patient')),
+                ('report', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ingestion_jobs', to='patients.medicalreport')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='patients_re_status_977954_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0013_chatsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParameterObservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('value', models.CharField(blank=True, max_length=100)),
+                ('value_numeric', models.FloatField(blank=True, null=True)),
+                ('unit', models.CharField(blank=True, max_length=50)),
+                ('normal_range', models.CharField(blank=True, max_length=100)),
+                ('ref_low', models.FloatField(blank=True, null=True)),
+                ('ref_high', models.FloatField(blank=True, null=True)),
+                ('status', models.CharField(blank=True, max_length=50)),
+                ('observed_on', models.DateField()),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='observations', to='patients.patient')),
+                ('report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parameter_observations', to='patients.medicalreport')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient', 'name', 'observed_on'], name='patients_pa_patient_618db5_idx'), models.Index(fields=['patient', 'status'], name='patients_pa_patient_7789d9_idx'), models.Index(fields=['name', 'status'], name='patients_pa_name_c18630_idx')],
+                'unique_together': {('report', 'name', 'position')},
+            },
+        ),
+    ]
@@ -0,0 +1,96 @@
+import re
+from django.db import migrations
+from django.utils.dateparse import parse_date
+
+# Copied from patients.observations as it was when this migration was written
+RANGE_RE = re.compile(r'(-?\d+(?:\.\d+)?)\s*(?:-|–|to)\s*(-?\d+(?:\.\d+)?)', re.IGNORECASE)
+BOUND_RE = re.compile(r'(<=?|>=?|≤|≥|up to|below|above)\s*(-?\d+(?:\.\d+)?)', re.IGNORECASE)
+
+
+def as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def parse_number(value):
+    try:
+        return float(str(value).replace(',', '').strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_range(text):
+    text = str(text or '').replace(',', '')
+    match = RANGE_RE.search(text)
+    if match:
+        return float(match.group(1)), float(match.group(2))
+    match = BOUND_RE.search(text)
+    if match:
+        bound = float(match.group(2))
+        if match.group(1).lower() in ('<', '<=', '≤', 'up to', 'below'):
+            return None, bound
+        return bound, None
+    return None, None
+
+
+def _parse_date(value):
+    try:
+        return parse_date(str(value))
+    except ValueError:
+        return None
+
+
+def observation_rows(parameters, report_dates, report_date):
+    """Field values for a ParameterObservation per reading, dated from report_dates by position, else report_date"""
+    rows = []
+    for param in parameters or []:
+        if not isinstance(param, dict) or not param.get('name'):
+            continue
+        name = str(param['name'])[:200]
+        statuses = as_list(param.get('status'))
+        ref_low, ref_high = parse_range(param.get('normal_range'))
+        for position, value in enumerate(as_list(param.get('value'))):
+            observed = None
+            if report_dates and position < len(report_dates):
+                observed = _parse_date(report_dates[position])
+            status = statuses[position] if position < len(statuses) else None
+            rows.append({
+                'name': name,
+                'position': position,
+                'value': '' if value is None else str(value)[:100],
+                'value_numeric': parse_number(value),
+                'unit': str(param.get('unit') or '')[:50],
+                'normal_range': str(param.get('normal_range') or '')[:100],
+                'ref_low': ref_low,
+                'ref_high': ref_high,
+                'status': str(status or '').strip().lower()[:50],
+                'observed_on': observed or report_date,
+            })
+    return rows
+
+
+def backfill(apps, schema_editor):
+    MedicalReport = apps.get_model('patients', 'MedicalReport')
+    ParameterObservation = apps.get_model('patients', 'ParameterObservation')
+    batch = []
+    for report in MedicalReport.objects.iterator(chunk_size=500):
+        for row in observation_rows(report.parameters, report.report_dates, report.report_date):
+            batch.append(ParameterObservation(patient_id=report.patient_id, report_id=report.pk, **row))
+        if len(batch) >= 1000:
+            ParameterObservation.objects.bulk_create(batch)
+            batch = []
+    ParameterObservation.objects.bulk_create(batch)
+
+
+def clear(apps, schema_editor):
+    apps.get_model('patients', 'ParameterObservation').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0014_parameterobservation'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, clear),
+    ]
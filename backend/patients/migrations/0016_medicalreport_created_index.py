@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0015_backfill_parameter_observations'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicalreport',
+            index=models.Index(fields=['patient', '-created_at'], name='patients_me_patient_edc362_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def from_created_at(apps, schema_editor):
+    # Existing reports were last changed no later than they were created, as far as we know
+    apps.get_model('patients', 'MedicalReport').objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0016_medicalreport_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalreport',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(from_created_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+# Copied from patients.observations and patients.merge as they were when this migration was written
+def as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def merge_parameters(parameters, new_parameters):
+    merged = {param['name']: dict(param) for param in parameters or []}
+    for param in new_parameters or []:
+        current = merged.get(param['name'])
+        if current is None:
+            merged[param['name']] = {**param, 'value': as_list(param.get('value')),
+                                     'status': as_list(param.get('status'))}
+        else:
+            current['value'] = as_list(current.get('value')) + as_list(param.get('value'))
+            current['status'] = as_list(current.get('status')) + as_list(param.get('status'))
+    return list(merged.values())
+
+
+def merge_dates(report_dates, new_dates):
+    return list(report_dates) + [date for date in new_dates if date not in report_dates]
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Merge reports of a type the patient has more than one of into the oldest,
+    as later uploads would have been, before (patient, report_type) is made
+    unique. Their readings, with their observation rows, are appended in
+    upload order, and ingestion jobs and fingerprints are pointed at the
+    merged report.
+    """
+    MedicalReport = apps.get_model('patients', 'MedicalReport')
+    ParameterObservation = apps.get_model('patients', 'ParameterObservation')
+    ReportIngestionJob = apps.get_model('patients', 'ReportIngestionJob')
+    ReportFingerprint = apps.get_model('patients', 'ReportFingerprint')
+    groups = (
+        MedicalReport.objects.values('patient_id', 'report_type')
+        .annotate(count=Count('id')).filter(count__gt=1)
+    )
+    for group in groups:
+        kept, *duplicates = MedicalReport.objects.filter(
+            patient_id=group['patient_id'], report_type=group['report_type'],
+        ).order_by('created_at', 'id')
+        for duplicate in duplicates:
+            # The duplicate's readings come after the ones already kept
+            offsets = {
+                str(param['name'])[:200]: len(as_list(param.get('value')))
+                for param in kept.parameters or [] if isinstance(param, dict) and param.get('name')
+            }
+            observations = list(ParameterObservation.objects.filter(report=duplicate))
+            for observation in observations:
+                observation.report_id = kept.pk
+                observation.position += offsets.get(observation.name, 0)
+            ParameterObservation.objects.bulk_update(observations, ['report', 'position'])
+            kept.report_dates = merge_dates(kept.report_dates or [str(kept.report_date)],
+                                            duplicate.report_dates or [str(duplicate.report_date)])
+            kept.parameters = merge_parameters(kept.parameters, duplicate.parameters)
+            kept.observations = duplicate.observations
+            kept.advise = duplicate.advise
+            kept.report_file = duplicate.report_file.name
+            ReportIngestionJob.objects.filter(report=duplicate).update(report=kept, merged=True)
+            ReportFingerprint.objects.filter(report=duplicate).update(report=kept)
+            duplicate.delete()
+        kept.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0017_medicalreport_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0018_merge_duplicate_reports'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='medicalreport',
+            unique_together={('patient', 'report_type')},
+        ),
+    ]
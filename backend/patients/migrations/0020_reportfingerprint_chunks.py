@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0019_medicalreport_unique_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportfingerprint',
+            name='chunks',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -91,6 +91,15 @@ class MedicalReport(models.Model):
     observations = models.JSONField(default=list, blank=True)
     advise = models.JSONField(default=list, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Uploads of a type the patient already has are merged (see merge.py)
+        unique_together = [('patient', 'report_type')]
+        indexes = [
+            # Keyset pagination of a patient's reports
+            models.Index(fields=['patient', '-created_at']),
+        ]
 
     def __str__(self):
         if self.report_dates and len(self.report_dates) > 1:
@@ -98,5 +107,144 @@ class MedicalReport(models.Model):
         return f"{self.report_type} ({self.report_date}) for {self.patient.name}"
 
 
+class ReportIngestionJob(models.Model):
+    """A queued report upload, processed outside the request by the worker pool"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    job_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    # Set for uploads against an existing patient; new-patient uploads only carry a mobile
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='ingestion_jobs', blank=True, null=True)
+    mobile = models.CharField(max_length=15, blank=True)
+    upload_path = models.CharField(max_length=500)
+    original_name = models.CharField(max_length=255)
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    stage = models.CharField(max_length=50, default='queued')
+    timings = models.JSONField(default=dict, blank=True)
+    report = models.ForeignKey(MedicalReport, on_delete=models.SET_NULL, related_name='ingestion_jobs', blank=True, null=True)
+    merged = models.BooleanField(default=False)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Job {self.job_id} ({self.status})"
+
+
+class ReportFingerprint(models.Model):
+    """Content hash of an uploaded report PDF and the extraction it produced"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    extraction = models.JSONField(default=dict, blank=True)
+    # The text chunks the upload was indexed with, so a reuse can index its own report
+    chunks = models.JSONField(default=list, blank=True)
+    # The report the upload was stored in; cleared if that report is deleted
+    report = models.ForeignKey(MedicalReport, on_delete=models.SET_NULL, related_name='fingerprints', blank=True, null=True)
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.hit_count} hits)"
+
+
+class ChatSession(models.Model):
+    """A chat conversation about one patient; turns older than the last few are folded into summary"""
+    SOURCE_PATIENT = 'patient'
+    SOURCE_LAB = 'lab'
+    SOURCE_CHOICES = [
+        (SOURCE_PATIENT, 'Patient chat'),
+        (SOURCE_LAB, 'Lab technician chat'),
+    ]
+
+    session_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='chat_sessions')
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default=SOURCE_PATIENT)
+    # Rolling summary of the compacted turns
+    summary = models.TextField(blank=True)
+    compactions = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'updated_at']),
+            models.Index(fields=['updated_at']),
+        ]
+
+    def __str__(self):
+        return f"Chat {self.session_id} ({self.patient_id})"
+
 
+class ChatMessage(models.Model):
+    ROLE_USER = 'user'
+    ROLE_ASSISTANT = 'assistant'
+    ROLE_CHOICES = [
+        (ROLE_USER, 'User'),
+        (ROLE_ASSISTANT, 'Assistant'),
+    ]
+
+    session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name='messages')
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+    content = models.TextField()
+    tokens = models.PositiveIntegerField(default=0)
+    # Folded into the session summary and no longer sent to the model
+    compacted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['session', 'compacted', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.role}: {self.content[:50]}"
+
+
+class ParameterObservation(models.Model):
+    """
+    One reading of a lab parameter, normalised out of MedicalReport.parameters
+    so values can be queried by patient, name, status and date in the database.
+    """
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='observations')
+    report = models.ForeignKey(MedicalReport, on_delete=models.CASCADE, related_name='parameter_observations')
+    name = models.CharField(max_length=200)
+    # Index of the reading in the parameter's value list
+    position = models.PositiveIntegerField(default=0)
+    value = models.CharField(max_length=100, blank=True)
+    value_numeric = models.FloatField(blank=True, null=True)
+    unit = models.CharField(max_length=50, blank=True)
+    normal_range = models.CharField(max_length=100, blank=True)
+    ref_low = models.FloatField(blank=True, null=True)
+    ref_high = models.FloatField(blank=True, null=True)
+    # Lower-cased as extracted, e.g. 'normal', 'high', 'low'; empty if none
+    status = models.CharField(max_length=50, blank=True)
+    observed_on = models.DateField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'name', 'observed_on']),
+            models.Index(fields=['patient', 'status']),
+            models.Index(fields=['name', 'status']),
+        ]
+        # unique_together rather than a UniqueConstraint, which DRF cannot
+        # introspect on Django 4.2
+        unique_together = [('report', 'name', 'position')]
+
+    def __str__(self):
+        return f"{self.name} = {self.value} {self.unit} ({self.observed_on})"
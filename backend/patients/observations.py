@@ -0,0 +1,119 @@
+"""
+ParameterObservation rows derived from MedicalReport.parameters.
+
+A report's parameters JSON keeps every reading of a parameter in parallel
+value and status lists. Each reading becomes one row. Readings stored
+before are re-dated as they were; new readings get the date of the upload
+they came from, or, with no upload date known, the report date at the same
+position in report_dates.
+"""
+import re
+from collections import Counter
+from django.db import transaction
+from django.utils.dateparse import parse_date
+from .models import ParameterObservation
+from .signals import observations_changed
+
+RANGE_RE = re.compile(r'(-?\d+(?:\.\d+)?)\s*(?:-|–|to)\s*(-?\d+(?:\.\d+)?)', re.IGNORECASE)
+BOUND_RE = re.compile(r'(<=?|>=?|≤|≥|up to|below|above)\s*(-?\d+(?:\.\d+)?)', re.IGNORECASE)
+
+
+def as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def parse_number(value):
+    try:
+        return float(str(value).replace(',', '').strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_range(text):
+    """(low, high) from a reference range such as '13.5-17.5', '< 200' or '> 40'; None where open"""
+    text = str(text or '').replace(',', '')
+    match = RANGE_RE.search(text)
+    if match:
+        return float(match.group(1)), float(match.group(2))
+    match = BOUND_RE.search(text)
+    if match:
+        bound = float(match.group(2))
+        if match.group(1).lower() in ('<', '<=', '≤', 'up to', 'below'):
+            return None, bound
+        return bound, None
+    return None, None
+
+
+def _parse_date(value):
+    try:
+        return parse_date(str(value))
+    except ValueError:
+        return None
+
+
+def is_abnormal(status):
+    return status not in ('', 'normal')
+
+
+def abnormal_counts(rows):
+    """Abnormal readings per parameter name in observation rows (dicts)"""
+    return Counter(row['name'] for row in rows if is_abnormal(row['status']))
+
+
+def observation_rows(parameters, report_dates, report_date, known_dates=None, observed_on=None):
+    """
+    Field values for a ParameterObservation per reading in a parameters list.
+
+    known_dates maps (name, position) to the date of a reading stored before;
+    other readings are dated observed_on, else from report_dates by position,
+    else report_date.
+    """
+    known_dates = known_dates or {}
+    rows = []
+    for param in parameters or []:
+        if not isinstance(param, dict) or not param.get('name'):
+            continue
+        name = str(param['name'])[:200]
+        statuses = as_list(param.get('status'))
+        ref_low, ref_high = parse_range(param.get('normal_range'))
+        for position, value in enumerate(as_list(param.get('value'))):
+            observed = known_dates.get((name, position)) or observed_on
+            if observed is None and report_dates and position < len(report_dates):
+                observed = _parse_date(report_dates[position])
+            status = statuses[position] if position < len(statuses) else None
+            rows.append({
+                'name': name,
+                'position': position,
+                'value': '' if value is None else str(value)[:100],
+                'value_numeric': parse_number(value),
+                'unit': str(param.get('unit') or '')[:50],
+                'normal_range': str(param.get('normal_range') or '')[:100],
+                'ref_low': ref_low,
+                'ref_high': ref_high,
+                'status': str(status or '').strip().lower()[:50],
+                'observed_on': observed or report_date,
+            })
+    return rows
+
+
+def sync_report(report, observed_on=None):
+    """
+    Rewrite the report's observations from its parameters JSON, dating
+    readings added since the last sync observed_on, and send
+    observations_changed with the change in abnormal readings. Returns the
+    row count.
+    """
+    with transaction.atomic():
+        previous = list(report.parameter_observations.values('name', 'position', 'observed_on', 'status'))
+        known_dates = {(row['name'], row['position']): row['observed_on'] for row in previous}
+        rows = observation_rows(report.parameters, report.report_dates, report.report_date, known_dates, observed_on)
+        report.parameter_observations.all().delete()
+        ParameterObservation.objects.bulk_create([
+            ParameterObservation(patient_id=report.patient_id, report=report, **row) for row in rows
+        ])
+        abnormal = abnormal_counts(rows)
+        abnormal.subtract(abnormal_counts(previous))
+        abnormal = {name: change for name, change in abnormal.items() if change}
+        if abnormal:
+            observations_changed.send(sender=ParameterObservation, report=report, abnormal=abnormal)
+    return len(rows)
@@ -1,35 +1,22 @@
 import re
-from azure.ai.formrecognizer import DocumentAnalysisClient
-from azure.core.credentials import AzureKeyCredential
 from datetime import datetime 
-import requests
 import json
-import fitz
-from sentence_transformers import SentenceTransformer
-from backend.pinecone_client import upsert_chunks
+from backend.llm import LLMError, MISTRAL_MODEL, chat_completion
+from backend.services import get_azure_client, get_embedder
+from backend.pinecone_client import upsert_chunks, embed_text_chunks
 import os
-import uuid
 import demjson3
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-# Global variable for the model, to be loaded lazily
-model = None
-MODEL_NAME = 'all-MiniLM-L6-v2'
-
-AZURE_ENDPOINT = os.environ.get('AZURE_ENDPOINT')
-AZURE_KEY = os.environ.get('AZURE_KEY')
 OPENROUTER_API_KEY = os.environ.get('OPENROUTER_API_KEY')
 
 def get_sentence_transformer_model():
     """
-    Loads the SentenceTransformer model if it hasn't been loaded yet.
+    Return the shared embedding model, loading it if it hasn't been loaded yet.
     """
-    global model
-    if model is None:
-        logging.info("Loading SentenceTransformer model...")
-        model = SentenceTransformer(MODEL_NAME)
-        logging.info("SentenceTransformer model loaded.")
-    return model
+    return get_embedder()
 
 def extract_report_date(text: str) -> str:
     """
@@ -72,22 +59,19 @@ def extract_report_date(text: str) -> str:
     
     return None
 
-def analyze_medical_report(pdf_path):
-    """Analyze medical report using Azure Form Recognizer"""
-    if not AZURE_ENDPOINT or not AZURE_KEY:
-        raise ValueError("Azure Form Recognizer endpoint or key not configured")
-    
-    document_analysis_client = DocumentAnalysisClient(
-        endpoint=AZURE_ENDPOINT,
-        credential=AzureKeyCredential(AZURE_KEY),
-        api_version="2023-07-31"
-    )
+def read_pdf_bytes(pdf):
+    """Return the PDF contents; pdf is either a path or the bytes themselves"""
+    if isinstance(pdf, (bytes, bytearray, memoryview)):
+        return pdf
+    with open(pdf, "rb") as f:
+        return f.read()
 
-    with open(pdf_path, "rb") as f:
-        poller = document_analysis_client.begin_analyze_document(
-            "prebuilt-document", 
-            document=f
-        )
+def analyze_medical_report(pdf):
+    """Analyze medical report (a path or the PDF bytes) using Azure Form Recognizer"""
+    poller = get_azure_client().begin_analyze_document(
+        "prebuilt-document", 
+        document=read_pdf_bytes(pdf)
+    )
     
     result = poller.result()
     
@@ -232,8 +216,6 @@ def enhance_medical_data(report_data, full_text):
         raise ValueError("OpenRouter API key not configured")
     
     headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
         "HTTP-Referer": "https://your-medical-app.com",
         "X-Title": "Medical Report Analysis"
     }
@@ -274,79 +256,103 @@ def enhance_medical_data(report_data, full_text):
     )
 
 
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers=headers,
-        json={
-            "model": "mistralai/mistral-7b-instruct",
+    content = chat_completion(
+        {
+            "model": MISTRAL_MODEL,
             "messages": [{"role": "user", "content": formatted_prompt}],
             "temperature": 0.3,
             "max_tokens": 2500,
             "stop": ["</s>", "[INST]"]
         },
+        headers=headers,
         timeout=60
     )
 
-    if response.status_code == 200:
-        content = response.json()['choices'][0]['message']['content']
-        # Try to extract the first {...} block
-        content = extract_json_block(content)
-        # Remove trailing commas before } or ]
-        content = re.sub(r',([ \t\r\n]*[}\]])', r'\1', content)
-        try:
-            enhanced_analysis = clean_and_load_json(content.strip())
-        except json.JSONDecodeError as e:
-            print("JSON decode error:", e)
-            print("Content was:", repr(content))
-            raise
-        final_output = {
-            "patient_name": report_data.get("patient_name"),
-            "age": report_data.get("age"),
-            "sex": report_data.get("sex"),
-            "report_date": report_data.get("report_date"),
-            "report_type": report_data.get("report_type"),
-            "parameters": report_data.get("parameters"),
-            "observations": enhanced_analysis["observations"],
-            "advise": enhanced_analysis["advise"],
-        }
-        return final_output
-
-def process_pdf_report(report_file_path):
-    """
-    Process PDF report, extract text, enhance it, and upsert to Pinecone.
-    """
-    # 1. Extract text and analyze with Azure Form Recognizer
-    report_data = analyze_medical_report(report_file_path)
-    
-    # 2. Extract full text with PyMuPDF for context
+    if not content:
+        raise LLMError("The language model returned an empty analysis")
+    # Try to extract the first {...} block
+    content = extract_json_block(content)
+    # Remove trailing commas before } or ]
+    content = re.sub(r',([ \t\r\n]*[}\]])', r'\1', content)
+    enhanced_analysis = clean_and_load_json(content.strip())
+    final_output = {
+        "patient_name": report_data.get("patient_name"),
+        "age": report_data.get("age"),
+        "sex": report_data.get("sex"),
+        "report_date": report_data.get("report_date"),
+        "report_type": report_data.get("report_type"),
+        "parameters": report_data.get("parameters"),
+        "observations": enhanced_analysis["observations"],
+        "advise": enhanced_analysis["advise"],
+    }
+    return final_output
+
+def extract_full_text(pdf):
+    """Extract the full text of the PDF (a path or the PDF bytes) with PyMuPDF"""
+    import fitz  # PyMuPDF is only needed by ingestion workers
+
     full_text = ""
-    with fitz.open(report_file_path) as doc:
+    with fitz.open(stream=read_pdf_bytes(pdf), filetype="pdf") as doc:
         for page in doc:
             full_text += page.get_text()
-    
-    # 3. Enhance data with OpenRouter
-    enhanced_data = enhance_medical_data(report_data, full_text)
+    return full_text
 
-    # 4. Generate embeddings and upsert to Pinecone
-    # Use the lazy-loaded model
-    model = get_sentence_transformer_model()
-    
-    chunks = [str(v) for k, v in enhanced_data.items() if v]
-    embeddings = model.encode(chunks)
-    
-    patient_id = enhanced_data.get('patient_id', str(uuid.uuid4()))
-    report_id = str(uuid.uuid4())
-    
-    metadata_list = [{
-        "patient_id": patient_id,
-        "report_id": report_id,
-        "document_part": k,
-        "text_chunk": chunk
-    } for k, chunk in zip(enhanced_data.keys(), chunks)]
-    
-    upsert_chunks(
-        f"{patient_id}_{report_id}", 
-        list(zip(embeddings, metadata_list))
-    )
-    
-    return enhanced_data
+def _timed(timings, stage, fn, *args):
+    """Run one pipeline stage, recording its wall-clock time in timings"""
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        timings[f"{stage}_seconds"] = round(time.perf_counter() - started, 3)
+
+def process_pdf_report(report_file, timings=None):
+    """
+    Process PDF report: extract its text and data, enhance it, and embed the
+    text for the vector store. Returns (report_data, embedded); embedded is
+    handed to index_report once the report is stored.
+
+    report_file is a path or the PDF bytes. It is read once and the same
+    buffer is shared by the Azure and PyMuPDF stages.
+
+    Independent stages run concurrently:
+
+        azure_analysis ----------------+--> llm_enhancement
+        text_extraction --+------------+
+                          +--> embedding
+
+    Per-stage wall-clock times are written into timings (if given) so the
+    critical path of each upload can be inspected.
+    """
+    timings = {} if timings is None else timings
+    started = time.perf_counter()
+    pdf_bytes = read_pdf_bytes(report_file)
+
+    with ThreadPoolExecutor(max_workers=3, thread_name_prefix='report-pipeline') as pool:
+        # 1. Azure layout analysis and PyMuPDF text extraction in parallel
+        analysis = pool.submit(_timed, timings, 'azure_analysis', analyze_medical_report, pdf_bytes)
+        text = pool.submit(_timed, timings, 'text_extraction', extract_full_text, pdf_bytes)
+
+        # 2. Embed the raw text as soon as it is available, without waiting for Azure or the LLM
+        full_text = text.result()
+        embedding = pool.submit(_timed, timings, 'embedding', embed_text_chunks, full_text)
+
+        # 3. Enhance data with OpenRouter once both extractions are in
+        report_data = analysis.result()
+        enhanced_data = _timed(timings, 'llm_enhancement', enhance_medical_data, report_data, full_text)
+        embedded = embedding.result()
+
+    timings['pipeline_seconds'] = round(time.perf_counter() - started, 3)
+    logging.info(f"Report pipeline timings: {timings}")
+    return enhanced_data, embedded
+
+def index_report(patient_name, report, embedded, timings=None):
+    """
+    Upsert the precomputed embeddings of an upload under the patient's name
+    and the report_id of the MedicalReport it was stored in, so deleting the
+    report deletes them too.
+    """
+    timings = {} if timings is None else timings
+    upsert_stats = _timed(timings, 'upsert', upsert_chunks, patient_name, str(report.report_id), '', embedded)
+    timings['vectors'] = upsert_stats['vectors']
+    timings['upsert_calls'] = len(upsert_stats['upserts'])
+    return upsert_stats
@@ -1,8 +1,10 @@
 from rest_framework import serializers
-from .models import Patient, MedicalReport
+from backend.listing import SparseFieldsMixin
+from .models import Patient, MedicalReport, ParameterObservation, ReportIngestionJob
 
-class MedicalReportSerializer(serializers.ModelSerializer):
+class MedicalReportSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     report_file = serializers.SerializerMethodField()
+    heavy_fields = ('parameters', 'observations', 'advise')
 
     class Meta:
         model = MedicalReport
@@ -14,11 +16,16 @@ class MedicalReportSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.report_file.url)
         return obj.report_file.url
 
-class PatientSerializer(serializers.ModelSerializer):
+class PatientSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     profile_photo = serializers.SerializerMethodField()
     bmi = serializers.ReadOnlyField()
     bmi_category = serializers.ReadOnlyField()
     age_from_dob = serializers.ReadOnlyField()
+    field_sources = {
+        'bmi': ('height_cm', 'weight_kg'),
+        'bmi_category': ('height_cm', 'weight_kg'),
+        'age_from_dob': ('date_of_birth', 'age'),
+    }
     
     class Meta:
         model = Patient
@@ -28,4 +35,16 @@ class PatientSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if obj.profile_photo and request is not None:
             return request.build_absolute_uri(obj.profile_photo.url)
-        return obj.profile_photo.url if obj.profile_photo else None 
\ No newline at end of file
+        return obj.profile_photo.url if obj.profile_photo else None
+
+class ReportIngestionJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReportIngestionJob
+        fields = ['job_id', 'status', 'stage', 'timings', 'patient', 'report', 'merged',
+                  'error', 'attempts', 'created_at', 'started_at', 'finished_at']
+
+class ParameterObservationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ParameterObservation
+        fields = ('id', 'report', 'name', 'value', 'value_numeric', 'unit', 'normal_range',
+                  'ref_low', 'ref_high', 'status', 'observed_on')
@@ -0,0 +1,28 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from .context import invalidate_patient_context
+from .models import Patient, MedicalReport
+
+# Sent by observations.sync_report inside its transaction, with the report
+# and abnormal, a dict of parameter name to the change in its abnormal readings
+observations_changed = Signal()
+
+
+def _invalidate(patient_id):
+    invalidate_patient_context(patient_id)
+    # Again after commit, in case a concurrent read cached the old reports meanwhile
+    transaction.on_commit(lambda: invalidate_patient_context(patient_id))
+
+
+@receiver(post_save, sender=MedicalReport)
+@receiver(post_delete, sender=MedicalReport)
+def report_changed(sender, instance, **kwargs):
+    """A report was created, merged into or deleted"""
+    _invalidate(instance.patient_id)
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def patient_changed(sender, instance, **kwargs):
+    _invalidate(instance.pk)
@@ -1,3 +1,292 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from .chat_memory import ask
+from .ingestion import ingest_report
+from .jobs import enqueue_report_upload
+from .merge import merge_reports
+from .models import ChatSession, MedicalReport, ParameterObservation, Patient, ReportIngestionJob
 
-# Create your tests here.
+
+def lipid_upload(value, report_date='2025-01-01', name='Cholesterol'):
+    report_data = {
+        'report_type': 'Lipid Profile',
+        'report_date': report_date,
+        'parameters': [{'name': name, 'value': str(value), 'unit': 'mg/dL',
+                        'normal_range': '< 200', 'status': 'normal'}],
+    }
+    return report_data, ContentFile(b'%PDF-1.4', name=f'lipid-{value}.pdf')
+
+
+def use_temp_media(test):
+    """Point MEDIA_ROOT and the lock and staging directories at a temporary directory for the test"""
+    media = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, media, ignore_errors=True)
+    settings_override = override_settings(MEDIA_ROOT=media, REPORT_MERGE_LOCK_DIR=media,
+                                          REPORT_STAGING_DIR=os.path.join(media, 'staging'))
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+    return media
+
+
+def staged_job(media, content=b'%PDF-1.4 lipid', **fields):
+    """A queued ingestion job for an upload staged under media"""
+    path = os.path.join(media, f'{ReportIngestionJob.objects.count()}.pdf')
+    with open(path, 'wb') as f:
+        f.write(content)
+    return ReportIngestionJob.objects.create(upload_path=path, original_name='lipid.pdf', **fields)
+
+
+EXTRACTION = {
+    'patient_name': 'Asha Rao', 'age': '52', 'sex': 'F',
+    'report_type': 'Lipid Profile', 'report_date': '2025-03-01',
+    'parameters': [{'name': 'Cholesterol', 'value': '250', 'unit': 'mg/dL',
+                    'normal_range': '< 200', 'status': 'high'}],
+}
+EMBEDDED = (['Cholesterol 250 mg/dL'], [[0.1, 0.2]])
+
+
+# The summary refresh that report saves schedule would call the model
+@mock.patch('health_summary.signals.schedule_regeneration')
+class MergeReportsTests(TransactionTestCase):
+    def setUp(self):
+        use_temp_media(self)
+        self.patient = Patient.objects.create(name='Test Patient', age=40, sex='F', mobile='5550100')
+
+    def test_merges_several_uploads_in_one_call(self, _):
+        glucose = ({'report_type': 'Glucose', 'report_date': '2025-01-02',
+                    'parameters': [{'name': 'Glucose', 'value': '90', 'status': 'normal'}]},
+                   ContentFile(b'%PDF-1.4', name='glucose.pdf'))
+        results = merge_reports(self.patient, [lipid_upload(180), glucose, lipid_upload(210, '2025-02-01')])
+
+        self.assertEqual([merged for _, merged in results], [False, False, True])
+        self.assertEqual(results[0][0].pk, results[2][0].pk)
+        report = MedicalReport.objects.get(patient=self.patient, report_type='Lipid Profile')
+        self.assertEqual(report.report_dates, ['2025-01-01', '2025-02-01'])
+        self.assertEqual(report.parameters[0]['value'], ['180', '210'])
+        self.assertEqual(
+            list(report.parameter_observations.order_by('position').values_list('value', 'observed_on__month')),
+            [('180', 1), ('210', 2)],
+        )
+
+    def test_concurrent_uploads_keep_every_reading(self, _):
+        self.upload_concurrently()
+
+    def test_concurrent_uploads_keep_every_reading_without_fcntl(self, _):
+        with mock.patch('patients.merge.fcntl', None):
+            self.upload_concurrently()
+
+    def upload_concurrently(self):
+        merge_reports(self.patient, [lipid_upload(100)])
+        uploads = 8
+        barrier = threading.Barrier(uploads)
+        errors = []
+
+        def upload(value):
+            try:
+                barrier.wait()
+                merge_reports(self.patient, [lipid_upload(value, name='Cholesterol' if value % 2 else 'HDL')])
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=upload, args=(101 + i,)) for i in range(uploads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        report = MedicalReport.objects.get(patient=self.patient, report_type='Lipid Profile')
+        values = {param['name']: param['value'] for param in report.parameters}
+        self.assertCountEqual(values['Cholesterol'], ['100'] + [str(101 + i) for i in range(0, uploads, 2)])
+        self.assertCountEqual(values['HDL'], [str(101 + i) for i in range(1, uploads, 2)])
+        self.assertEqual(ParameterObservation.objects.filter(report=report).count(), uploads + 1)
+
+
+@mock.patch('health_summary.signals.schedule_regeneration')
+@mock.patch('patients.ingestion.process_pdf_report', return_value=(EXTRACTION, EMBEDDED))
+@mock.patch('patients.report_utils.upsert_chunks', return_value={'vectors': 1, 'upserts': [{}]})
+class IngestReportTests(TestCase):
+    def setUp(self):
+        self.media = use_temp_media(self)
+
+    def test_new_patient_is_removed_when_their_report_cannot_be_stored(self, *_):
+        job = staged_job(self.media, mobile='5550101')
+        with mock.patch('patients.ingestion.merge_reports', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                ingest_report(job)
+        self.assertFalse(Patient.objects.exists())
+        self.assertIsNone(job.patient)
+
+    def test_text_is_indexed_under_the_stored_report_id(self, upsert_chunks, *_):
+        patient = Patient.objects.create(name='Asha Rao', age=52, sex='F', mobile='5550101')
+        first, merged_first = ingest_report(staged_job(self.media, content=b'first', patient=patient))
+        second, merged_second = ingest_report(staged_job(self.media, content=b'second', patient=patient))
+
+        self.assertEqual((first.pk, merged_first, merged_second), (second.pk, False, True))
+        self.assertEqual([call.args[:2] for call in upsert_chunks.call_args_list],
+                         [('Asha Rao', str(first.report_id))] * 2)
+        self.assertEqual(upsert_chunks.call_args.args[3], EMBEDDED)
+
+    def test_reused_extraction_is_indexed_under_the_new_report(self, upsert_chunks, process_pdf_report, _):
+        asha = Patient.objects.create(name='Asha Rao', age=52, sex='F', mobile='5550101')
+        ravi = Patient.objects.create(name='Ravi Kumar', age=60, sex='M', mobile='5550102')
+        ingest_report(staged_job(self.media, patient=asha, sha256='a' * 64))
+        embedded = (EMBEDDED[0], [[0.3, 0.4]])
+        with mock.patch('patients.ingestion.embed_chunks', return_value=embedded) as embed_chunks:
+            report, _ = ingest_report(staged_job(self.media, patient=ravi, sha256='a' * 64))
+
+        self.assertEqual(process_pdf_report.call_count, 1)
+        embed_chunks.assert_called_once_with(EMBEDDED[0])
+        self.assertEqual(upsert_chunks.call_args.args, ('Ravi Kumar', str(report.report_id), '', embedded))
+
+    def test_identical_upload_queued_twice_is_stored_once(self, _, process_pdf_report, __):
+        patient = Patient.objects.create(name='Asha Rao', age=52, sex='F', mobile='5550101')
+        first = staged_job(self.media, patient=patient, sha256='a' * 64)
+        retry = staged_job(self.media, patient=patient, sha256='a' * 64)
+        report, _ = ingest_report(first)
+        duplicate, merged = ingest_report(retry)
+
+        self.assertEqual((duplicate.pk, merged), (report.pk, False))
+        report.refresh_from_db()
+        self.assertEqual(report.parameters[0]['value'], ['250'])
+        self.assertEqual(process_pdf_report.call_count, 1)
+
+    def test_identical_new_patient_upload_queued_twice_creates_one_patient(self, *_):
+        first = staged_job(self.media, mobile='5550101', sha256='a' * 64)
+        retry = staged_job(self.media, mobile='5550101', sha256='a' * 64)
+        report, _ = ingest_report(first)
+        ingest_report(retry)
+
+        self.assertEqual(Patient.objects.count(), 1)
+        self.assertEqual(retry.patient, report.patient)
+
+
+class EnqueueReportUploadTests(TestCase):
+    def setUp(self):
+        use_temp_media(self)
+
+    def test_identical_upload_in_flight_is_not_queued_again(self):
+        job, _ = enqueue_report_upload(SimpleUploadedFile('lipid.pdf', b'%PDF-1.4 lipid'), mobile='5550101')
+        retry, duplicate = enqueue_report_upload(SimpleUploadedFile('lipid.pdf', b'%PDF-1.4 lipid'), mobile='5550101')
+        other, _ = enqueue_report_upload(SimpleUploadedFile('lipid.pdf', b'%PDF-1.4 lipid'), mobile='5550102')
+
+        self.assertEqual((retry, duplicate), (job, None))
+        self.assertNotEqual(other, job)
+        self.assertEqual(ReportIngestionJob.objects.count(), 2)
+
+
+class AskTests(TestCase):
+    def setUp(self):
+        self.patient = Patient.objects.create(name='Asha Rao', age=52, sex='F', mobile='5550101')
+
+    @override_settings(SINGLEFLIGHT_BACKEND='file', SINGLEFLIGHT_LOCK_DIR=tempfile.gettempdir())
+    def test_questions_that_start_a_session_are_not_shared(self):
+        generate = mock.Mock(side_effect=['First answer', 'Second answer'])
+        first = ask('chat', self.patient.pk, None, 'Is my cholesterol high?', '', 'context', generate)
+        second = ask('chat', self.patient.pk, None, 'Is my cholesterol high?', '', 'context', generate)
+
+        self.assertEqual((first[0], second[0]), ('First answer', 'Second answer'))
+        self.assertNotEqual(first[1].pk, second[1].pk)
+        self.assertEqual(ChatSession.objects.filter(patient=self.patient).count(), 2)
+
+
+@mock.patch('health_summary.signals.schedule_regeneration')
+class ListingTests(TestCase):
+    def setUp(self):
+        self.patients = [Patient.objects.create(name=name, age=40, sex='F', mobile=f'555010{i}',
+                                                height_cm=160, weight_kg=64)
+                         for i, name in enumerate(['Asha Rao', 'Ravi Kumar', 'Meena Iyer'])]
+        self.url = reverse('patient-list-create')
+
+    def test_unpaginated_list_has_every_patient_and_field(self, _):
+        patients = self.client.get(self.url).json()
+        self.assertEqual([patient['name'] for patient in patients], ['Meena Iyer', 'Ravi Kumar', 'Asha Rao'])
+        self.assertIn('bmi', patients[0])
+
+    def test_cursor_pages_follow_next_links(self, _):
+        page = self.client.get(self.url, {'page_size': 2}).json()
+        self.assertEqual([patient['name'] for patient in page['results']], ['Meena Iyer', 'Ravi Kumar'])
+        self.assertIsNone(page['previous'])
+
+        page = self.client.get(page['next']).json()
+        self.assertEqual([patient['name'] for patient in page['results']], ['Asha Rao'])
+        self.assertIsNone(page['next'])
+
+    def test_fields_limits_the_response(self, _):
+        patients = self.client.get(self.url, {'fields': 'id,name,bmi'}).json()
+        self.assertEqual(patients[0], {'id': self.patients[2].pk, 'name': 'Meena Iyer', 'bmi': 25.0})
+
+    def test_unknown_fields_are_rejected(self, _):
+        response = self.client.get(self.url, {'fields': 'name,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+
+    def test_paginated_report_listing_leaves_out_heavy_fields_unless_asked(self, _):
+        patient = self.patients[0]
+        MedicalReport.objects.create(patient=patient, report_type='Lipid Profile', report_date='2025-01-01',
+                                     report_file='reports/lipid.pdf',
+                                     parameters=[{'name': 'Cholesterol', 'value': ['250'], 'status': ['high']}])
+        url = reverse('medical-report-list-create', args=[patient.pk])
+
+        compact = self.client.get(url, {'page_size': 10}).json()['results'][0]
+        self.assertEqual(compact['report_type'], 'Lipid Profile')
+        self.assertNotIn('parameters', compact)
+        full = self.client.get(url, {'page_size': 10, 'compact': 0}).json()['results'][0]
+        self.assertEqual(full['parameters'][0]['value'], ['250'])
+        self.assertIn('parameters', self.client.get(url).json()[0])
+
+
+@mock.patch('health_summary.signals.schedule_regeneration')
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.patient = Patient.objects.create(name='Asha Rao', age=52, sex='F', mobile='5550101')
+        self.report = MedicalReport.objects.create(patient=self.patient, report_type='Lipid Profile',
+                                                   report_date='2025-01-01', report_file='reports/lipid.pdf')
+
+    def assertNotModifiedUntilSaved(self, url, instance):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        instance.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_patient_profile(self, _):
+        self.assertNotModifiedUntilSaved(reverse('patient-profile', args=[self.patient.pk]), self.patient)
+
+    def test_report_detail(self, _):
+        self.assertNotModifiedUntilSaved(reverse('medical-report-detail', args=[self.report.pk]), self.report)
+
+    def test_report_list_etag_changes_when_a_report_is_deleted(self, _):
+        url = reverse('medical-report-list-create', args=[self.patient.pk])
+        response = self.client.get(url)
+        # A delete does not move the newest updated_at, so the list offers no Last-Modified
+        self.assertFalse(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        MedicalReport.objects.create(patient=self.patient, report_type='Glucose',
+                                     report_date='2024-12-01', report_file='reports/glucose.pdf')
+        etag = self.client.get(url)['ETag']
+        # The newest report is kept, so only the count tells
+        self.report.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([report['report_type'] for report in response.json()], ['Glucose'])
+
+    def test_missing_patient_is_still_not_found(self, _):
+        self.assertEqual(self.client.get(reverse('patient-profile', args=[0])).status_code, 404)
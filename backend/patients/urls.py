@@ -1,12 +1,14 @@
 from django.urls import path
-from .views import PatientListCreateView, PatientDeleteView, MedicalReportListCreateView, MedicalReportDetailView, MedicalReportDeleteView, PatientChatAssistantView, PatientProfileView
+from .views import PatientListCreateView, PatientDeleteView, MedicalReportListCreateView, MedicalReportDetailView, MedicalReportDeleteView, PatientChatAssistantView, AsyncPatientChatAssistantView, PatientProfileView, ParameterHistoryView, ReportIngestionJobView
 
 urlpatterns = [
     path('', PatientListCreateView.as_view(), name='patient-list-create'),
     path('<int:pk>/', PatientDeleteView.as_view(), name='patient-delete'),
     path('<int:patient_id>/reports/', MedicalReportListCreateView.as_view(), name='medical-report-list-create'),
     path('<int:patient_id>/profile/', PatientProfileView.as_view(), name='patient-profile'),
+    path('<int:patient_id>/parameters/', ParameterHistoryView.as_view(), name='parameter-history'),
     path('chat_assistant/', PatientChatAssistantView.as_view(), name='patient-chat-assistant'),
+    path('chat_assistant/async/', AsyncPatientChatAssistantView.as_view(), name='patient-chat-assistant-async'),
 ]
 
 # Separate pattern for report detail
@@ -15,3 +17,7 @@ report_detail_patterns = [
     path('<int:pk>/delete/', MedicalReportDeleteView.as_view(), name='medical-report-delete'),
 ]
 
+# Status polling for queued report uploads
+job_patterns = [
+    path('<uuid:job_id>/', ReportIngestionJobView.as_view(), name='report-ingestion-job'),
+]
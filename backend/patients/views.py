@@ -2,27 +2,57 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework import status
-from .models import Patient, MedicalReport
-from .serializers import PatientSerializer, MedicalReportSerializer
-from .report_utils import process_pdf_report, enhance_medical_data
-from django.utils.dateparse import parse_date
-from datetime import datetime
+from .models import Patient, MedicalReport, ParameterObservation, ReportIngestionJob
+from .serializers import PatientSerializer, MedicalReportSerializer, ParameterObservationSerializer, ReportIngestionJobSerializer
+from .jobs import enqueue_report_upload
 import os
 from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.dateparse import parse_date
 from rest_framework.generics import RetrieveAPIView
 from backend.pinecone_client import upsert_chunks, chunk_text, delete_patient_chunks, delete_report_chunks
 import shutil
-from .chat_utils import get_patient_reports, patient_specific_query
+from .chat_utils import patient_specific_prompt, patient_specific_query, stream_patient_specific_query
+from .context import build_query_context
+from . import chat_memory
+from .models import ChatSession
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from backend.async_views import AsyncAPIView
+from backend.conditional import conditional
+from backend.listing import list_response
+from backend.llm import LLMError, LLMUnavailable, MISTRAL_MODEL, acomplete, astream_completion
+from backend.streaming import STREAMING_RENDERER_CLASSES, async_event_stream_response, event_stream_response, wants_stream
+
+
+def _row_version(queryset):
+    row = queryset.values_list('pk', 'updated_at').first()
+    if row is None:
+        return None
+    return f"{row[0]}:{row[1].isoformat()}", row[1]
+
+
+def patient_version(request, patient_id):
+    return _row_version(Patient.objects.filter(pk=patient_id))
+
 
+def report_version(request, pk):
+    return _row_version(MedicalReport.objects.filter(pk=pk))
+
+
+def report_list_version(request, patient_id):
+    # A new or changed report moves the newest updated_at, a deleted one the count
+    found = MedicalReport.objects.filter(patient_id=patient_id).aggregate(count=Count('id'), latest=Max('updated_at'))
+    latest = found['latest'].isoformat() if found['latest'] else ''
+    return f"{found['count']}:{latest}", found['latest']
 
 
 class PatientListCreateView(APIView):
     parser_classes = (MultiPartParser, FormParser)
 
     def get(self, request):
-        patients = Patient.objects.all().order_by('-id')
-        serializer = PatientSerializer(patients, many=True)
-        return Response(serializer.data)
+        """All patients, newest first; see backend.listing for page_size, cursor, fields and compact"""
+        return list_response(self, request, Patient.objects.all(), PatientSerializer, '-id')
 
     def post(self, request):
         mobile = request.data.get('mobile')
@@ -30,97 +60,25 @@ class PatientListCreateView(APIView):
         if not mobile or not report:
             return Response({'error': 'Mobile and report are required.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Save the patient with temp data to get an ID
-        temp_patient = Patient(mobile=mobile, name='temp', age=0, sex='temp')
-        temp_patient.save()
-        temp_report_path = f"media/temp_{datetime.now().timestamp()}_{report.name}"
-        with open(temp_report_path, 'wb+') as destination:
-            for chunk in report.chunks():
-                destination.write(chunk)
-        report_data = process_pdf_report(temp_report_path)
-        # print(report_data)
-
-        # Extracted fields
-        name = report_data.get('patient_name')
-        age = report_data.get('age')
-        sex = report_data.get('sex')
-        report_type = report_data.get('report_type') or 'Unknown'
-        report_date = report_data.get('report_date')
-        parameters = report_data.get('parameters', [])
-        observations = report_data.get('observations', [])
-        advise = report_data.get('advise', [])
-        if not name or not age or not sex:
-            temp_patient.delete()
-            os.remove(temp_report_path)
-            return Response({'error': 'Could not extract all required fields from the report.'}, status=status.HTTP_400_BAD_REQUEST)
-        temp_patient.name = name
-        temp_patient.age = int(age[0]) if isinstance(age, list) else int(age)
-        temp_patient.sex = sex
-        temp_patient.save()
-        # Check for existing report of same type
-        existing_report = MedicalReport.objects.filter(patient=temp_patient, report_type=report_type).first()
-        from django.core.files import File
-        if existing_report:
-            # Merge logic
-            report_dates = existing_report.report_dates or [str(existing_report.report_date)]
-            if str(report_date) not in report_dates:
-                report_dates.append(str(report_date))
-            # Merge parameters by name
-            param_map = {p['name']: p for p in existing_report.parameters}
-            for new_param in parameters:
-                name = new_param['name']
-                if name in param_map:
-                    # Append value and status to lists
-                    if not isinstance(param_map[name]['value'], list):
-                        param_map[name]['value'] = [param_map[name]['value']]
-                    if not isinstance(param_map[name]['status'], list):
-                        param_map[name]['status'] = [param_map[name]['status']]
-                    param_map[name]['value'].append(new_param['value'])
-                    param_map[name]['status'].append(new_param['status'])
-                else:
-                    # New parameter
-                    param_map[name] = {
-                        **new_param,
-                        'value': [new_param['value']],
-                        'status': [new_param['status']]
-                    }
-            merged_params = list(param_map.values())
-            # Update existing report
-            existing_report.report_dates = report_dates
-            existing_report.parameters = merged_params
-            existing_report.observations = observations
-            existing_report.advise = advise
-            existing_report.save()
-            # Save new file as latest
-            with open(temp_report_path, 'rb') as f:
-                existing_report.report_file.save(report.name, File(f, name=report.name), save=True)
-            os.remove(temp_report_path)
-            serializer = PatientSerializer(temp_patient)
-            return Response({'message': 'Patient added successfully! (merged report)', 'patient': serializer.data}, status=status.HTTP_201_CREATED)
-        else:
-            # Save the report as a MedicalReport
-            with open(temp_report_path, 'rb') as f:
-                medical_report = MedicalReport.objects.create(
-                    patient=temp_patient,
-                    report_file=File(f, name=report.name),
-                    report_type=report_type,
-                    report_date=parse_date(report_date) if report_date else datetime.now().date(),
-                    report_dates=[str(report_date)] if report_date else [],
-                    parameters=[{**p, 'value': [p['value']], 'status': [p['status']]} for p in parameters],
-                    observations=observations,
-                    advise=advise
-                )
-            os.remove(temp_report_path)
-            serializer = PatientSerializer(temp_patient)
-            return Response({'message': 'Patient added successfully!', 'patient': serializer.data}, status=status.HTTP_201_CREATED)
+        # The patient is created by the worker once the report has been read
+        job, duplicate = enqueue_report_upload(report, mobile=mobile)
+        if duplicate is not None:
+            serializer = PatientSerializer(duplicate.report.patient)
+            return Response({'message': 'This report has already been processed.', 'duplicate': True,
+                             'patient': serializer.data, 'extraction': duplicate.extraction})
+        serializer = ReportIngestionJobSerializer(job)
+        return Response({'message': 'Report queued for processing.', 'job': serializer.data},
+                        status=status.HTTP_202_ACCEPTED)
 
 class MedicalReportListCreateView(APIView):
     parser_classes = (MultiPartParser, FormParser)
 
+    @conditional(report_list_version, last_modified=False)
     def get(self, request, patient_id):
-        reports = MedicalReport.objects.filter(patient_id=patient_id).order_by('-created_at')
-        serializer = MedicalReportSerializer(reports, many=True, context={'request': request})
-        return Response(serializer.data)
+        """The patient's reports, newest first; see backend.listing for page_size, cursor, fields and compact"""
+        reports = MedicalReport.objects.filter(patient_id=patient_id)
+        return list_response(self, request, reports, MedicalReportSerializer, '-created_at',
+                             context={'request': request})
 
     def post(self, request, patient_id):
         report = request.FILES.get('report')
@@ -130,71 +88,14 @@ class MedicalReportListCreateView(APIView):
             patient = Patient.objects.get(pk=patient_id)
         except Patient.DoesNotExist:
             return Response({'error': 'Patient not found.'}, status=status.HTTP_404_NOT_FOUND)
-        temp_report_path = f"media/temp_{datetime.now().timestamp()}_{report.name}"
-        with open(temp_report_path, 'wb+') as destination:
-            for chunk in report.chunks():
-                destination.write(chunk)
-        report_data = process_pdf_report(temp_report_path)
-        report_type = report_data.get('report_type') or 'Unknown'
-        report_date = report_data.get('report_date')
-        parameters = report_data.get('parameters', [])
-        observations = report_data.get('observations', [])
-        advise = report_data.get('advise', [])
-        from django.core.files import File
-        # Check for existing report of same type
-        existing_report = MedicalReport.objects.filter(patient=patient, report_type=report_type).first()
-        if existing_report:
-            # Merge logic
-            report_dates = existing_report.report_dates or [str(existing_report.report_date)]
-            if str(report_date) not in report_dates:
-                report_dates.append(str(report_date))
-            # Merge parameters by name
-            param_map = {p['name']: p for p in existing_report.parameters}
-            for new_param in parameters:
-                name = new_param['name']
-                if name in param_map:
-                    # Append value and status to lists
-                    if not isinstance(param_map[name]['value'], list):
-                        param_map[name]['value'] = [param_map[name]['value']]
-                    if not isinstance(param_map[name]['status'], list):
-                        param_map[name]['status'] = [param_map[name]['status']]
-                    param_map[name]['value'].append(new_param['value'])
-                    param_map[name]['status'].append(new_param['status'])
-                else:
-                    # New parameter
-                    param_map[name] = {
-                        **new_param,
-                        'value': [new_param['value']],
-                        'status': [new_param['status']]
-                    }
-            merged_params = list(param_map.values())
-            # Update existing report
-            existing_report.report_dates = report_dates
-            existing_report.parameters = merged_params
-            existing_report.observations = observations
-            existing_report.advise = advise
-            existing_report.save()
-            # Save new file as latest
-            with open(temp_report_path, 'rb') as f:
-                existing_report.report_file.save(report.name, File(f, name=report.name), save=True)
-            os.remove(temp_report_path)
-            serializer = MedicalReportSerializer(existing_report, context={'request': request})
-            return Response({'message': 'Report uploaded successfully! (merged report)', 'report': serializer.data}, status=status.HTTP_201_CREATED)
-        else:
-            with open(temp_report_path, 'rb') as f:
-                medical_report = MedicalReport.objects.create(
-                    patient=patient,
-                    report_file=File(f, name=report.name),
-                    report_type=report_type,
-                    report_date=parse_date(report_date) if report_date else datetime.now().date(),
-                    report_dates=[str(report_date)] if report_date else [],
-                    parameters=[{**p, 'value': [p['value']], 'status': [p['status']]} for p in parameters],
-                    observations=observations,
-                    advise=advise
-                )
-            os.remove(temp_report_path)
-            serializer = MedicalReportSerializer(medical_report, context={'request': request})
-            return Response({'message': 'Report uploaded successfully!', 'report': serializer.data}, status=status.HTTP_201_CREATED)
+        job, duplicate = enqueue_report_upload(report, patient=patient)
+        if duplicate is not None:
+            serializer = MedicalReportSerializer(duplicate.report, context={'request': request})
+            return Response({'message': 'This report has already been processed.', 'duplicate': True,
+                             'report': serializer.data, 'extraction': duplicate.extraction})
+        serializer = ReportIngestionJobSerializer(job)
+        return Response({'message': 'Report queued for processing.', 'job': serializer.data},
+                        status=status.HTTP_202_ACCEPTED)
 
 class PatientDeleteView(APIView):
     def delete(self, request, pk):
@@ -223,6 +124,10 @@ class MedicalReportDetailView(RetrieveAPIView):
     queryset = MedicalReport.objects.all()
     serializer_class = MedicalReportSerializer
 
+    @conditional(report_version)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 class MedicalReportDeleteView(APIView):
     def delete(self, request, pk):
         try:
@@ -242,27 +147,84 @@ class MedicalReportDeleteView(APIView):
             return Response({'error': 'Report not found.'}, status=status.HTTP_404_NOT_FOUND)
 
 class PatientChatAssistantView(APIView):
+    renderer_classes = STREAMING_RENDERER_CLASSES
+
     def post(self, request):
         patient_id = request.data.get('patient_id')
         query = request.data.get('query')
+        session_id = request.data.get('session_id')
         if not patient_id or not query:
             return Response({'error': 'Both patient_id and query are required.'}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            # Get patient name from id
             patient = Patient.objects.get(pk=patient_id)
-            report_text = get_patient_reports(patient.name)
-            if not report_text.strip():
+            # Without a session_id the question starts a new conversation
+            session = chat_memory.get_session(patient.pk, session_id) if session_id else None
+            context = build_query_context(patient.pk, query)
+            if not context['text'].strip():
                 return Response({'answer': 'No reports found for this patient.'})
-            answer = patient_specific_query(report_text, query)
-            return Response({'answer': answer})
+            context_stats = {key: value for key, value in context.items() if key != 'text'}
+            history = chat_memory.get_history(session)
+            if wants_stream(request):
+                return event_stream_response(
+                    request,
+                    chat_memory.record_stream(
+                        patient.pk, session, query, stream_patient_specific_query(context['text'], query, history)
+                    ),
+                    extra={'context': context_stats},
+                )
+            answer, session = chat_memory.ask(
+                'patient_chat', patient.pk, session, query, history, context['text'],
+                lambda: patient_specific_query(context['text'], query, history),
+            )
+            return Response({'answer': answer, 'session_id': session.session_id, 'context': context_stats})
         except Patient.DoesNotExist:
             return Response({'error': 'Patient not found.'}, status=status.HTTP_404_NOT_FOUND)
+        except ChatSession.DoesNotExist:
+            return Response({'error': 'Chat session not found.'}, status=status.HTTP_404_NOT_FOUND)
+        except LLMUnavailable as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except LLMError as e:
+            return Response({'error': str(e)}, status=status.HTTP_502_BAD_GATEWAY)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class AsyncPatientChatAssistantView(AsyncAPIView):
+    async def post(self, request):
+        patient_id = request.data.get('patient_id')
+        query = request.data.get('query')
+        session_id = request.data.get('session_id')
+        if not patient_id or not query:
+            return JsonResponse({'error': 'Both patient_id and query are required.'}, status=400)
+        patient = await Patient.objects.filter(pk=patient_id).afirst()
+        if patient is None:
+            return JsonResponse({'error': 'Patient not found.'}, status=404)
+        session = None
+        if session_id:
+            try:
+                session = await sync_to_async(chat_memory.get_session)(patient.pk, session_id)
+            except ChatSession.DoesNotExist:
+                return JsonResponse({'error': 'Chat session not found.'}, status=404)
+        context = await sync_to_async(build_query_context)(patient.pk, query)
+        if not context['text'].strip():
+            return JsonResponse({'answer': 'No reports found for this patient.'})
+        context_stats = {key: value for key, value in context.items() if key != 'text'}
+        history = await sync_to_async(chat_memory.get_history)(session)
+        prompt = patient_specific_prompt(context['text'], query, history)
+        if wants_stream(request):
+            return async_event_stream_response(
+                chat_memory.arecord_stream(patient.pk, session, query, astream_completion(MISTRAL_MODEL, prompt)),
+                extra={'context': context_stats},
+            )
+        answer, session = await chat_memory.aask(
+            'patient_chat', patient.pk, session, query, history, context['text'],
+            lambda: acomplete(MISTRAL_MODEL, prompt),
+        )
+        return JsonResponse({'answer': answer, 'session_id': str(session.session_id), 'context': context_stats})
+
 class PatientProfileView(APIView):
     parser_classes = (MultiPartParser, FormParser)
     
+    @conditional(patient_version)
     def get(self, request, patient_id):
         """Get patient profile information"""
         try:
@@ -311,4 +273,40 @@ class PatientProfileView(APIView):
         except Patient.DoesNotExist:
             return Response({'error': 'Patient not found.'}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+class ReportIngestionJobView(APIView):
+    def get(self, request, job_id):
+        """Poll the stage, timings and outcome of a queued report upload"""
+        try:
+            job = ReportIngestionJob.objects.get(job_id=job_id)
+        except ReportIngestionJob.DoesNotExist:
+            return Response({'error': 'Job not found.'}, status=status.HTTP_404_NOT_FOUND)
+        serializer = ReportIngestionJobSerializer(job)
+        return Response(serializer.data)
+
+class ParameterHistoryView(APIView):
+    def get(self, request, patient_id):
+        """
+        A patient's lab readings, oldest first. Optional filters: name (the
+        parameter), status, and since/until dates (YYYY-MM-DD, inclusive).
+        """
+        if not Patient.objects.filter(pk=patient_id).exists():
+            return Response({'error': 'Patient not found.'}, status=status.HTTP_404_NOT_FOUND)
+        observations = ParameterObservation.objects.filter(patient_id=patient_id)
+        if request.query_params.get('name'):
+            observations = observations.filter(name=request.query_params['name'])
+        if request.query_params.get('status'):
+            observations = observations.filter(status=request.query_params['status'].lower())
+        for param, lookup in (('since', 'observed_on__gte'), ('until', 'observed_on__lte')):
+            if request.query_params.get(param):
+                try:
+                    date = parse_date(request.query_params[param])
+                except ValueError:
+                    date = None
+                if date is None:
+                    return Response({'error': f'{param} must be a date (YYYY-MM-DD).'}, status=status.HTTP_400_BAD_REQUEST)
+                observations = observations.filter(**{lookup: date})
+        observations = observations.order_by('name', 'observed_on', 'position', 'id')
+        serializer = ParameterObservationSerializer(observations, many=True)
+        return Response(serializer.data)